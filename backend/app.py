@@ -3,11 +3,12 @@ Flask Backend API for ChainLearn - Blockchain Certificate Management System
 MongoDB Version
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, send_file
 from flask_cors import CORS
 from datetime import datetime
 from bson import ObjectId
 from bson.errors import InvalidId
+from pymongo.errors import ConnectionFailure
 import os
 
 # Initialize Flask app
@@ -17,15 +18,104 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
 # Enable CORS for Next.js frontend
-CORS(app, resources={r"/api/*": {"origins": ["http://localhost:3000", "http://127.0.0.1:3000"]}})
+CORS_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
+CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}})
 
 # Initialize MongoDB
-from database import init_db, get_db, close_db
+from database import init_db, get_db, close_db, add_event_listener
 from models import COLLECTIONS, serialize_doc, serialize_list
-from blockchain_utils import generate_certificate_hash, submit_to_blockchain, verify_certificate_hash, get_blockchain_stats
+from blockchain_utils import (generate_certificate_hash, submit_to_blockchain, verify_certificate_hash, get_blockchain_stats,
+                              get_all_certificates_from_blockchain, verify_from_ledger_file, verify_hash_from_ledger_file)
+from ledger_partitions import PartitionClosed
+from bloom_filter import certificate_filter
+from singleflight import lookups
+from http_cache import conditional, bumps_versions, bump_versions, compress_response
+from entity_cache import user_cache, course_cache
+from certificate_snapshots import build_snapshot, resolve_names, resolve_names_many, propagate_course_rename
+from search_index import certificate_search, search_database, SEARCH_MAX_PER_PAGE
+from grade_import import import_grades, detect_format, FORMATS as IMPORT_FORMATS
+from idempotency import idempotent, idempotency_store
+from storage_format import pack_hash, pack_ref, hash_query, ref_query
+import schemas
+from schemas import load, present
+from dashboard import dashboard_cache, DASHBOARD_COLLECTIONS, ROLES as DASHBOARD_ROLES
+import verification_bundle
+import rate_limit
+from rate_limit import rate_limited, rate_limiter
+import tenancy
+import circuit_breaker
+from circuit_breaker import breaker, last_known_good, degraded_read, degraded_response
+import profiling
+import metrics
+
+# jsonify() encodes with msgspec (schemas.py); the profiling provider below extends it
+app.json = schemas.JSONProvider(app)
+
+# Per-request query counting and Server-Timing headers
+if profiling.REQUEST_PROFILING:
+    add_event_listener(profiling.CommandCounter())
+    app.json = profiling.TimedJSONProvider(app)
+    app.before_request(profiling.start_request)
+    app.after_request(profiling.finish_request)
+    app.teardown_request(profiling.abandon_request)
+
+# Request latency, in-flight requests and MongoDB pool checkout wait for /metrics
+add_event_listener(metrics.PoolCheckoutTimer())
+app.before_request(metrics.start_request)
+app.after_request(metrics.finish_request)
+app.teardown_request(metrics.teardown_request)
+
+# Bind each request to its tenant (X-Tenant-ID) before anything touches the database or caches
+app.before_request(tenancy.enter_tenant)
+app.after_request(tenancy.vary_on_tenant)
+app.teardown_request(tenancy.exit_tenant)
+
+# Fail fast while MongoDB is unreachable: writes and most reads get 503 at once,
+# verification and detail reads are answered by their degraded_read fallbacks
+add_event_listener(circuit_breaker.CommandOutcomes())
+app.before_request(circuit_breaker.reject_when_open)
+app.register_error_handler(ConnectionFailure, circuit_breaker.handle_connection_failure)
+
+# Request bodies that do not match their schema get 400 before the view runs
+app.register_error_handler(schemas.InvalidPayload, schemas.invalid_payload)
+
+# Per-worker concurrency cap; registered after the metrics hooks so shed requests are still recorded
+app.before_request(rate_limit.admit_request)
+app.teardown_request(rate_limit.release_request)
+metrics.register_cache('users', user_cache.stats)
+metrics.register_cache('courses', course_cache.stats)
+metrics.register_cache('verification_filter', certificate_filter.stats)
+metrics.register_cache('singleflight', lookups.stats)
+metrics.register_cache('search_index', certificate_search.stats)
+metrics.register_cache('idempotency', idempotency_store.stats)
+metrics.register_cache('dashboard', dashboard_cache.stats)
+metrics.register_cache('rate_limiter', rate_limiter.stats)
+metrics.register_cache('admission', rate_limit.admission.stats)
+metrics.register_cache('circuit_breaker', breaker.stats)
+metrics.register_cache('last_known_good', last_known_good.stats)
+if tenancy.tenancy_enabled():
+    metrics.register_cache('tenant_admission', rate_limit.tenant_admission.stats)
+
+def build_startup_indexes():
+    """Build the verification filter and search index of the current tenant"""
+    label = f" ({tenancy.current_tenant.get()})" if tenancy.current_tenant.get() else ''
+    try:
+        if certificate_filter.build():
+            stats = certificate_filter.instance().stats()
+            print(f"[OK] Verification filter built{label}: {stats['items']} items, "
+                  f"{stats['memory_bytes']} bytes, target FPR {stats['target_false_positive_rate']}")
+    except Exception as e:
+        print(f"[ERROR] Failed to build verification filter{label}: {e}")
+    try:
+        if certificate_search.build():
+            stats = certificate_search.instance().stats()
+            print(f"[OK] Search index built{label}: {stats['documents']} certificates, {stats['terms']} terms")
+    except Exception as e:
+        print(f"[ERROR] Failed to build search index{label}: {e}")
 
 # Initialize database on startup
-init_db()
+if init_db():
+    tenancy.for_each_tenant(build_startup_indexes)
 
 # Helper functions
 def get_collection(name):
@@ -43,26 +133,22 @@ def to_object_id(id_str):
 # ==================== Authentication Routes ====================
 
 @app.route('/api/auth/login', methods=['POST'])
+@rate_limited('login')
 def login():
     """User login endpoint"""
-    data = request.json
-    email = data.get('email')
-    password = data.get('password')
-    
-    if not email or not password:
-        return jsonify({'error': 'Email and password are required'}), 400
+    data = load(schemas.LoginRequest)
     
     users_collection = get_collection('users')
     
     # Find user by email
-    user = users_collection.find_one({'email': email})
+    user = users_collection.find_one({'email': data.email})
     
     if not user:
         return jsonify({'error': 'Invalid email or password'}), 401
     
     # Verify password (hash it and compare)
     import hashlib
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
+    password_hash = hashlib.sha256(data.password.encode()).hexdigest()
     
     if user['password_hash'] != password_hash:
         return jsonify({'error': 'Invalid email or password'}), 401
@@ -71,92 +157,88 @@ def login():
     
     return jsonify({
         'success': True,
-        'user': {
-            'id': user['id'],
-            'email': user['email'],
-            'name': user['name'],
-            'role': user['role']
-        },
+        'user': user_summary(user),
         'token': 'demo_token_' + user['id']  # In production, use JWT
     }), 200
 
 # ==================== User Routes ====================
 
 @app.route('/api/users', methods=['GET'])
+@conditional('users')
 def get_users():
     """Get all users"""
     users_collection = get_collection('users')
     users = list(users_collection.find())
     users = serialize_list(users)
-    return jsonify([{
-        'id': u['id'],
-        'email': u['email'],
-        'name': u['name'],
-        'role': u['role']
-    } for u in users]), 200
+    return jsonify([user_summary(u) for u in users]), 200
+
+def _degraded_user(user_id):
+    """User detail from the user cache while the database is unavailable"""
+    found, _ = user_cache.peek_many([user_id])
+    if not found:
+        return None
+    return degraded_response(user_summary(serialize_doc(found.popitem()[1])), 200, 'cache')
 
 @app.route('/api/users/<user_id>', methods=['GET'])
+@degraded_read(_degraded_user)
+@conditional('users')
 def get_user(user_id):
     """Get user by ID"""
-    users_collection = get_collection('users')
     user_id_obj = to_object_id(user_id)
     if not user_id_obj:
         return jsonify({'error': 'Invalid user ID'}), 400
     
-    user = users_collection.find_one({'_id': user_id_obj})
+    user = user_cache.get(user_id_obj)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    user = serialize_doc(user)
-    return jsonify({
-        'id': user['id'],
-        'email': user['email'],
-        'name': user['name'],
-        'role': user['role']
-    }), 200
+    return jsonify(user_summary(serialize_doc(user))), 200
+
+def user_summary(user):
+    """User detail response body (user already serialized)"""
+    return schemas.User(id=user['id'], email=user['email'], name=user['name'], role=user['role'])
 
 # ==================== Course Routes ====================
 
 @app.route('/api/courses', methods=['GET'])
+@conditional('courses', 'users')
 def get_courses():
     """Get all courses"""
     courses_collection = get_collection('courses')
-    users_collection = get_collection('users')
     
     courses = list(courses_collection.find())
+    instructors = user_cache.get_many(
+        course['instructor_id'] for course in courses if course.get('instructor_id')
+    )
     courses_data = []
     
     for course in courses:
         course = serialize_doc(course)
-        instructor = None
-        if course.get('instructor_id'):
-            instructor_id_obj = to_object_id(course['instructor_id'])
-            if instructor_id_obj:
-                instructor = users_collection.find_one({'_id': instructor_id_obj})
-                instructor = serialize_doc(instructor) if instructor else None
+        instructor = instructors.get(course.get('instructor_id'))
         
-        courses_data.append({
-            'id': course['id'],
-            'name': course['name'],
-            'description': course.get('description', ''),
-            'instructor_id': course.get('instructor_id'),
-            'instructor_name': instructor['name'] if instructor else None,
-            'created_at': course.get('created_at'),
-            'student_count': 0  # Can be calculated from grades/certificates
-        })
+        courses_data.append(schemas.CourseListing(
+            id=course['id'],
+            name=course['name'],
+            description=course.get('description', ''),
+            instructor_id=course.get('instructor_id'),
+            instructor_name=instructor['name'] if instructor else None,
+            created_at=course.get('created_at'),
+            student_count=0  # Can be calculated from grades/certificates
+        ))
     
     return jsonify(courses_data), 200
 
 @app.route('/api/courses', methods=['POST'])
+@bumps_versions('courses')
 def create_course():
     """Create a new course"""
-    data = request.json
+    data = load(schemas.CourseRequest)
     courses_collection = get_collection('courses')
     
     course_data = {
-        'name': data.get('name'),
-        'description': data.get('description', ''),
-        'instructor_id': data.get('instructor_id'),
+        'name': data.name,
+        'description': data.description,
+        'instructor_id': pack_ref(data.instructor_id),
         'created_at': datetime.utcnow()
     }
     
@@ -164,44 +246,59 @@ def create_course():
     course_data['_id'] = result.inserted_id
     course = serialize_doc(course_data)
     
-    return jsonify({
-        'id': course['id'],
-        'name': course['name'],
-        'description': course.get('description', ''),
-        'instructor_id': course.get('instructor_id')
-    }), 201
+    return jsonify(course_summary(course)), 201
+
+def course_summary(course):
+    """Course response body for writes (course already serialized)"""
+    return schemas.Course(
+        id=course['id'],
+        name=course['name'],
+        description=course.get('description', ''),
+        instructor_id=course.get('instructor_id')
+    )
+
+def _degraded_course(course_id):
+    """Course detail from the entity caches while the database is unavailable"""
+    found, _ = course_cache.peek_many([course_id])
+    if not found:
+        return None
+    course = serialize_doc(found.popitem()[1])
+    instructors, _ = user_cache.peek_many([course['instructor_id']] if course.get('instructor_id') else [])
+    instructor = instructors.get(course.get('instructor_id'))
+    return degraded_response(course_detail(course, instructor), 200, 'cache')
 
 @app.route('/api/courses/<course_id>', methods=['GET'])
+@degraded_read(_degraded_course)
+@conditional('courses', 'users')
 def get_course(course_id):
     """Get course by ID"""
-    courses_collection = get_collection('courses')
-    users_collection = get_collection('users')
-    
     course_id_obj = to_object_id(course_id)
     if not course_id_obj:
         return jsonify({'error': 'Invalid course ID'}), 400
     
-    course = courses_collection.find_one({'_id': course_id_obj})
+    course = course_cache.get(course_id_obj)
     if not course:
         return jsonify({'error': 'Course not found'}), 404
     
     course = serialize_doc(course)
     instructor = None
     if course.get('instructor_id'):
-        instructor_id_obj = to_object_id(course['instructor_id'])
-        if instructor_id_obj:
-            instructor = users_collection.find_one({'_id': instructor_id_obj})
-            instructor = serialize_doc(instructor) if instructor else None
-    
-    return jsonify({
-        'id': course['id'],
-        'name': course['name'],
-        'description': course.get('description', ''),
-        'instructor_id': course.get('instructor_id'),
-        'instructor_name': instructor['name'] if instructor else None
-    }), 200
+        instructor = user_cache.get(course['instructor_id'])
+    
+    return jsonify(course_detail(course, instructor)), 200
+
+def course_detail(course, instructor):
+    """Course detail response body (course already serialized)"""
+    return schemas.CourseDetail(
+        id=course['id'],
+        name=course['name'],
+        description=course.get('description', ''),
+        instructor_id=course.get('instructor_id'),
+        instructor_name=instructor['name'] if instructor else None
+    )
 
 @app.route('/api/courses/<course_id>', methods=['PUT'])
+@bumps_versions('courses')
 def update_course(course_id):
     """Update course"""
     courses_collection = get_collection('courses')
@@ -213,28 +310,24 @@ def update_course(course_id):
     if not course:
         return jsonify({'error': 'Course not found'}), 404
     
-    data = request.json
-    update_data = {}
-    
-    if 'name' in data:
-        update_data['name'] = data['name']
-    if 'description' in data:
-        update_data['description'] = data.get('description', '')
-    if 'instructor_id' in data:
-        update_data['instructor_id'] = data['instructor_id']
-    
-    courses_collection.update_one({'_id': course_id_obj}, {'$set': update_data})
+    update_data = present(load(schemas.CourseUpdate))
+    if 'instructor_id' in update_data:
+        update_data['instructor_id'] = pack_ref(update_data['instructor_id'])
+    
+    if update_data:
+        courses_collection.update_one({'_id': course_id_obj}, {'$set': update_data})
+    course_cache.invalidate(course_id_obj)
+    if 'name' in update_data and update_data['name'] != course.get('name'):
+        if propagate_course_rename(course_id_obj, update_data['name']):
+            bump_versions('certificates')
+            certificate_search.reindex({'course_id': ref_query(course_id_obj)})
     course = courses_collection.find_one({'_id': course_id_obj})
     course = serialize_doc(course)
     
-    return jsonify({
-        'id': course['id'],
-        'name': course['name'],
-        'description': course.get('description', ''),
-        'instructor_id': course.get('instructor_id')
-    }), 200
+    return jsonify(course_summary(course)), 200
 
 @app.route('/api/courses/<course_id>', methods=['DELETE'])
+@bumps_versions('courses')
 def delete_course(course_id):
     """Delete course"""
     courses_collection = get_collection('courses')
@@ -243,6 +336,7 @@ def delete_course(course_id):
         return jsonify({'error': 'Invalid course ID'}), 400
     
     result = courses_collection.delete_one({'_id': course_id_obj})
+    course_cache.invalidate(course_id_obj)
     if result.deleted_count == 0:
         return jsonify({'error': 'Course not found'}), 404
     
@@ -251,11 +345,10 @@ def delete_course(course_id):
 # ==================== Certificate Routes ====================
 
 @app.route('/api/certificates', methods=['GET'])
+@conditional('certificates', 'users', 'courses')
 def get_certificates():
     """Get all certificates"""
     certificates_collection = get_collection('certificates')
-    users_collection = get_collection('users')
-    courses_collection = get_collection('courses')
     
     query = {}
     course_id = request.args.get('course_id')
@@ -264,69 +357,78 @@ def get_certificates():
     if course_id:
         course_id_obj = to_object_id(course_id)
         if course_id_obj:
-            query['course_id'] = str(course_id_obj)
+            query['course_id'] = ref_query(course_id_obj)
     
     if student_id:
         student_id_obj = to_object_id(student_id)
         if student_id_obj:
-            query['student_id'] = str(student_id_obj)
+            query['student_id'] = ref_query(student_id_obj)
     
     certificates = list(certificates_collection.find(query))
     certificates_data = []
     
-    for cert in certificates:
-        cert = serialize_doc(cert)
-        
-        student = None
-        if cert.get('student_id'):
-            student_id_obj = to_object_id(cert['student_id'])
-            if student_id_obj:
-                student = users_collection.find_one({'_id': student_id_obj})
-                student = serialize_doc(student) if student else None
-        
-        course = None
-        if cert.get('course_id'):
-            course_id_obj = to_object_id(cert['course_id'])
-            if course_id_obj:
-                course = courses_collection.find_one({'_id': course_id_obj})
-                course = serialize_doc(course) if course else None
-        
-        certificates_data.append({
-            'id': cert['id'],
-            'certificate_id': cert.get('certificate_id'),
-            'student_id': cert.get('student_id'),
-            'student_name': student['name'] if student else None,
-            'student_email': student['email'] if student else None,
-            'course_id': cert.get('course_id'),
-            'course_name': course['name'] if course else None,
-            'grade': cert.get('grade'),
-            'score': cert.get('score'),
-            'issue_date': cert.get('issue_date'),
-            'blockchain_hash': cert.get('blockchain_hash'),
-            'blockchain_block_number': cert.get('blockchain_block_number'),
-            'status': cert.get('status', 'pending'),
-            'instructor_name': cert.get('instructor_name')
-        })
+    for cert, names in zip(certificates, resolve_names_many(certificates)):
+        certificates_data.append(certificate_detail(serialize_doc(cert), names))
     
     return jsonify(certificates_data), 200
 
+@app.route('/api/certificates/search', methods=['GET'])
+@conditional('certificates', 'users', 'courses')
+def search_certificates():
+    """Search certificates by ID prefix, student name or email, or course name"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), SEARCH_MAX_PER_PAGE)
+    
+    matches = certificate_search.search(query)
+    if matches is None:
+        matches = search_database(query)
+    
+    # Only the requested page is read from MongoDB
+    page_ids = matches[(page - 1) * per_page:page * per_page]
+    found = {
+        cert['_id']: cert
+        for cert in get_collection('certificates').find({'_id': {'$in': page_ids}})
+    }
+    certificates = [found[cert_id] for cert_id in page_ids if cert_id in found]
+    names = resolve_names_many(certificates)
+    
+    return jsonify({
+        'results': [
+            certificate_detail(serialize_doc(cert), cert_names)
+            for cert, cert_names in zip(certificates, names)
+        ],
+        'total': len(matches),
+        'page': page,
+        'per_page': per_page
+    }), 200
+
 @app.route('/api/certificates', methods=['POST'])
+@rate_limited('issue')
+@idempotent
+@bumps_versions('certificates')
 def create_certificate():
     """Create/issue a new certificate"""
-    data = request.json
+    data = load(schemas.CertificateRequest)
     certificates_collection = get_collection('certificates')
     
     # Count existing certificates to generate ID
     count = certificates_collection.count_documents({})
-    cert_id = f"CERT-{datetime.now().year}-{str(count + 1).zfill(4)}-{data.get('course_name', 'COURSE').upper()[:5]}"
+    cert_id = f"CERT-{datetime.now().year}-{str(count + 1).zfill(4)}-{data.course_name.upper()[:5]}"
     
+    # Names are snapshotted at issuance so reads need no user/course lookups
+    student_id_obj = ObjectId(data.student_id)
+    course_id_obj = ObjectId(data.course_id)
     certificate_data = {
         'certificate_id': cert_id,
-        'student_id': str(to_object_id(data.get('student_id'))),
-        'course_id': str(to_object_id(data.get('course_id'))),
-        'grade': data.get('grade'),
-        'score': data.get('score'),
-        'instructor_name': data.get('instructor_name', 'Dr. Sarah Smith'),
+        'student_id': student_id_obj,
+        'course_id': course_id_obj,
+        **build_snapshot(user_cache.get(student_id_obj), course_cache.get(course_id_obj)),
+        'grade': data.grade,
+        'score': data.score,
+        'instructor_name': data.instructor_name,
         'issue_date': datetime.utcnow(),
         'status': 'issued',
         'created_at': datetime.utcnow()
@@ -334,25 +436,28 @@ def create_certificate():
     
     result = certificates_collection.insert_one(certificate_data)
     certificate_data['_id'] = result.inserted_id
+    certificate_filter.add(cert_id)
+    certificate_search.add(certificate_data)
+    metrics.certificates_issued.inc()
     cert = serialize_doc(certificate_data)
     
-    return jsonify({
-        'id': cert['id'],
-        'certificate_id': cert['certificate_id'],
-        'student_id': cert['student_id'],
-        'course_id': cert['course_id'],
-        'grade': cert['grade'],
-        'score': cert['score'],
-        'issue_date': cert['issue_date'],
-        'status': cert['status']
-    }), 201
+    return jsonify(schemas.IssuedCertificate(
+        id=cert['id'],
+        certificate_id=cert['certificate_id'],
+        student_id=cert['student_id'],
+        course_id=cert['course_id'],
+        grade=cert['grade'],
+        score=cert['score'],
+        issue_date=cert['issue_date'],
+        status=cert['status']
+    )), 201
 
 @app.route('/api/certificates/<cert_id>/verify', methods=['POST'])
+@rate_limited('issue')
+@idempotent
 def verify_certificate_blockchain(cert_id):
     """Verify certificate on blockchain"""
     certificates_collection = get_collection('certificates')
-    users_collection = get_collection('users')
-    courses_collection = get_collection('courses')
     
     cert_id_obj = to_object_id(cert_id)
     if not cert_id_obj:
@@ -365,41 +470,35 @@ def verify_certificate_blockchain(cert_id):
     certificate = serialize_doc(certificate)
     
     if not certificate.get('blockchain_hash'):
-        # Get student and course info
-        student = None
-        course = None
-        
-        if certificate.get('student_id'):
-            student_id_obj = to_object_id(certificate['student_id'])
-            if student_id_obj:
-                student = users_collection.find_one({'_id': student_id_obj})
-                student = serialize_doc(student) if student else None
-        
-        if certificate.get('course_id'):
-            course_id_obj = to_object_id(certificate['course_id'])
-            if course_id_obj:
-                course = courses_collection.find_one({'_id': course_id_obj})
-                course = serialize_doc(course) if course else None
+        # Get student and course info; the snapshot is frozen once anchored,
+        # so it always holds what was hashed
+        names = resolve_names(certificate)
         
         # Submit to blockchain
-        hash_result = submit_to_blockchain(
-            certificate_id=certificate['certificate_id'],
-            student_name=student['name'] if student else '',
-            course_name=course['name'] if course else '',
-            grade=certificate.get('grade', ''),
-            issue_date=certificate.get('issue_date', datetime.utcnow().isoformat()),
-            instructor_name=certificate.get('instructor_name', '')
-        )
+        try:
+            hash_result = submit_to_blockchain(
+                certificate_id=certificate['certificate_id'],
+                student_name=names['student_name'] or '',
+                course_name=names['course_name'] or '',
+                grade=certificate.get('grade', ''),
+                issue_date=certificate.get('issue_date', datetime.utcnow().isoformat()),
+                instructor_name=certificate.get('instructor_name', '')
+            )
+        except PartitionClosed as e:
+            return jsonify({'error': str(e)}), 409
+        certificate_filter.add(hash_result['hash'])
         
         # Update certificate
         certificates_collection.update_one(
             {'_id': cert_id_obj},
             {'$set': {
-                'blockchain_hash': hash_result['hash'],
+                **names,
+                'blockchain_hash': pack_hash(hash_result['hash']),
                 'blockchain_block_number': hash_result['block_number'],
                 'status': 'verified'
             }}
         )
+        bump_versions('certificates', 'blockchain_transactions')
         
         return jsonify({
             'success': True,
@@ -416,125 +515,166 @@ def verify_certificate_blockchain(cert_id):
     
     return jsonify(result), 200
 
+def degraded_verification_payload(cert_id, hash_value):
+    """
+    (payload, source) for verify-by-ID-or-hash while the database is unavailable:
+    the last answer given for the same request, else a positive match in the
+    local ledger file. Anything else would be an unconfirmed 'not found', so it
+    is None (and gets 503 instead).
+    """
+    payload = last_known_good.recall(('verify', cert_id, hash_value))
+    if payload is not None:
+        return payload, 'last-known-good'
+    if hash_value:
+        if cert_id:
+            payload = verify_from_ledger_file(cert_id, hash_value)
+        else:
+            payload = verify_hash_from_ledger_file(hash_value)
+        if payload is not None:
+            return payload, 'ledger-file'
+    return None
+
+def _degraded_verification():
+    """degraded_read fallback of POST /api/certificates/verify"""
+    data = load(schemas.VerifyRequest)
+    degraded = degraded_verification_payload(data.certificate_id, data.hash)
+    if degraded is None:
+        return None
+    count_verification(degraded[0], 200)
+    return degraded_response(degraded[0], 200, degraded[1])
+
 @app.route('/api/certificates/verify', methods=['POST'])
+@rate_limited('verify')
+@degraded_read(_degraded_verification)
 def verify_certificate_by_id():
     """Verify certificate by ID or hash"""
-    data = request.json
+    data = load(schemas.VerifyRequest)
+    cert_id = data.certificate_id
+    hash_value = data.hash
+    
+    # Concurrent requests for the same certificate share one set of queries
+    payload, status = lookups.do(
+        ('verify', cert_id, hash_value),
+        _lookup_certificate_verification, cert_id, hash_value
+    )
+    count_verification(payload, status)
+    if status == 200:
+        last_known_good.remember(('verify', cert_id, hash_value), payload)
+    return jsonify(payload), status
+
+def count_verification(payload, status):
+    """Record a verify-by-ID-or-hash outcome on /metrics"""
+    if status == 404:
+        metrics.verifications.inc(result='miss')
+    elif payload.get('isValid'):
+        metrics.verifications.inc(result='hit')
+    else:
+        metrics.verifications.inc(result='failure')
+
+CERTIFICATE_NOT_FOUND = {
+    'isValid': False,
+    'message': 'Certificate not found'
+}
+
+def _lookup_certificate_verification(cert_id, hash_value):
+    """Build the verify-by-ID-or-hash response; returns (payload, status)"""
     certificates_collection = get_collection('certificates')
-    users_collection = get_collection('users')
-    courses_collection = get_collection('courses')
-    
-    cert_id = data.get('certificate_id')
-    hash_value = data.get('hash')
     
-    if cert_id:
+    # Unknown IDs and hashes are rejected by the filter without a query
+    if cert_id and certificate_filter.might_contain(cert_id):
         certificate = certificates_collection.find_one({'certificate_id': cert_id})
         if certificate and certificate.get('blockchain_hash'):
             certificate = serialize_doc(certificate)
             result = verify_certificate_hash(cert_id, certificate['blockchain_hash'])
-            
-            # Get additional info
-            student = None
-            course = None
-            if certificate.get('student_id'):
-                student_id_obj = to_object_id(certificate['student_id'])
-                if student_id_obj:
-                    student = users_collection.find_one({'_id': student_id_obj})
-                    student = serialize_doc(student) if student else None
-            if certificate.get('course_id'):
-                course_id_obj = to_object_id(certificate['course_id'])
-                if course_id_obj:
-                    course = courses_collection.find_one({'_id': course_id_obj})
-                    course = serialize_doc(course) if course else None
-            
-            return jsonify({
+            return {
                 **result,
-                'certificate': {
-                    'certificate_id': certificate['certificate_id'],
-                    'student_name': student['name'] if student else None,
-                    'course_name': course['name'] if course else None,
-                    'issue_date': certificate.get('issue_date'),
-                    'grade': certificate.get('grade')
-                }
-            }), 200
+                'certificate': verified_certificate_summary(certificate, resolve_names(certificate))
+            }, 200
     
-    if hash_value:
-        certificate = certificates_collection.find_one({'blockchain_hash': hash_value})
+    if hash_value and certificate_filter.might_contain(hash_value):
+        certificate = certificates_collection.find_one({'blockchain_hash': hash_query(hash_value)})
         if certificate:
             certificate = serialize_doc(certificate)
             result = verify_certificate_hash(certificate['certificate_id'], hash_value)
-            return jsonify({
+            return {
                 **result,
-                'certificate': {
-                    'certificate_id': certificate['certificate_id'],
-                    'student_name': certificate.get('student_name'),
-                    'course_name': certificate.get('course_name'),
-                    'issue_date': certificate.get('issue_date'),
-                    'grade': certificate.get('grade')
-                }
-            }), 200
+                'certificate': verified_certificate_summary(certificate, resolve_names(certificate))
+            }, 200
     
-    return jsonify({
-        'isValid': False,
-        'message': 'Certificate not found'
-    }), 404
+    return CERTIFICATE_NOT_FOUND, 404
+
+def verified_certificate_summary(certificate, names):
+    """Certificate block of a verification response (certificate already serialized)"""
+    return {
+        'certificate_id': certificate['certificate_id'],
+        'student_name': names['student_name'],
+        'course_name': names['course_name'],
+        'issue_date': certificate.get('issue_date'),
+        'grade': certificate.get('grade')
+    }
+
+def _degraded_certificate(cert_id):
+    """Certificate detail as last served, while the database is unavailable"""
+    payload = last_known_good.recall(('certificate', to_object_id(cert_id)))
+    if payload is None:
+        return None
+    return degraded_response(payload, 200, 'last-known-good')
 
 @app.route('/api/certificates/<cert_id>', methods=['GET'])
+@rate_limited('verify')
+@degraded_read(_degraded_certificate)
+@conditional('certificates', 'users', 'courses')
 def get_certificate(cert_id):
     """Get certificate by ID"""
-    certificates_collection = get_collection('certificates')
-    users_collection = get_collection('users')
-    courses_collection = get_collection('courses')
-    
     cert_id_obj = to_object_id(cert_id)
     if not cert_id_obj:
         return jsonify({'error': 'Invalid certificate ID'}), 400
     
+    payload, status = lookups.do(
+        ('certificate', cert_id_obj),
+        _load_certificate_detail, cert_id_obj
+    )
+    if status == 200:
+        last_known_good.remember(('certificate', cert_id_obj), payload)
+    return jsonify(payload), status
+
+def _load_certificate_detail(cert_id_obj):
+    """Build the certificate detail response; returns (payload, status)"""
+    certificates_collection = get_collection('certificates')
+    
     certificate = certificates_collection.find_one({'_id': cert_id_obj})
     if not certificate:
-        return jsonify({'error': 'Certificate not found'}), 404
+        return {'error': 'Certificate not found'}, 404
     
     certificate = serialize_doc(certificate)
-    
-    student = None
-    if certificate.get('student_id'):
-        student_id_obj = to_object_id(certificate['student_id'])
-        if student_id_obj:
-            student = users_collection.find_one({'_id': student_id_obj})
-            student = serialize_doc(student) if student else None
-    
-    course = None
-    if certificate.get('course_id'):
-        course_id_obj = to_object_id(certificate['course_id'])
-        if course_id_obj:
-            course = courses_collection.find_one({'_id': course_id_obj})
-            course = serialize_doc(course) if course else None
-    
-    return jsonify({
-        'id': certificate['id'],
-        'certificate_id': certificate.get('certificate_id'),
-        'student_id': certificate.get('student_id'),
-        'student_name': student['name'] if student else None,
-        'student_email': student['email'] if student else None,
-        'course_id': certificate.get('course_id'),
-        'course_name': course['name'] if course else None,
-        'grade': certificate.get('grade'),
-        'score': certificate.get('score'),
-        'issue_date': certificate.get('issue_date'),
-        'blockchain_hash': certificate.get('blockchain_hash'),
-        'blockchain_block_number': certificate.get('blockchain_block_number'),
-        'status': certificate.get('status', 'pending'),
-        'instructor_name': certificate.get('instructor_name')
-    }), 200
+    return certificate_detail(certificate, resolve_names(certificate)), 200
+
+def certificate_detail(certificate, names):
+    """Certificate detail response body (certificate already serialized)"""
+    return schemas.Certificate(
+        id=certificate['id'],
+        certificate_id=certificate.get('certificate_id'),
+        student_id=certificate.get('student_id'),
+        student_name=names['student_name'],
+        student_email=names['student_email'],
+        course_id=certificate.get('course_id'),
+        course_name=names['course_name'],
+        grade=certificate.get('grade'),
+        score=certificate.get('score'),
+        issue_date=certificate.get('issue_date'),
+        blockchain_hash=certificate.get('blockchain_hash'),
+        blockchain_block_number=certificate.get('blockchain_block_number'),
+        status=certificate.get('status', 'pending'),
+        instructor_name=certificate.get('instructor_name')
+    )
 
 # ==================== Grade Routes ====================
 
 @app.route('/api/grades', methods=['GET'])
+@conditional('grades', 'users', 'courses')
 def get_grades():
     """Get all grades"""
     grades_collection = get_collection('grades')
-    users_collection = get_collection('users')
-    courses_collection = get_collection('courses')
     
     query = {}
     course_id = request.args.get('course_id')
@@ -543,73 +683,59 @@ def get_grades():
     if course_id:
         course_id_obj = to_object_id(course_id)
         if course_id_obj:
-            query['course_id'] = str(course_id_obj)
+            query['course_id'] = ref_query(course_id_obj)
     
     if student_id:
         student_id_obj = to_object_id(student_id)
         if student_id_obj:
-            query['student_id'] = str(student_id_obj)
+            query['student_id'] = ref_query(student_id_obj)
     
     grades = list(grades_collection.find(query))
+    students = user_cache.get_many(grade.get('student_id') for grade in grades)
+    courses = course_cache.get_many(grade.get('course_id') for grade in grades)
     grades_data = []
     
     for grade in grades:
         grade = serialize_doc(grade)
+        student = students.get(grade.get('student_id'))
+        course = courses.get(grade.get('course_id'))
         
-        student = None
-        if grade.get('student_id'):
-            student_id_obj = to_object_id(grade['student_id'])
-            if student_id_obj:
-                student = users_collection.find_one({'_id': student_id_obj})
-                student = serialize_doc(student) if student else None
-        
-        course = None
-        if grade.get('course_id'):
-            course_id_obj = to_object_id(grade['course_id'])
-            if course_id_obj:
-                course = courses_collection.find_one({'_id': course_id_obj})
-                course = serialize_doc(course) if course else None
-        
-        grades_data.append({
-            'id': grade['id'],
-            'student_id': grade.get('student_id'),
-            'student_name': student['name'] if student else None,
-            'student_email': student['email'] if student else None,
-            'course_id': grade.get('course_id'),
-            'course_name': course['name'] if course else None,
-            'grade': grade.get('grade'),
-            'score': grade.get('score'),
-            'feedback': grade.get('feedback'),
-            'submission_date': grade.get('submission_date'),
-            'certificate_issued': grade.get('certificate_issued', False)
-        })
+        grades_data.append(schemas.GradeListing(
+            id=grade['id'],
+            student_id=grade.get('student_id'),
+            student_name=student['name'] if student else None,
+            student_email=student['email'] if student else None,
+            course_id=grade.get('course_id'),
+            course_name=course['name'] if course else None,
+            grade=grade.get('grade'),
+            score=grade.get('score'),
+            feedback=grade.get('feedback'),
+            submission_date=grade.get('submission_date'),
+            certificate_issued=grade.get('certificate_issued', False)
+        ))
     
     return jsonify(grades_data), 200
 
 @app.route('/api/grades', methods=['POST'])
+@bumps_versions('grades')
 def create_grade():
     """Create or update a grade"""
-    data = request.json
+    data = load(schemas.GradeRequest)
+    fields = present(data)
     grades_collection = get_collection('grades')
     
-    student_id_str = str(to_object_id(data.get('student_id')))
-    course_id_str = str(to_object_id(data.get('course_id')))
+    student_id_obj = ObjectId(data.student_id)
+    course_id_obj = ObjectId(data.course_id)
     
     # Check if grade already exists
     existing = grades_collection.find_one({
-        'student_id': student_id_str,
-        'course_id': course_id_str
+        'student_id': ref_query(student_id_obj),
+        'course_id': ref_query(course_id_obj)
     })
     
     if existing:
         # Update existing grade
-        update_data = {}
-        if 'grade' in data:
-            update_data['grade'] = data['grade']
-        if 'score' in data:
-            update_data['score'] = data['score']
-        if 'feedback' in data:
-            update_data['feedback'] = data.get('feedback', '')
+        update_data = {field: fields[field] for field in ('grade', 'score', 'feedback') if field in fields}
         update_data['certificate_issued'] = False
         update_data['updated_at'] = datetime.utcnow()
         
@@ -620,22 +746,15 @@ def create_grade():
         existing = grades_collection.find_one({'_id': existing['_id']})
         existing = serialize_doc(existing)
         
-        return jsonify({
-            'id': existing['id'],
-            'student_id': existing['student_id'],
-            'course_id': existing['course_id'],
-            'grade': existing.get('grade'),
-            'score': existing.get('score'),
-            'feedback': existing.get('feedback')
-        }), 200
+        return jsonify(grade_summary(existing)), 200
     
     # Create new grade
     grade_data = {
-        'student_id': student_id_str,
-        'course_id': course_id_str,
-        'grade': data.get('grade'),
-        'score': data.get('score'),
-        'feedback': data.get('feedback', ''),
+        'student_id': student_id_obj,
+        'course_id': course_id_obj,
+        'grade': fields.get('grade'),
+        'score': fields.get('score'),
+        'feedback': fields.get('feedback', ''),
         'submission_date': datetime.utcnow(),
         'certificate_issued': False,
         'created_at': datetime.utcnow(),
@@ -646,16 +765,44 @@ def create_grade():
     grade_data['_id'] = result.inserted_id
     grade = serialize_doc(grade_data)
     
-    return jsonify({
-        'id': grade['id'],
-        'student_id': grade['student_id'],
-        'course_id': grade['course_id'],
-        'grade': grade.get('grade'),
-        'score': grade.get('score'),
-        'feedback': grade.get('feedback')
-    }), 201
+    return jsonify(grade_summary(grade)), 201
+
+def grade_summary(grade, **extra):
+    """Grade response body for writes (grade already serialized)"""
+    return schemas.Grade(
+        id=grade['id'],
+        student_id=grade['student_id'],
+        course_id=grade['course_id'],
+        grade=grade.get('grade'),
+        score=grade.get('score'),
+        feedback=grade.get('feedback'),
+        **extra
+    )
+
+@app.route('/api/grades/import', methods=['POST'])
+def import_grades_file():
+    """Bulk import grades from a CSV or NDJSON upload (multipart 'file' field or raw body)"""
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, fmt = upload.stream, detect_format(upload.filename, upload.mimetype)
+    else:
+        stream, fmt = request.stream, detect_format(content_type=request.mimetype)
+    fmt = request.args.get('format') or fmt
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': 'Upload a .csv or .ndjson file, or pass format=csv or format=ndjson'}), 400
+
+    try:
+        report = import_grades(get_db(), stream, fmt, course_id=request.args.get('course_id'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Chunks before an aborted line are already written
+    if report['inserted'] or report['updated']:
+        bump_versions('grades')
+    return jsonify(report), 400 if report['aborted'] else 200
 
 @app.route('/api/grades/<grade_id>', methods=['PUT'])
+@bumps_versions('grades')
 def update_grade(grade_id):
     """Update grade"""
     grades_collection = get_collection('grades')
@@ -667,17 +814,8 @@ def update_grade(grade_id):
     if not grade:
         return jsonify({'error': 'Grade not found'}), 404
     
-    data = request.json
-    update_data = {'updated_at': datetime.utcnow()}
-    
-    if 'grade' in data:
-        update_data['grade'] = data['grade']
-    if 'score' in data:
-        update_data['score'] = data['score']
-    if 'feedback' in data:
-        update_data['feedback'] = data.get('feedback', '')
-    if 'certificate_issued' in data:
-        update_data['certificate_issued'] = data['certificate_issued']
+    update_data = present(load(schemas.GradeUpdate))
+    update_data['updated_at'] = datetime.utcnow()
     
     grades_collection.update_one(
         {'_id': grade_id_obj},
@@ -687,17 +825,10 @@ def update_grade(grade_id):
     grade = grades_collection.find_one({'_id': grade_id_obj})
     grade = serialize_doc(grade)
     
-    return jsonify({
-        'id': grade['id'],
-        'student_id': grade['student_id'],
-        'course_id': grade['course_id'],
-        'grade': grade.get('grade'),
-        'score': grade.get('score'),
-        'feedback': grade.get('feedback'),
-        'certificate_issued': grade.get('certificate_issued', False)
-    }), 200
+    return jsonify(grade_summary(grade, certificate_issued=grade.get('certificate_issued', False))), 200
 
 @app.route('/api/grades/<grade_id>', methods=['DELETE'])
+@bumps_versions('grades')
 def delete_grade(grade_id):
     """Delete grade (set to null)"""
     grades_collection = get_collection('grades')
@@ -721,70 +852,105 @@ def delete_grade(grade_id):
     
     return jsonify({'message': 'Grade cleared successfully'}), 200
 
+# ==================== Dashboard Routes ====================
+
+@app.route('/api/dashboard', methods=['GET'])
+@conditional(*DASHBOARD_COLLECTIONS)
+def get_dashboard():
+    """
+    Dashboard summary in one request: ?role=admin, or ?user_id=<id> for a
+    teacher's or student's own dashboard (the user's role decides which)
+    """
+    user_id = request.args.get('user_id')
+    role = request.args.get('role')
+    if user_id:
+        user = user_cache.get(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id, role = str(user['_id']), user['role']
+    elif role != 'admin':
+        return jsonify({'error': 'user_id is required for teacher and student dashboards'}), 400
+    if role not in DASHBOARD_ROLES:
+        return jsonify({'error': 'Invalid role'}), 400
+    
+    return jsonify(dashboard_cache.get(role, user_id if role != 'admin' else None)), 200
+
 # ==================== Blockchain Routes ====================
 
 @app.route('/api/blockchain/stats', methods=['GET'])
+@conditional('blockchain_transactions')
 def get_blockchain_statistics():
     """Get blockchain statistics"""
     stats = get_blockchain_stats()
     return jsonify(stats), 200
 
 @app.route('/api/blockchain/transactions', methods=['GET'])
+@conditional('blockchain_transactions')
 def get_blockchain_transactions():
-    """Get all blockchain transactions"""
-    transactions_collection = get_collection('blockchain_transactions')
-    transactions = list(transactions_collection.find())
-    transactions = serialize_list(transactions)
-    
-    return jsonify([{
-        'certificate_id': t.get('certificate_id'),
-        'hash': t.get('hash'),
-        'block_number': t.get('block_number'),
-        'timestamp': t.get('timestamp'),
-        'verified': t.get('verified', True)
-    } for t in transactions]), 200
+    """Get all blockchain transactions, archived years included"""
+    return jsonify(get_all_certificates_from_blockchain()), 200
+
+@app.route('/api/bundles', methods=['GET'])
+def get_verification_bundles():
+    """
+    Latest signed verification bundle; with ?since=<sequence>, the deltas that
+    bring a verifier holding that sequence up to date (null: fetch the snapshot)
+    """
+    snapshot = verification_bundle.latest_manifest()
+    if snapshot is None:
+        return jsonify({'error': 'No verification bundle has been published'}), 404
+    since = request.args.get('since', type=int)
+    return jsonify({
+        'public_key': verification_bundle.public_key_hex(),
+        'snapshot': snapshot,
+        'deltas': verification_bundle.delta_chain(since) if since is not None else None
+    }), 200
+
+@app.route('/api/bundles/<int:sequence>/<kind>', methods=['GET'])
+def get_verification_bundle_entries(sequence, kind):
+    """Entry file of a snapshot or delta; published files never change"""
+    if kind not in ('snapshot', 'delta'):
+        return jsonify({'error': 'Not found'}), 404
+    path = verification_bundle.bundle_path(kind, sequence, '.bin')
+    if not os.path.exists(path):
+        return jsonify({'error': 'Bundle not found'}), 404
+    response = send_file(path, mimetype='application/octet-stream', conditional=True, max_age=31536000)
+    response.cache_control.immutable = True
+    return response
 
 # ==================== Health Check ====================
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    # Test database connection
-    try:
-        db = get_db()
-        db.command('ping')
-        db_status = 'connected'
-    except Exception as e:
-        db_status = f'error: {str(e)}'
+    # Database status is cached briefly, and not probed at all while the circuit is open
+    db_status = breaker.health()
     
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if db_status == 'connected' else 'degraded',
         'message': 'ChainLearn API is running',
-        'database': db_status
+        'database': db_status,
+        'circuit': breaker.instance().stats(),
+        'verification_filter': certificate_filter.instance().stats()
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # ==================== Registration Route ====================
 
 @app.route('/api/auth/register', methods=['POST'])
+@bumps_versions('users')
 def register():
     """User registration endpoint"""
-    data = request.json
-    email = data.get('email')
-    password = data.get('password')
-    name = data.get('name')
-    role = data.get('role', 'student')  # Default to student
-    
-    # Validation
-    if not email or not password or not name:
-        return jsonify({'error': 'Email, password, and name are required'}), 400
-    
-    # Validate email format (basic)
-    if '@' not in email:
-        return jsonify({'error': 'Invalid email format'}), 400
-    
-    # Validate password length
-    if len(password) < 6:
-        return jsonify({'error': 'Password must be at least 6 characters'}), 400
+    # Required fields, email format and password length are checked by the schema
+    data = load(schemas.RegisterRequest)
+    email = data.email
+    password = data.password
+    name = data.name
+    role = data.role
     
     # Validate role
     if role not in ['admin', 'teacher', 'student']:
@@ -812,19 +978,20 @@ def register():
     
     result = users_collection.insert_one(user_data)
     user_data['_id'] = result.inserted_id
+    user_cache.invalidate(result.inserted_id)
     user = serialize_doc(user_data)
     
     return jsonify({
         'success': True,
         'message': 'Registration successful',
-        'user': {
-            'id': user['id'],
-            'email': user['email'],
-            'name': user['name'],
-            'role': user['role']
-        }
+        'user': user_summary(user)
     }), 201
 
+@app.after_request
+def compress_json_response(response):
+    """Negotiate gzip for large JSON bodies"""
+    return compress_response(response)
+
 # Cleanup on shutdown
 @app.teardown_appcontext
 def close_db_connection(error):
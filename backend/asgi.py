@@ -0,0 +1,453 @@
+"""
+ASGI Entry Point for ChainLearn - async serving mode
+Certificate verification and certificate detail run as coroutines on pymongo's
+AsyncMongoClient, so a request waiting on MongoDB does not hold a thread and one
+process can keep thousands of verifications in flight. Every other route is
+served by the Flask app on a bounded WSGI thread pool. While the circuit breaker
+is open, these routes are handed to Flask too, which serves their degraded reads.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import gzip
+import math
+import os
+import re
+import time
+from a2wsgi import WSGIMiddleware
+from bson import ObjectId
+from pymongo.errors import ConnectionFailure
+from werkzeug.http import http_date, parse_accept_header, parse_date
+import database
+import schemas
+from models import COLLECTIONS, serialize_doc
+from app import (
+    app, CORS_ORIGINS, CERTIFICATE_NOT_FOUND,
+    certificate_detail, verified_certificate_summary, count_verification,
+    degraded_verification_payload
+)
+from blockchain_utils import verify_from_ledger_file, verification_result
+from ledger_partitions import route_certificate, archived_transaction
+from bloom_filter import certificate_filter
+from circuit_breaker import breaker, last_known_good, DEGRADED_HEADER, UNAVAILABLE_MESSAGE
+from entity_cache import user_cache, course_cache
+from certificate_snapshots import build_snapshot, has_snapshot, snapshot_of
+from http_cache import version_stamps, is_not_modified, COMPRESS_MIN_SIZE, COMPRESS_LEVEL, GZIP_ETAG_SUFFIX
+from singleflight import AsyncSingleFlight
+from storage_format import hash_query
+from rate_limit import rate_limiter, AsyncAdmissionControl, API_KEY_HEADER, ADMISSION_QUEUE_TIMEOUT
+from tenancy import PerTenant, resolve_tenant, tenancy_enabled, TENANT_HEADER, TENANT_MAX_CONCURRENT_REQUESTS
+import metrics
+
+# Threads serving the synchronous Flask routes
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', '32'))
+
+# Seconds to keep serving the async routes through Flask after the async client failed to connect
+ASYNC_DB_RETRY_INTERVAL = float(os.environ.get('ASYNC_DB_RETRY_INTERVAL', '30'))
+
+# Collections the certificate detail response is built from (same as the Flask route)
+CERTIFICATE_DETAIL_COLLECTIONS = ('certificates', 'users', 'courses')
+
+# Event-loop counterpart of singleflight.lookups
+async_lookups = PerTenant(AsyncSingleFlight)
+metrics.register_cache('async_singleflight', async_lookups.stats)
+
+# Concurrency cap for the async routes (the Flask routes use rate_limit.admission)
+async_admission = AsyncAdmissionControl()
+metrics.register_cache('async_admission', async_admission.stats)
+
+# Each tenant's share of the async routes' cap (only with TENANTS set)
+async_tenant_admission = PerTenant(lambda: AsyncAdmissionControl(max_concurrent=TENANT_MAX_CONCURRENT_REQUESTS))
+if tenancy_enabled():
+    metrics.register_cache('async_tenant_admission', async_tenant_admission.stats)
+
+# ==================== Async Lookups ====================
+
+async def _might_contain(value):
+    """Async certificate_filter.might_contain: a miss waits for a catch-up scan, so it runs in a thread"""
+    if certificate_filter.matches(value):
+        return True
+    return await asyncio.to_thread(certificate_filter.might_contain, value)
+
+async def _get_entity(db, cache, entity_id):
+    """Async EntityCache.get: a cached copy, or one query on the async client"""
+    found, missing = cache.peek_many([entity_id])
+    if missing:
+        docs = await db[COLLECTIONS[cache.collection_name]].find({'_id': {'$in': missing}}).to_list(None)
+        found.update(cache.put_many(docs))
+    return next(iter(found.values()), None)
+
+async def _resolve_names(db, certificate):
+    """Async certificate_snapshots.resolve_names; both lookups run concurrently"""
+    if has_snapshot(certificate):
+        return snapshot_of(certificate)
+    student, course = await asyncio.gather(
+        _get_entity(db, user_cache, certificate.get('student_id')),
+        _get_entity(db, course_cache, certificate.get('course_id'))
+    )
+    return build_snapshot(student, course)
+
+def _local_verification(certificate_id, expected_hash):
+    """(result from the local ledger file or None, partitions to look in) for _verify_hash"""
+    result = verify_from_ledger_file(certificate_id, expected_hash)
+    return result, [] if result else route_certificate(certificate_id)
+
+async def _verify_hash(db, certificate_id, expected_hash):
+    """
+    Async verify_certificate_hash. The ledger and archive files are read with
+    blocking I/O and routing may reload the partition catalog (a synchronous
+    query every LEDGER_CATALOG_TTL), so those run in a thread; partition
+    collections are queried on the async client.
+    """
+    result, sources = await asyncio.to_thread(_local_verification, certificate_id, expected_hash)
+    if result:
+        return result
+    transaction = None
+    for kind, source in sources:
+        if kind == 'archive':
+            transaction = await asyncio.to_thread(archived_transaction, source, certificate_id)
+        else:
+            transaction = await db[source].find_one({'certificate_id': certificate_id})
+        if transaction:
+            break
+    return verification_result(transaction, expected_hash)
+
+async def _lookup_certificate_verification(db, cert_id, hash_value):
+    """
+    Async app._lookup_certificate_verification; returns (payload, status, queried),
+    queried being False when the Bloom filter answered without the database
+    """
+    certificates_collection = db[COLLECTIONS['certificates']]
+    queried = False
+
+    if cert_id and await _might_contain(cert_id):
+        certificate = await certificates_collection.find_one({'certificate_id': cert_id})
+        queried = True
+        if certificate and certificate.get('blockchain_hash'):
+            certificate = serialize_doc(certificate)
+            # The ledger check and the name lookups are independent
+            result, names = await asyncio.gather(
+                _verify_hash(db, cert_id, certificate['blockchain_hash']),
+                _resolve_names(db, certificate)
+            )
+            return {**result, 'certificate': verified_certificate_summary(certificate, names)}, 200, True
+
+    if hash_value and await _might_contain(hash_value):
+        certificate = await certificates_collection.find_one({'blockchain_hash': hash_query(hash_value)})
+        queried = True
+        if certificate:
+            certificate = serialize_doc(certificate)
+            result, names = await asyncio.gather(
+                _verify_hash(db, certificate['certificate_id'], hash_value),
+                _resolve_names(db, certificate)
+            )
+            return {**result, 'certificate': verified_certificate_summary(certificate, names)}, 200, True
+
+    return CERTIFICATE_NOT_FOUND, 404, queried
+
+async def _load_certificate_detail(db, cert_id_obj):
+    """Async app._load_certificate_detail; returns (payload, status)"""
+    certificate = await db[COLLECTIONS['certificates']].find_one({'_id': cert_id_obj})
+    if not certificate:
+        return {'error': 'Certificate not found'}, 404
+
+    certificate = serialize_doc(certificate)
+    return certificate_detail(certificate, await _resolve_names(db, certificate)), 200
+
+# ==================== Async Handlers ====================
+
+def _json_body(payload):
+    # Encoded exactly like jsonify(), so both modes produce byte-identical bodies
+    return app.json.response(payload).get_data()
+
+async def get_certificate(db, request_headers, scope, body, cert_id):
+    """GET /api/certificates/<cert_id>; returns (status, headers, body, queried)"""
+    full_path = f"{scope['path']}?{scope['query_string'].decode('latin-1')}"
+    # Version stamps are cached for VERSION_STAMP_TTL; the occasional re-read is a
+    # blocking query, so it runs off the event loop
+    etag, last_modified = await asyncio.to_thread(
+        version_stamps.etag, CERTIFICATE_DETAIL_COLLECTIONS, full_path
+    )
+    validators = [('ETag', f'"{etag}"'), ('Cache-Control', 'no-cache')]
+    if last_modified:
+        validators.append(('Last-Modified', http_date(last_modified)))
+
+    if is_not_modified(etag, last_modified, request_headers.get('if-none-match'),
+                       parse_date(request_headers.get('if-modified-since'))):
+        return 304, validators, b'', False
+
+    payload, status = await async_lookups.do(
+        ('certificate', cert_id), _load_certificate_detail, db, ObjectId(cert_id)
+    )
+    if status != 200:
+        return status, [('Content-Type', 'application/json')], _json_body(payload), True
+    last_known_good.remember(('certificate', ObjectId(cert_id)), payload)
+    return 200, [('Content-Type', 'application/json')] + validators, _json_body(payload), True
+
+async def verify_certificate(db, request_headers, scope, body):
+    """POST /api/certificates/verify; returns (status, headers, body, queried), or None to let Flask answer"""
+    if request_headers.get('content-type', '').split(';')[0].strip() != 'application/json':
+        return None
+    try:
+        data = schemas.decode(schemas.VerifyRequest, body)
+    except schemas.InvalidPayload:
+        return None
+    cert_id = data.certificate_id
+    hash_value = data.hash
+
+    payload, status, queried = await async_lookups.do(
+        ('verify', cert_id, hash_value), _lookup_certificate_verification, db, cert_id, hash_value
+    )
+    count_verification(payload, status)
+    if status == 200:
+        last_known_good.remember(('verify', cert_id, hash_value), payload)
+    return status, [('Content-Type', 'application/json')], _json_body(payload), queried
+
+# ==================== Degraded Handlers ====================
+# Answer a request whose handler lost the database, like the Flask degraded_read
+# fallbacks; they return (payload, source), or None for 503
+
+async def degraded_certificate(body, cert_id):
+    payload = last_known_good.recall(('certificate', ObjectId(cert_id)))
+    return None if payload is None else (payload, 'last-known-good')
+
+async def degraded_verification(body):
+    # The handler already decoded this body before it reached the database
+    data = schemas.decode(schemas.VerifyRequest, body)
+    # The ledger file is read with blocking I/O
+    degraded = await asyncio.to_thread(degraded_verification_payload, data.certificate_id, data.hash)
+    if degraded is not None:
+        count_verification(degraded[0], 200)
+    return degraded
+
+# (method, path pattern, route name for metrics, handler, rate limit budget or None,
+# degraded handler). Non-ObjectId certificate paths are left to Flask, which owns
+# their error responses.
+ROUTES = [
+    ('GET', re.compile(r'^/api/certificates/(?P<cert_id>[0-9a-fA-F]{24})$'),
+     '/api/certificates/<cert_id>', get_certificate, 'verify', degraded_certificate),
+    ('POST', re.compile(r'^/api/certificates/verify$'),
+     '/api/certificates/verify', verify_certificate, 'verify', degraded_verification),
+]
+
+# ==================== ASGI Application ====================
+
+def _compress(request_headers, status, headers, body):
+    """Mirror of http_cache.compress_response for the async handlers"""
+    if status != 200 or ('Content-Type', 'application/json') not in headers:
+        return headers, body
+    headers = headers + [('Vary', 'Accept-Encoding')]
+    if not parse_accept_header(request_headers.get('accept-encoding'))['gzip'] or len(body) < COMPRESS_MIN_SIZE:
+        return headers, body
+
+    body = gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+    headers = [
+        (name, value[:-1] + GZIP_ETAG_SUFFIX + '"' if name == 'ETag' else value)
+        for name, value in headers
+    ]
+    return headers + [('Content-Encoding', 'gzip')], body
+
+def _error_response(status, message, retry_after):
+    """429/503 with the same body and Retry-After as the Flask hooks"""
+    headers = [('Content-Type', 'application/json'), ('Retry-After', str(max(1, math.ceil(retry_after))))]
+    return status, headers, _json_body({'error': message})
+
+def _cors_headers(request_headers):
+    """Same headers Flask-CORS adds for an allowed origin"""
+    origin = request_headers.get('origin')
+    if origin in CORS_ORIGINS:
+        return [('Access-Control-Allow-Origin', origin), ('Vary', 'Origin')]
+    return []
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            raise ConnectionAbortedError('Client disconnected')
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+def _replay(body, receive):
+    """receive() that hands an already-read body to the WSGI bridge"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+    return replay
+
+class ChainLearnASGI:
+    """Serves ROUTES on the event loop and hands every other request to Flask"""
+
+    def __init__(self, wsgi_app, threads=ASGI_WSGI_THREADS):
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=threads)
+        self._connect_lock = asyncio.Lock()
+        self._retry_at = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] == 'http':
+            for method, pattern, route, handler, budget, degraded in ROUTES:
+                match = pattern.match(scope['path'])
+                if match and scope['method'] == method:
+                    tenant_header = TENANT_HEADER.lower().encode('latin-1')
+                    tenant, error = resolve_tenant(next(
+                        (value.decode('latin-1') for name, value in scope['headers'] if name.lower() == tenant_header), None
+                    ))
+                    if error:
+                        # Flask answers requests for unknown tenants
+                        break
+                    # Caches and the ledger lookups below follow the tenant of this task
+                    token = database.current_tenant.set(tenant)
+                    try:
+                        # Degraded reads are served by Flask, without waiting on the database
+                        if breaker.is_open():
+                            break
+                        db = await self.async_db(tenant)
+                        if db is not None:
+                            await self.handle(db, route, handler, budget, degraded, match.groupdict(), scope, receive, send)
+                            return
+                    finally:
+                        database.current_tenant.reset(token)
+                    break
+        await self.wsgi(scope, receive, send)
+
+    async def async_db(self, tenant=None):
+        """The async database of a tenant, connecting on first use; None while it is unavailable"""
+        def connected():
+            if tenant is None:
+                return database.async_db
+            connection = database.async_tenant_connections.get(tenant)
+            return connection[1] if connection else None
+
+        if connected() is None and time.monotonic() >= self._retry_at.get(tenant, 0.0):
+            async with self._connect_lock:
+                if connected() is None and time.monotonic() >= self._retry_at.get(tenant, 0.0):
+                    if tenant is None:
+                        ok = await database.init_async_db()
+                    else:
+                        ok = await database.get_async_tenant_db(tenant) is not None
+                    if not ok:
+                        # Flask keeps serving these routes until the next attempt
+                        self._retry_at[tenant] = time.monotonic() + ASYNC_DB_RETRY_INTERVAL
+        return connected()
+
+    async def admit(self, request_headers, scope, budget, held):
+        """
+        Rate limit and admission control; returns a rejection response, or None
+        once a slot is held. Slots taken are appended to held for the caller to release.
+        """
+        if budget:
+            client = scope.get('client')
+            args = (budget, client[0] if client else None,
+                    request_headers.get('x-forwarded-for'), request_headers.get(API_KEY_HEADER.lower()))
+            if rate_limiter.enabled and rate_limiter.store.blocking:
+                allowed, retry_after = await asyncio.to_thread(rate_limiter.hit, *args)
+            else:
+                allowed, retry_after = rate_limiter.hit(*args)
+            if not allowed:
+                return _error_response(429, 'Too many requests', retry_after)
+
+        if tenancy_enabled():
+            tenant_slot = async_tenant_admission.instance()
+            decision = await tenant_slot.acquire()
+            if decision not in ('admitted', 'queued'):
+                metrics.admission_decisions.inc(decision='tenant_' + decision)
+                return _error_response(503, 'Server is busy, try again shortly', ADMISSION_QUEUE_TIMEOUT)
+            held.append(tenant_slot)
+
+        decision = await async_admission.acquire()
+        metrics.admission_decisions.inc(decision=decision)
+        if decision not in ('admitted', 'queued'):
+            return _error_response(503, 'Server is busy, try again shortly', ADMISSION_QUEUE_TIMEOUT)
+        held.append(async_admission)
+        return None
+
+    async def handle(self, db, route, handler, budget, degraded, params, scope, receive, send):
+        request_headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']
+        }
+        started = time.perf_counter()
+        status = 500
+        delegated = False
+        held = []
+        metrics.requests_in_flight.inc()
+        try:
+            response = await self.admit(request_headers, scope, budget, held)
+            if response is None:
+                body = await _read_body(receive)
+                try:
+                    response = await handler(db, request_headers, scope, body, **params)
+                except ConnectionFailure:
+                    # The async client has no command listener to report this. Answered
+                    # here: replaying through Flask would wait on the database again
+                    breaker.record_failure()
+                    response = await self.degrade(degraded, body, params)
+                else:
+                    if response is None:
+                        # Requests the async handler does not cover (e.g. malformed JSON) get Flask's
+                        # exact response; Flask counts them against the budget a second time
+                        delegated = True
+                        while held:
+                            held.pop().release()
+                        await self.wsgi(scope, _replay(body, receive), send)
+                        return
+                    # Only a completed round-trip says anything about the database
+                    # (Bloom misses and ledger-file answers never reach it)
+                    *response, queried = response
+                    if queried:
+                        breaker.record_success()
+
+            status, headers, body = response
+            headers, body = _compress(request_headers, status, headers, body)
+            if tenancy_enabled():
+                headers = headers + [('Vary', TENANT_HEADER)]
+            headers = headers + _cors_headers(request_headers) + [
+                ('Server-Timing', f'total;dur={(time.perf_counter() - started) * 1000:.2f}'),
+                ('Content-Length', str(len(body)))
+            ]
+            await send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            })
+            await send({'type': 'http.response.body', 'body': body})
+        finally:
+            while held:
+                held.pop().release()
+            metrics.requests_in_flight.dec()
+            if not delegated:
+                metrics.request_duration.observe(
+                    time.perf_counter() - started, method=scope['method'], route=route, status=str(status)
+                )
+
+    async def degrade(self, degraded, body, params):
+        """Degraded (status, headers, body) of a request whose handler lost the database"""
+        answer = await degraded(body, **params)
+        if answer is None:
+            return _error_response(503, UNAVAILABLE_MESSAGE, breaker.retry_after())
+        payload, source = answer
+        headers = [('Content-Type', 'application/json'), (DEGRADED_HEADER, source), ('Cache-Control', 'no-store')]
+        return 200, headers, _json_body(payload)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.async_db()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await database.close_async_db()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+application = ChainLearnASGI(app)
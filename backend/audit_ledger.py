@@ -0,0 +1,270 @@
+"""
+Ledger Audit - re-hash every anchored certificate and compare with the ledger
+Certificates are streamed in _id order with their names (the snapshot, or a
+batched join for certificates issued before snapshots existed), and
+generate_certificate_hash is recomputed across a process pool. Mismatches are
+appended to an NDJSON report; a checkpoint makes interrupted audits resumable.
+
+Examples:
+    python audit_ledger.py                       # resume an interrupted audit, or start a new one
+    python audit_ledger.py --restart             # discard an interrupted audit and start over
+    python audit_ledger.py --max-rate 5000 --secondary   # go easy on the primary
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import json
+import multiprocessing
+import os
+import sys
+import time
+from bson import ObjectId
+from pymongo import ReadPreference
+from pymongo.errors import AutoReconnect, NetworkTimeout, ExecutionTimeout
+from blockchain_utils import generate_certificate_hash, find_transactions
+from models import COLLECTIONS
+from storage_format import unpack_hash
+
+AUDIT_DIR = os.environ.get(
+    'AUDIT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'audit')
+)
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# Transient errors after which the read is retried with exponential backoff
+RETRYABLE_ERRORS = (AutoReconnect, NetworkTimeout, ExecutionTimeout)
+MAX_RETRIES = 8
+
+CERTIFICATE_FIELDS = ('certificate_id', 'student_id', 'course_id', 'student_name', 'course_name',
+                      'grade', 'issue_date', 'instructor_name', 'blockchain_hash')
+
+# ==================== Worker ====================
+
+def rehash_chunk(rows):
+    """
+    Runs in a worker process. Each row is
+    (certificate_id, hash input fields, certificate hash, ledger hash, names source);
+    returns the mismatch report entries for the chunk.
+    """
+    mismatches = []
+    for certificate_id, fields, certificate_hash, ledger_hash, names_source in rows:
+        if ledger_hash is None:
+            problem = 'missing_from_ledger'
+        elif certificate_hash != ledger_hash:
+            problem = 'certificate_hash_differs_from_ledger'
+        elif generate_certificate_hash(fields) != ledger_hash:
+            problem = 'content_differs_from_hash'
+        else:
+            continue
+        mismatches.append({
+            'certificate_id': certificate_id,
+            'problem': problem,
+            'certificate_hash': certificate_hash,
+            'ledger_hash': ledger_hash,
+            'names_source': names_source
+        })
+    return mismatches
+
+# ==================== Reader ====================
+
+def _with_retries(fn, *args):
+    """Call fn, backing off on transient server errors (elections, overload)"""
+    delay = 1.0
+    for attempt in range(MAX_RETRIES):
+        try:
+            return fn(*args)
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            print(f"\n[WARN] {type(e).__name__}: {e}; retrying in {delay:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+def _names_by_id(collection, ids, fields):
+    object_ids = [ObjectId(value) for value in ids if value and ObjectId.is_valid(value)]
+    if not object_ids:
+        return {}
+    return {
+        str(doc['_id']): doc
+        for doc in collection.find({'_id': {'$in': object_ids}}, {field: 1 for field in fields})
+    }
+
+def _hash_fields(certificate, student, course):
+    """The fields generate_certificate_hash was given when the certificate was anchored"""
+    if 'student_name' in certificate:
+        student_name, course_name = certificate.get('student_name'), certificate.get('course_name')
+    else:
+        student_name = student['name'] if student else None
+        course_name = course['name'] if course else None
+    issue_date = certificate.get('issue_date')
+    if isinstance(issue_date, datetime):
+        issue_date = issue_date.isoformat()
+    return {
+        'student_name': student_name or '',
+        'course_name': course_name or '',
+        'grade': certificate.get('grade', ''),
+        'issue_date': issue_date,
+        'instructor_name': certificate.get('instructor_name', '')
+    }
+
+def read_chunks(db, after_id, chunk_size, secondary=False):
+    """Yield (last _id, rows) for anchored certificates after after_id"""
+    def collection(name):
+        if secondary:
+            return db.get_collection(COLLECTIONS[name], read_preference=ReadPreference.SECONDARY_PREFERRED)
+        return db[COLLECTIONS[name]]
+
+    certificates_collection = collection('certificates')
+    users_collection = collection('users')
+    courses_collection = collection('courses')
+    ledger_db = db.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED) if secondary else db
+    projection = {field: 1 for field in CERTIFICATE_FIELDS}
+
+    while True:
+        query = {'blockchain_hash': {'$ne': None}}
+        if after_id is not None:
+            query['_id'] = {'$gt': after_id}
+        batch = _with_retries(lambda: list(
+            certificates_collection.find(query, projection).sort('_id', 1).limit(chunk_size)
+        ))
+        if not batch:
+            return
+        after_id = batch[-1]['_id']
+
+        legacy = [cert for cert in batch if 'student_name' not in cert]
+        students = _with_retries(_names_by_id, users_collection, {str(c.get('student_id')) for c in legacy}, ('name',))
+        courses = _with_retries(_names_by_id, courses_collection, {str(c.get('course_id')) for c in legacy}, ('name',))
+        ledger = {
+            certificate_id: unpack_hash(transaction.get('hash'))
+            for certificate_id, transaction in _with_retries(lambda: find_transactions(
+                [cert['certificate_id'] for cert in batch], ledger_db,
+                {'_id': 0, 'certificate_id': 1, 'hash': 1}
+            )).items()
+        }
+
+        rows = [(
+            cert['certificate_id'],
+            _hash_fields(cert, students.get(str(cert.get('student_id'))), courses.get(str(cert.get('course_id')))),
+            unpack_hash(cert['blockchain_hash']),
+            ledger.get(cert['certificate_id']),
+            'snapshot' if 'student_name' in cert else 'current_names'
+        ) for cert in batch]
+        yield after_id, rows
+
+# ==================== Checkpointing ====================
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    checkpoint['last_id'] = ObjectId(checkpoint['last_id']) if checkpoint.get('last_id') else None
+    return checkpoint
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(checkpoint, last_id=str(checkpoint['last_id']) if checkpoint['last_id'] else None), f)
+    os.replace(tmp_path, path)
+
+# ==================== Audit ====================
+
+def audit(db, report_path, checkpoint_path, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+          max_rate=0, secondary=False, restart=False, progress=None):
+    """
+    Run (or resume) a full audit. Chunks are re-hashed in parallel but
+    committed in order, so the checkpoint never skips an unaudited chunk.
+    A crash between writing a chunk's mismatches and its checkpoint can
+    repeat that chunk's entries in the report on resume.
+    Returns the final checkpoint dict.
+    """
+    checkpoint = None if restart else load_checkpoint(checkpoint_path)
+    if checkpoint is None or checkpoint.get('finished_at'):
+        checkpoint = {'last_id': None, 'audited': 0, 'mismatches': 0,
+                      'started_at': datetime.utcnow().isoformat(), 'finished_at': None}
+        open(report_path, 'w').close()
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    started = time.monotonic()
+    audited_at_start = checkpoint['audited']
+
+    # spawn: worker processes must not inherit the parent's MongoDB client
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool, \
+            open(report_path, 'a') as report:
+        pending = []
+
+        def commit_oldest():
+            last_id, count, future = pending.pop(0)
+            mismatches = future.result()
+            for entry in mismatches:
+                report.write(json.dumps(entry) + '\n')
+            report.flush()
+            checkpoint.update(
+                last_id=last_id,
+                audited=checkpoint['audited'] + count,
+                mismatches=checkpoint['mismatches'] + len(mismatches)
+            )
+            save_checkpoint(checkpoint_path, checkpoint)
+            if progress:
+                progress(checkpoint, checkpoint['audited'] - audited_at_start, time.monotonic() - started)
+
+        for last_id, rows in read_chunks(db, checkpoint['last_id'], chunk_size, secondary):
+            pending.append((last_id, len(rows), pool.submit(rehash_chunk, rows)))
+            while len(pending) >= max_in_flight:
+                commit_oldest()
+
+            if max_rate:
+                # Throttle reads to max_rate certificates per second on average
+                submitted = checkpoint['audited'] - audited_at_start + sum(count for _, count, _ in pending)
+                ahead = submitted / max_rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+        while pending:
+            commit_oldest()
+
+    checkpoint['finished_at'] = datetime.utcnow().isoformat()
+    save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Re-hash anchored certificates and report ledger mismatches')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: all cores)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Certificates per chunk')
+    parser.add_argument('--max-rate', type=float, default=0,
+                        help='Maximum certificates read per second (default: unlimited)')
+    parser.add_argument('--secondary', action='store_true', help='Read from secondaries when available')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start over')
+    parser.add_argument('--report', default=os.path.join(AUDIT_DIR, 'mismatches.ndjson'))
+    parser.add_argument('--checkpoint', default=os.path.join(AUDIT_DIR, 'checkpoint.json'))
+    args = parser.parse_args(argv)
+
+    from database import init_db, get_db
+
+    if not init_db():
+        print("[ERROR] Failed to connect to database")
+        return 1
+
+    for path in (args.report, args.checkpoint):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def progress(checkpoint, audited_now, elapsed):
+        rate = audited_now / elapsed if elapsed else 0
+        print(f"[INFO] {checkpoint['audited']} audited, {checkpoint['mismatches']} mismatches, "
+              f"{rate:.0f}/s", end='\r')
+
+    checkpoint = audit(
+        get_db(), args.report, args.checkpoint, workers=args.workers, chunk_size=args.chunk_size,
+        max_rate=args.max_rate, secondary=args.secondary, restart=args.restart, progress=progress
+    )
+    print(f"\n[OK] Audit finished: {checkpoint['audited']} certificates, {checkpoint['mismatches']} mismatches")
+    print(f"     Report: {args.report}")
+    return 2 if checkpoint['mismatches'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+API Benchmark Suite for ChainLearn
+Drives the Flask test client through the hot paths against a local stand-in
+database and reports latency percentiles and queries per request.
+
+Examples:
+    python benchmark.py                                   # mongomock, default sizes
+    python benchmark.py --sizes 1000,10000 --output benchmarks/baseline.json
+    python benchmark.py --compare benchmarks/baseline.json
+    python benchmark.py --mongodb-uri mongodb://localhost:27017   # local mongod
+
+Never point --mongodb-uri at a shared database: the benchmark database is dropped
+before every run. It is always chainlearn_bench (MONGODB_DB_NAME and tenant
+settings are ignored), and the benchmark refuses to seed any other database.
+"""
+
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+
+DEFAULT_SIZES = '1000,5000'
+BENCH_DB_NAME = 'chainlearn_bench'
+BENCH_PASSWORD = 'bench-password'
+
+# A scenario regresses if its p95 latency grows by more than this fraction
+DEFAULT_TOLERANCE = 0.25
+
+class QueryCounter:
+    """Counts database commands issued while the benchmark runs"""
+
+    def __init__(self):
+        self.count = 0
+
+    def install(self, uri):
+        if uri.startswith('mongomock://'):
+            self._wrap_mongomock()
+        else:
+            from pymongo import monitoring
+
+            counter = self
+
+            class _Listener(monitoring.CommandListener):
+                def started(self, event):
+                    counter.count += 1
+
+                def succeeded(self, event):
+                    pass
+
+                def failed(self, event):
+                    pass
+
+            # Must be registered before the client is created
+            monitoring.register(_Listener())
+
+    def _wrap_mongomock(self):
+        """mongomock has no command monitoring, so count collection operations instead"""
+        import mongomock
+
+        counter = self
+        operations = (
+            'find', 'find_one', 'insert_one', 'insert_many', 'update_one', 'update_many',
+            'replace_one', 'delete_one', 'delete_many', 'count_documents',
+            'estimated_document_count', 'aggregate', 'bulk_write', 'distinct',
+            'find_one_and_update', 'find_one_and_replace', 'find_one_and_delete',
+        )
+
+        depth = threading.local()
+
+        def wrap(method):
+            def counted(*args, **kwargs):
+                # mongomock implements some operations on top of others (find_one -> find)
+                nested = getattr(depth, 'value', 0)
+                if not nested:
+                    counter.count += 1
+                depth.value = nested + 1
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    depth.value = nested
+            return counted
+
+        for name in operations:
+            method = getattr(mongomock.collection.Collection, name, None)
+            if method is not None:
+                setattr(mongomock.collection.Collection, name, wrap(method))
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies, queries):
+    latencies = sorted(latencies)
+    to_ms = lambda value: round(value * 1000, 3)
+    return {
+        'requests': len(latencies),
+        'mean_ms': to_ms(sum(latencies) / len(latencies)),
+        'p50_ms': to_ms(percentile(latencies, 0.50)),
+        'p95_ms': to_ms(percentile(latencies, 0.95)),
+        'p99_ms': to_ms(percentile(latencies, 0.99)),
+        'queries_per_request': round(queries / len(latencies), 2)
+    }
+
+# ==================== Dataset ====================
+
+def seed_dataset(db, size, rng):
+    """Populate the benchmark database with `size` certificates and matching data"""
+    from seed_data import seed
+
+    # Seeding drops the collections first; never let that reach another database
+    if db.name != BENCH_DB_NAME:
+        raise RuntimeError(f'Refusing to seed {db.name!r}: the benchmark only seeds {BENCH_DB_NAME!r}')
+
+    return seed(
+        db,
+        students=max(10, size // 5),
+        teachers=max(2, size // 500),
+        courses=max(5, size // 200),
+        certificates=size,
+        anchored_fraction=1.0,
+        rng=rng,
+        password=BENCH_PASSWORD,
+        drop=True
+    )
+
+def reset_process_caches(app_module):
+    """Make every dataset size start from the same cold-ish state"""
+    app_module.user_cache.clear()
+    app_module.course_cache.clear()
+    app_module.certificate_filter.build()
+
+# ==================== Scenarios ====================
+
+def build_scenarios(client, dataset, rng):
+    """Return {name: (callable issuing one request, expected status codes)}"""
+    hot = dataset['hot_certificates']
+
+    def pick_certificate():
+        # 80% of verification traffic goes to the hot 1% of certificates
+        pool = hot if rng.random() < 0.8 else dataset['certificates']
+        return rng.choice(pool)
+
+    def login():
+        return client.post('/api/auth/login', json={
+            'email': rng.choice(dataset['student_emails']), 'password': BENCH_PASSWORD
+        })
+
+    def list_certificates():
+        return client.get('/api/certificates')
+
+    def list_certificates_by_student():
+        return client.get(f"/api/certificates?student_id={rng.choice(dataset['students'])}")
+
+    def issue():
+        course_id, course_name = rng.choice(dataset['courses'])
+        return client.post('/api/certificates', json={
+            'student_id': rng.choice(dataset['students']), 'course_id': course_id,
+            'course_name': course_name, 'grade': 'A', 'score': 90
+        })
+
+    def verify_by_id():
+        return client.post('/api/certificates/verify', json={'certificate_id': pick_certificate()[0]})
+
+    def verify_by_hash():
+        return client.post('/api/certificates/verify', json={'hash': pick_certificate()[1]})
+
+    def verify_unknown():
+        return client.post('/api/certificates/verify', json={'certificate_id': f'CERT-0000-{rng.random()}'})
+
+    def grade_write():
+        course_id, _ = rng.choice(dataset['courses'])
+        return client.post('/api/grades', json={
+            'student_id': rng.choice(dataset['students']), 'course_id': course_id,
+            'grade': rng.choice(['A', 'B']), 'score': rng.randint(50, 100)
+        })
+
+    def stats():
+        return client.get('/api/blockchain/stats')
+
+    return {
+        'login': (login, (200,)),
+        'list_certificates': (list_certificates, (200,)),
+        'list_certificates_by_student': (list_certificates_by_student, (200,)),
+        'issue': (issue, (201,)),
+        'verify_by_id': (verify_by_id, (200,)),
+        'verify_by_hash': (verify_by_hash, (200,)),
+        'verify_unknown': (verify_unknown, (404,)),
+        'grade_write': (grade_write, (200, 201)),
+        'stats': (stats, (200,)),
+    }
+
+# Full-table scenarios cost O(size) per request and get fewer iterations
+HEAVY_SCENARIOS = {'list_certificates'}
+
+def run_scenario(request_fn, expected, iterations, counter, warmup=3):
+    for _ in range(warmup):
+        request_fn()
+
+    latencies = []
+    queries_before = counter.count
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = request_fn()
+        latencies.append(time.perf_counter() - started)
+        if response.status_code not in expected:
+            raise RuntimeError(f'Unexpected status {response.status_code}: {response.get_data(as_text=True)[:200]}')
+    return summarize(latencies, counter.count - queries_before)
+
+# ==================== Baselines ====================
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions against a saved baseline"""
+    regressions = []
+    for size, scenarios in results['results'].items():
+        for name, current in scenarios.items():
+            previous = baseline.get('results', {}).get(size, {}).get(name)
+            if not previous:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f"{name} @ {size}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms"
+                )
+            if current['queries_per_request'] > previous['queries_per_request']:
+                regressions.append(
+                    f"{name} @ {size}: queries/request {previous['queries_per_request']} -> {current['queries_per_request']}"
+                )
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark ChainLearn API hot paths')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated certificate counts')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+    parser.add_argument('--scenarios', help='Comma-separated subset of scenarios to run')
+    parser.add_argument('--mongodb-uri', default='mongomock://localhost',
+                        help='mongomock:// (default) or a local mongod URI')
+    parser.add_argument('--seed', type=int, default=1234, help='Random seed')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative p95 increase before flagging a regression')
+    args = parser.parse_args(argv)
+
+    # Configure the database before the app module connects on import
+    os.environ['MONGODB_URI'] = args.mongodb_uri
+    os.environ['MONGODB_DB_NAME'] = BENCH_DB_NAME
+    # Tenant settings would redirect get_db() to an institution's database
+    os.environ.pop('CHAINLEARN_TENANT', None)
+    os.environ.pop('TENANTS', None)
+    if not args.mongodb_uri.startswith('mongodb+srv://'):
+        os.environ.setdefault('MONGODB_TLS', '0')
+    # Every scenario comes from one client address, well past the per-client budgets
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+    counter = QueryCounter()
+    counter.install(args.mongodb_uri)
+
+    import app as app_module
+    from database import get_db
+    from pymongo.errors import ConnectionFailure
+
+    try:
+        db = get_db()
+    except ConnectionFailure:
+        print("[ERROR] Failed to connect to benchmark database")
+        return 1
+    if db.name != BENCH_DB_NAME:
+        print(f"[ERROR] Connected to {db.name!r} instead of {BENCH_DB_NAME!r}; refusing to drop its data")
+        return 1
+
+    client = app_module.app.test_client()
+    results = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(),
+            'mongodb': 'mongomock' if args.mongodb_uri.startswith('mongomock://') else 'mongod',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'requests': args.requests,
+            'seed': args.seed
+        },
+        'results': {}
+    }
+
+    selected = set(args.scenarios.split(',')) if args.scenarios else None
+    for size in [int(value) for value in args.sizes.split(',')]:
+        rng = random.Random(args.seed)
+        print(f"\n[INFO] Seeding {size} certificates...")
+        dataset = seed_dataset(db, size, rng)
+        reset_process_caches(app_module)
+
+        print(f"{'scenario':<30}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}")
+        size_results = results['results'][str(size)] = {}
+        for name, (request_fn, expected) in build_scenarios(client, dataset, rng).items():
+            if selected and name not in selected:
+                continue
+            iterations = max(5, args.requests // 10) if name in HEAVY_SCENARIOS else args.requests
+            summary = run_scenario(request_fn, expected, iterations, counter)
+            size_results[name] = summary
+            print(f"{name:<30}{summary['p50_ms']:>10}{summary['p95_ms']:>10}"
+                  f"{summary['p99_ms']:>10}{summary['queries_per_request']:>10}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n[OK] Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\n[REGRESSION] Compared to", args.compare)
+            for line in regressions:
+                print("  -", line)
+            return 1
+        print(f"\n[OK] No regressions compared to {args.compare}")
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,30 +4,21 @@ Python implementation matching the frontend blockchain.ts functionality
 MongoDB Version
 """
 
-from datetime import datetime
-import hashlib
+from datetime import datetime, timedelta
+import heapq
+import itertools
 from database import get_db
-from models import COLLECTIONS, serialize_doc
-
-def generate_certificate_hash(certificate_data):
-    """
-    Generate SHA256 hash for certificate data
-    Matches the frontend generateCertificateHash function
-    """
-    # Create a string from certificate data (same format as frontend)
-    data_string = (
-        str(certificate_data.get('student_name', '')) +
-        str(certificate_data.get('course_name', '')) +
-        str(certificate_data.get('grade', '')) +
-        str(certificate_data.get('issue_date', '')) +
-        str(certificate_data.get('instructor_name', ''))
-    )
-    
-    # Generate SHA256 hash
-    hash_object = hashlib.sha256(data_string.encode('utf-8'))
-    hex_hash = hash_object.hexdigest()
-    
-    return hex_hash
+from models import COLLECTIONS, serialize_doc, serialize_list
+from ledger_store import lookup_ledger_file, get_ledger_file
+from ledger_partitions import (catalog, partition_name, partition_year, route_certificate, route_blocks,
+                               archived_transaction, iter_archived_transactions, PartitionClosed, HOT, ARCHIVED,
+                               LEDGER_SETTLE_SECONDS)
+from singleflight import lookups
+from metrics import blocks_written
+# The hash itself lives in a dependency-free module shared with the offline verifier
+from certificate_hashing import generate_certificate_hash, canonical_certificate_string
+from storage_format import pack_hash
+from schemas import LedgerEntry
 
 def submit_to_blockchain(certificate_id, student_name, course_name, grade, issue_date, instructor_name):
     """
@@ -35,7 +26,12 @@ def submit_to_blockchain(certificate_id, student_name, course_name, grade, issue
     Returns transaction details including hash and block number
     """
     db = get_db()
-    transactions_collection = db[COLLECTIONS['blockchain_transactions']]
+    
+    # Transactions go to the partition of the certificate's issuance year
+    year = partition_year(certificate_id)
+    if catalog.status(year, db) != HOT:
+        raise PartitionClosed(f'The {year} ledger partition is archived')
+    transactions_collection = db[partition_name(year)]
     
     certificate_data = {
         'student_name': student_name,
@@ -48,22 +44,21 @@ def submit_to_blockchain(certificate_id, student_name, course_name, grade, issue
     # Generate hash
     hash_value = generate_certificate_hash(certificate_data)
     
-    # Get current block number
-    last_transaction = transactions_collection.find_one(
-        sort=[('block_number', -1)]
-    )
-    block_number = (last_transaction['block_number'] + 1) if last_transaction else 1
+    # Reserve the next block number atomically, so concurrent issuers never share one
+    block_number = catalog.reserve_blocks(1, db)
     
     # Create blockchain transaction
     transaction_data = {
         'certificate_id': certificate_id,
-        'hash': hash_value,
+        'hash': pack_hash(hash_value),
         'block_number': block_number,
         'timestamp': datetime.utcnow(),
         'verified': True
     }
     
     transactions_collection.insert_one(transaction_data)
+    catalog.record_write(year, block_number, db)
+    blocks_written.inc()
     
     return {
         'hash': hash_value,
@@ -76,12 +71,139 @@ def verify_certificate_hash(certificate_id, expected_hash):
     """
     Verify a certificate on the blockchain
     Returns verification result matching frontend format
+    Concurrent identical verifications share one lookup; treat the result as read-only
     """
-    db = get_db()
-    transactions_collection = db[COLLECTIONS['blockchain_transactions']]
-    
-    transaction = transactions_collection.find_one({'certificate_id': certificate_id})
+    return lookups.do(
+        ('verify_hash', certificate_id, expected_hash),
+        _verify_certificate_hash, certificate_id, expected_hash
+    )
+
+def _verify_certificate_hash(certificate_id, expected_hash):
+    """Look up the ledger transaction for a certificate and compare hashes"""
+    # Fast path: answer from the local ledger file when it already holds this block
+    result = verify_from_ledger_file(certificate_id, expected_hash)
+    if result:
+        return result
     
+    transaction = find_transaction(certificate_id)
+    return verification_result(transaction, expected_hash)
+
+def find_transaction(certificate_id, db=None):
+    """Ledger transaction for a certificate from its year's partition or archive, or None"""
+    db = db if db is not None else get_db()
+    for kind, source in route_certificate(certificate_id, db):
+        if kind == 'archive':
+            transaction = archived_transaction(source, certificate_id)
+        else:
+            transaction = db[source].find_one({'certificate_id': certificate_id})
+        if transaction:
+            return transaction
+    return None
+
+def find_transactions(certificate_ids, db=None, projection=None):
+    """
+    Ledger transactions for many certificates: {certificate_id: transaction}.
+    One $in query per partition involved, archives are read from their files.
+    """
+    db = db if db is not None else get_db()
+    by_source = {}
+    for certificate_id in certificate_ids:
+        for source in route_certificate(certificate_id, db):
+            by_source.setdefault(source, []).append(certificate_id)
+
+    found = {}
+    for (kind, source), ids in by_source.items():
+        ids = [certificate_id for certificate_id in ids if certificate_id not in found]
+        if not ids:
+            continue
+        if kind == 'archive':
+            for certificate_id in ids:
+                transaction = archived_transaction(source, certificate_id)
+                if transaction:
+                    found[certificate_id] = transaction
+        else:
+            for transaction in db[source].find({'certificate_id': {'$in': ids}}, projection):
+                found.setdefault(transaction['certificate_id'], transaction)
+    return found
+
+def iter_transactions(first_block=None, last_block=None, db=None, batch_size=1000, include_archived=False):
+    """
+    Ledger transactions in block order across partitions, streamed in batches.
+    Archived years are skipped unless include_archived, which reads them from their export.
+    """
+    db = db if db is not None else get_db()
+    query = {}
+    if first_block is not None:
+        query.setdefault('block_number', {})['$gte'] = first_block
+    if last_block is not None:
+        query.setdefault('block_number', {})['$lte'] = last_block
+
+    def in_range(transaction):
+        block_number = transaction['block_number']
+        return ((first_block is None or block_number >= first_block) and
+                (last_block is None or block_number <= last_block))
+
+    streams = []
+    for kind, source in route_blocks(first_block, last_block, db):
+        if kind == 'archive':
+            if include_archived:
+                streams.append(filter(in_range, iter_archived_transactions(source)))
+        else:
+            streams.append(db[source].find(query, {'_id': 0}).sort('block_number', 1).batch_size(batch_size))
+    return heapq.merge(*streams, key=lambda transaction: transaction['block_number'])
+
+def iter_settled_transactions(first_block=None, db=None, batch_size=1000, include_archived=False,
+                              settle=LEDGER_SETTLE_SECONDS):
+    """
+    iter_transactions() up to the settled watermark, for readers that resume
+    after the last block they read (ledger file sync, verification bundles).
+    Block numbers are reserved before the insert, so block N can appear after
+    N + 1. Stopping before the first transaction stamped in the last `settle`
+    seconds means every lower block number has been written, so none is skipped.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=settle)
+
+    def settled(transaction):
+        timestamp = transaction.get('timestamp')
+        if isinstance(timestamp, str):
+            # Archive exports hold ISO timestamps
+            timestamp = datetime.fromisoformat(timestamp)
+        return timestamp is None or timestamp < cutoff
+
+    return itertools.takewhile(settled, iter_transactions(
+        first_block=first_block, db=db, batch_size=batch_size, include_archived=include_archived
+    ))
+
+def verify_from_ledger_file(certificate_id, expected_hash):
+    """Positive verification result from the local ledger file, or None to fall back to the database"""
+    record = lookup_ledger_file(certificate_id, expected_hash)
+    if not record:
+        return None
+    return {
+        'isValid': True,
+        'blockNumber': record['block_number'],
+        'timestamp': record['timestamp'],
+        'message': 'Certificate verified successfully'
+    }
+
+def verify_hash_from_ledger_file(expected_hash):
+    """
+    Positive result for a hash anchored in the local ledger file, whichever
+    certificate it belongs to, or None; used while the database is unavailable
+    """
+    ledger = get_ledger_file()
+    records = ledger.find_by_hash(expected_hash) if ledger is not None else []
+    if not records:
+        return None
+    return {
+        'isValid': True,
+        'blockNumber': records[0]['block_number'],
+        'timestamp': records[0]['timestamp'],
+        'message': 'Certificate verified successfully'
+    }
+
+def verification_result(transaction, expected_hash):
+    """Compare a ledger transaction document (or None) against the expected hash"""
     if not transaction:
         return {
             'isValid': False,
@@ -113,12 +235,24 @@ def get_blockchain_stats():
     Returns stats matching frontend format
     """
     db = get_db()
-    transactions_collection = db[COLLECTIONS['blockchain_transactions']]
     
-    total_certificates = transactions_collection.count_documents({})
-    last_transaction = transactions_collection.find_one(
-        sort=[('block_number', -1)]
-    )
+    # Partition sizes come from the catalog, so archived years still count
+    partitions = list(db[COLLECTIONS['ledger_partitions']].find())
+    total_certificates = sum(entry.get('count', 0) for entry in partitions)
+    last_transaction = None
+    newest = max(partitions, key=lambda entry: entry.get('max_block', 0), default=None)
+    if newest and newest['status'] == ARCHIVED:
+        archive = catalog.archive(newest['_id'])
+        last_transaction = archive.find_by_block(newest['max_block']) if archive else None
+    elif newest:
+        last_transaction = db[newest['collection']].find_one({'block_number': newest['max_block']})
+    
+    legacy_collection = db[COLLECTIONS['blockchain_transactions']]
+    if catalog.legacy_present(db):
+        total_certificates += legacy_collection.count_documents({})
+        legacy_last = legacy_collection.find_one(sort=[('block_number', -1)])
+        if legacy_last and (not last_transaction or legacy_last['block_number'] > last_transaction['block_number']):
+            last_transaction = legacy_last
     
     if last_transaction:
         timestamp = last_transaction.get('timestamp')
@@ -137,16 +271,12 @@ def get_all_certificates_from_blockchain():
     """
     Get all certificates from blockchain (for admin view)
     """
-    db = get_db()
-    transactions_collection = db[COLLECTIONS['blockchain_transactions']]
-    
-    transactions = list(transactions_collection.find())
-    transactions = serialize_list(transactions)
-    
-    return [{
-        'certificate_id': t.get('certificate_id'),
-        'hash': t.get('hash'),
-        'block_number': t.get('block_number'),
-        'timestamp': t.get('timestamp') if isinstance(t.get('timestamp'), str) else t.get('timestamp').isoformat() if t.get('timestamp') else None,
-        'verified': t.get('verified', True)
-    } for t in transactions]
+    transactions = serialize_list(list(iter_transactions(include_archived=True)))
+    
+    return [LedgerEntry(
+        certificate_id=t.get('certificate_id'),
+        hash=t.get('hash'),
+        block_number=t.get('block_number'),
+        timestamp=t.get('timestamp') if isinstance(t.get('timestamp'), str) else t.get('timestamp').isoformat() if t.get('timestamp') else None,
+        verified=t.get('verified', True)
+    ) for t in transactions]
@@ -0,0 +1,207 @@
+"""
+Bloom Filter - fast rejection of unknown certificate IDs and hashes
+Definite misses on /api/certificates/verify are answered without a database query
+"""
+
+from datetime import datetime, timedelta
+import hashlib
+import math
+import os
+import threading
+import time
+from bson import ObjectId
+from database import get_db
+from models import COLLECTIONS
+from ledger_partitions import catalog
+from storage_format import unpack_hash
+from tenancy import PerTenant
+
+# Configuration
+BLOOM_FILTER_ENABLED = os.environ.get('BLOOM_FILTER_ENABLED', '1') == '1'
+BLOOM_EXPECTED_ITEMS = int(os.environ.get('BLOOM_EXPECTED_ITEMS', '1000000'))
+BLOOM_FALSE_POSITIVE_RATE = float(os.environ.get('BLOOM_FALSE_POSITIVE_RATE', '0.001'))
+
+# ObjectIds are generated client-side, so catch-up scans overlap the previous window by this much
+BLOOM_REFRESH_OVERLAP = timedelta(seconds=60)
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing"""
+
+    def __init__(self, expected_items, false_positive_rate):
+        expected_items = max(int(expected_items), 1)
+        self.expected_items = expected_items
+        self.false_positive_rate = false_positive_rate
+        self.num_bits = max(8, int(math.ceil(
+            -expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)
+        )))
+        self.num_hashes = max(1, int(round(self.num_bits / expected_items * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        """Add a value to the filter"""
+        positions = self._positions(value)
+        # Bit updates are read-modify-write, so concurrent adds must not interleave
+        with self._lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.items += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        for position in self._positions(value):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def estimated_false_positive_rate(self):
+        """False-positive rate expected at the current number of items"""
+        return (1 - math.exp(-self.num_hashes * self.items / self.num_bits)) ** self.num_hashes
+
+class CertificateFilter:
+    """
+    Bloom filter over every certificate_id and blockchain_hash.
+    Until build() succeeds every lookup reports a possible match, so the filter
+    can only ever skip queries, never hide an existing certificate.
+    """
+
+    def __init__(self, expected_items=BLOOM_EXPECTED_ITEMS,
+                 false_positive_rate=BLOOM_FALSE_POSITIVE_RATE,
+                 enabled=BLOOM_FILTER_ENABLED):
+        self.expected_items = expected_items
+        self.false_positive_rate = false_positive_rate
+        self.enabled = enabled
+        self.filter = None
+        self.built_at = None
+        self.rejected = 0
+        self._refreshed_at = None
+        # When the latest catch-up scan started (time.monotonic()) and how it failed, if it did
+        self._scan_started = 0.0
+        self._scan_error = None
+        self._refresh_lock = threading.Lock()
+
+    def _scan(self, bloom, since=None):
+        """Add values from certificates and ledger transactions (optionally only recent ones)"""
+        db = get_db()
+        query = {}
+        if since is not None:
+            query = {'_id': {'$gte': ObjectId.from_datetime(since - BLOOM_REFRESH_OVERLAP)}}
+
+        certificates = db[COLLECTIONS['certificates']].find(
+            query, {'_id': 0, 'certificate_id': 1, 'blockchain_hash': 1}
+        )
+        for certificate in certificates:
+            if certificate.get('certificate_id'):
+                bloom.add(certificate['certificate_id'])
+            if certificate.get('blockchain_hash'):
+                bloom.add(unpack_hash(certificate['blockchain_hash']))
+
+        # Hashes are attached to certificates by update, so pick them up from the ledger
+        # (archived years were anchored before archiving, so their certificates hold their hashes)
+        for name in catalog.hot_collections(db):
+            transactions = db[name].find(query, {'_id': 0, 'certificate_id': 1, 'hash': 1})
+            for transaction in transactions:
+                if transaction.get('certificate_id'):
+                    bloom.add(transaction['certificate_id'])
+                if transaction.get('hash'):
+                    bloom.add(unpack_hash(transaction['hash']))
+
+    def build(self):
+        """Build the filter from a projected scan of the database"""
+        if not self.enabled:
+            return False
+        started_at = datetime.utcnow()
+        scan_started = time.monotonic()
+        db = get_db()
+
+        # Size for the current data set with room to grow
+        existing = (db[COLLECTIONS['certificates']].estimated_document_count() * 2 +
+                    sum(db[name].estimated_document_count() for name in catalog.hot_collections(db)))
+        bloom = BloomFilter(max(self.expected_items, existing * 2), self.false_positive_rate)
+        self._scan(bloom)
+
+        self.filter = bloom
+        self.built_at = started_at
+        self._refreshed_at = started_at
+        self._scan_started = scan_started
+        return True
+
+    def refresh(self, after=None):
+        """
+        Catch up with values inserted by other workers since the last scan.
+        With after (a time.monotonic() reading), a scan that started after it
+        is enough: concurrent callers share one scan, and its error if it failed.
+        """
+        if self.filter is None:
+            return
+        with self._refresh_lock:
+            if after is not None and self._scan_started > after:
+                if self._scan_error is not None:
+                    raise self._scan_error
+                return
+            started_at = datetime.utcnow()
+            self._scan_started, self._scan_error = time.monotonic(), None
+            try:
+                self._scan(self.filter, since=self._refreshed_at)
+            except Exception as e:
+                self._scan_error = e
+                raise
+            self._refreshed_at = started_at
+
+    def add(self, value):
+        """Record a newly written certificate ID or hash"""
+        if self.filter is not None and value:
+            self.filter.add(value)
+
+    def matches(self, value):
+        """True if value is in the filter as it is now (or there is nothing to check); never queries"""
+        bloom = self.filter
+        return bloom is None or not value or value in bloom
+
+    def might_contain(self, value):
+        """
+        False only if value is definitely not a known certificate ID or hash.
+        A miss stands only once a catch-up scan that started after it has run,
+        so a certificate just issued by another worker is never reported missing;
+        concurrent misses share the scan.
+        """
+        if self.matches(value):
+            return True
+        probe = time.monotonic()
+        try:
+            self.refresh(after=probe)
+        except Exception:
+            return True
+        if value in self.filter:
+            return True
+        self.rejected += 1
+        return False
+
+    def stats(self):
+        """Configuration and current state of the filter"""
+        bloom = self.filter
+        if bloom is None:
+            return {'enabled': self.enabled, 'built': False}
+        return {
+            'enabled': self.enabled,
+            'built': True,
+            'built_at': self.built_at.isoformat(),
+            'items': bloom.items,
+            'capacity': bloom.expected_items,
+            'bits': bloom.num_bits,
+            'hash_functions': bloom.num_hashes,
+            'memory_bytes': len(bloom.bits),
+            'target_false_positive_rate': bloom.false_positive_rate,
+            'estimated_false_positive_rate': round(bloom.estimated_false_positive_rate(), 8),
+            'rejected_lookups': self.rejected
+        }
+
+# Shared filter used by the API, one per tenant
+certificate_filter = PerTenant(CertificateFilter)
@@ -0,0 +1,26 @@
+"""
+Certificate Hashing - the canonical certificate hash, without dependencies
+Shared by the API (through blockchain_utils) and by offline_verifier.py, so a
+verifier hashing a certificate locally gets exactly the hash that was anchored.
+Only uses the standard library; copy it next to offline_verifier.py to verify offline.
+"""
+
+import hashlib
+
+# Fields concatenated, in this order, to form the hashed string
+HASHED_FIELDS = ('student_name', 'course_name', 'grade', 'issue_date', 'instructor_name')
+
+def canonical_certificate_string(certificate_data):
+    """
+    The string that is hashed for a certificate
+    Matches the frontend generateCertificateHash function: the fields are
+    concatenated without separators, missing fields as empty strings
+    """
+    return ''.join(str(certificate_data.get(field, '')) for field in HASHED_FIELDS)
+
+def generate_certificate_hash(certificate_data):
+    """
+    Generate SHA256 hash for certificate data
+    Matches the frontend generateCertificateHash function
+    """
+    return hashlib.sha256(canonical_certificate_string(certificate_data).encode('utf-8')).hexdigest()
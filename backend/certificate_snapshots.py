@@ -0,0 +1,161 @@
+"""
+Certificate Name Snapshots - student and course names stored on the certificate
+A certificate records the student name, student email and course name when it is
+issued (instructor_name is already stored), so detail and verification reads are
+a single-document fetch. Once a certificate is anchored its snapshot holds the
+names generate_certificate_hash hashed and is never rewritten; renames are only
+propagated to certificates that are not anchored yet.
+
+Backfill certificates issued before snapshots existed:
+    python certificate_snapshots.py            # certificates without a snapshot
+    python certificate_snapshots.py --refresh  # also re-sync unanchored snapshots after direct DB edits
+"""
+
+import argparse
+import sys
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import ConnectionFailure
+from database import get_db
+from models import COLLECTIONS
+from entity_cache import user_cache, course_cache
+from storage_format import ref_query
+
+SNAPSHOT_FIELDS = ('student_name', 'student_email', 'course_name')
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Certificates whose snapshot may still follow renames
+UNANCHORED = {'blockchain_hash': None}
+
+def build_snapshot(student, course):
+    """Snapshot fields for a certificate from its student and course documents"""
+    return {
+        'student_name': student['name'] if student else None,
+        'student_email': student['email'] if student else None,
+        'course_name': course['name'] if course else None
+    }
+
+def has_snapshot(certificate):
+    """True if the certificate carries a snapshot (all fields are written together)"""
+    return 'student_name' in certificate
+
+def snapshot_of(certificate):
+    """The snapshot fields of a certificate that has one"""
+    return {field: certificate.get(field) for field in SNAPSHOT_FIELDS}
+
+def resolve_names(certificate):
+    """Snapshot of a certificate; ones issued before snapshots existed are resolved through the entity caches"""
+    if has_snapshot(certificate):
+        return snapshot_of(certificate)
+    return build_snapshot(
+        user_cache.get(certificate.get('student_id')),
+        course_cache.get(certificate.get('course_id'))
+    )
+
+def resolve_names_many(certificates):
+    """resolve_names for a page of certificates with at most one query per collection"""
+    missing = [cert for cert in certificates if not has_snapshot(cert)]
+    students = user_cache.get_many(cert.get('student_id') for cert in missing)
+    courses = course_cache.get_many(cert.get('course_id') for cert in missing)
+    return [
+        snapshot_of(cert) if has_snapshot(cert) else build_snapshot(
+            students.get(str(cert.get('student_id'))), courses.get(str(cert.get('course_id')))
+        )
+        for cert in certificates
+    ]
+
+# ==================== Rename Propagation ====================
+
+def _certificates():
+    return get_db()[COLLECTIONS['certificates']]
+
+def propagate_course_rename(course_id, name):
+    """Update course_name on unanchored certificates of a course; returns the number changed"""
+    result = _certificates().update_many(
+        {'course_id': ref_query(course_id), 'course_name': {'$ne': name}, **UNANCHORED},
+        {'$set': {'course_name': name}}
+    )
+    return result.modified_count
+
+# ==================== Backfill ====================
+
+def _documents_by_id(collection, ids):
+    object_ids = [ObjectId(value) for value in ids if value and ObjectId.is_valid(value)]
+    if not object_ids:
+        return {}
+    return {str(doc['_id']): doc for doc in collection.find({'_id': {'$in': object_ids}}, {'name': 1, 'email': 1})}
+
+def backfill(db, batch_size=DEFAULT_BATCH_SIZE, refresh=False, progress=None):
+    """
+    Write snapshots in _id order, one bulk_write per batch.
+    With refresh, unanchored certificates whose names changed are rewritten as well.
+    Returns {'scanned': n, 'updated': n}.
+    """
+    certificates_collection = db[COLLECTIONS['certificates']]
+    users_collection = db[COLLECTIONS['users']]
+    courses_collection = db[COLLECTIONS['courses']]
+
+    query = {'student_name': {'$exists': False}}
+    if refresh:
+        query = {'$or': [query, UNANCHORED]}
+    projection = {'student_id': 1, 'course_id': 1, 'blockchain_hash': 1, **{field: 1 for field in SNAPSHOT_FIELDS}}
+
+    counts = {'scanned': 0, 'updated': 0}
+    last_id = None
+    while True:
+        batch_query = dict(query, _id={'$gt': last_id}) if last_id else query
+        batch = list(certificates_collection.find(batch_query, projection).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+
+        students = _documents_by_id(users_collection, {str(cert.get('student_id')) for cert in batch})
+        courses = _documents_by_id(courses_collection, {str(cert.get('course_id')) for cert in batch})
+        operations = []
+        for cert in batch:
+            snapshot = build_snapshot(
+                students.get(str(cert.get('student_id'))), courses.get(str(cert.get('course_id')))
+            )
+            if has_snapshot(cert) and snapshot_of(cert) == snapshot:
+                continue
+            # Never overwrite a snapshot written (or anchored) since this batch was read
+            if has_snapshot(cert):
+                filter_ = {'_id': cert['_id'], **UNANCHORED}
+            else:
+                filter_ = {'_id': cert['_id'], 'student_name': {'$exists': False}}
+            operations.append(UpdateOne(filter_, {'$set': snapshot}))
+
+        if operations:
+            counts['updated'] += certificates_collection.bulk_write(operations, ordered=False).modified_count
+        counts['scanned'] += len(batch)
+        if progress:
+            progress(counts)
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backfill student/course name snapshots on certificates')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Also re-sync snapshots of unanchored certificates with current names')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    try:
+        db = get_db()
+    except ConnectionFailure:
+        print("[ERROR] Failed to connect to database")
+        return 1
+
+    counts = backfill(
+        db, batch_size=args.batch_size, refresh=args.refresh,
+        progress=lambda c: print(f"[INFO] {c['scanned']} scanned, {c['updated']} updated", end='\r')
+    )
+    print(f"\n[OK] Snapshots written for {counts['updated']} of {counts['scanned']} certificates")
+
+    if counts['updated']:
+        from http_cache import bump_versions
+        bump_versions('certificates')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
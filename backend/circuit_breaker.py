@@ -0,0 +1,251 @@
+"""
+Circuit Breaker - fail fast and serve degraded reads while MongoDB is unreachable
+After CIRCUIT_FAILURE_THRESHOLD consecutive connection failures the circuit
+opens: requests stop waiting on the driver's timeouts and are answered at once.
+Verification and detail reads are served from last-known-good responses, the
+local ledger file and the entity caches; writes and other reads get 503.
+Once CIRCUIT_RESET_TIMEOUT has passed, one request probes the database with a
+short ping and closes the circuit if it answers.
+"""
+
+from collections import OrderedDict
+from functools import wraps
+import math
+import os
+import threading
+import time
+import pymongo
+from pymongo import monitoring
+from pymongo.errors import ConnectionFailure, PyMongoError
+from flask import request, jsonify, current_app
+from database import get_db
+from tenancy import PerTenant
+
+# Consecutive connection failures that open the circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+
+# Seconds the circuit stays open before the next probe
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_RESET_TIMEOUT', '10'))
+
+# Longest a probe (or the /api/health ping) waits for the database, in seconds
+CIRCUIT_PROBE_TIMEOUT = float(os.environ.get('CIRCUIT_PROBE_TIMEOUT', '2'))
+
+# Seconds /api/health reuses its last database check
+HEALTH_CACHE_TTL = float(os.environ.get('HEALTH_CACHE_TTL', '5'))
+
+# Successful verification and detail responses kept for degraded mode
+LAST_KNOWN_GOOD_SIZE = int(os.environ.get('LAST_KNOWN_GOOD_SIZE', '10000'))
+LAST_KNOWN_GOOD_TTL = float(os.environ.get('LAST_KNOWN_GOOD_TTL', '86400'))
+
+CLOSED, OPEN = 'closed', 'open'
+
+DEGRADED_HEADER = 'X-Degraded'
+
+UNAVAILABLE_MESSAGE = 'Database unavailable; the API is serving verification and detail reads only'
+
+# Routes that never touch the database, so they are served whatever the circuit's state
+DATABASE_FREE_ENDPOINTS = {
+    'health_check', 'metrics_endpoint', 'get_verification_bundles', 'get_verification_bundle_entries', 'static'
+}
+
+class CircuitBreaker:
+    """Tracks whether the database answers; open means requests must not wait on it"""
+
+    def __init__(self, threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                 probe_timeout=CIRCUIT_PROBE_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._health = None
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def is_open(self):
+        return self.state == OPEN
+
+    def allow(self):
+        """
+        Whether a request may use the database. Once the reset timeout has
+        passed, the first caller probes it (for up to probe_timeout) and closes
+        the circuit if it answers; other callers are rejected meanwhile.
+        """
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            if self._probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self._probing = True
+        try:
+            return self._ping() is None
+        finally:
+            self._probing = False
+
+    def _ping(self):
+        """Ping the database within probe_timeout; None on success, else the error"""
+        try:
+            # get_db() reconnects (and pings) when startup could not connect, so it
+            # shares the probe's deadline instead of the full server selection timeout
+            with pymongo.timeout(self.probe_timeout):
+                get_db().command('ping')
+        except PyMongoError as e:
+            self.record_failure()
+            return e
+        self.record_success()
+        return None
+
+    def record_success(self):
+        if self.failures or self.state != CLOSED:
+            with self._lock:
+                if self.state == OPEN:
+                    print("[OK] MongoDB is reachable again, closing the circuit")
+                self.failures = 0
+                self.state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == OPEN or self.failures >= self.threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                    print(f"[WARN] MongoDB failed {self.failures} times in a row, opening the circuit")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def retry_after(self):
+        """Seconds until the next probe"""
+        return max(1, math.ceil(self.reset_timeout - (time.monotonic() - self.opened_at)))
+
+    def health(self):
+        """Database status for /api/health, rechecked at most every HEALTH_CACHE_TTL seconds"""
+        cached = self._health
+        now = time.monotonic()
+        if cached is not None and now - cached[0] < HEALTH_CACHE_TTL:
+            return cached[1]
+        if self.state == OPEN and now - self.opened_at < self.reset_timeout:
+            status = 'unavailable (circuit open)'
+        else:
+            error = self._ping()
+            status = 'connected' if error is None else f'error: {error}'
+        self._health = (now, status)
+        return status
+
+    def stats(self):
+        return {
+            'open': int(self.state == OPEN),
+            'consecutive_failures': self.failures,
+            'opened': self.opened,
+            'rejected': self.rejected
+        }
+
+# Shared circuit breaker used by the API, one per tenant (tenants may use separate clusters)
+breaker = PerTenant(CircuitBreaker)
+
+class LastKnownGood:
+    """
+    Size-bounded LRU of recent successful read responses, keyed by the caller,
+    served in degraded mode. Payloads are shared and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize=LAST_KNOWN_GOOD_SIZE, ttl=LAST_KNOWN_GOOD_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.served = 0
+
+    def remember(self, key, payload):
+        with self._lock:
+            self._entries[key] = (payload, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def recall(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                return None
+            self.served += 1
+            return entry[0]
+
+    def stats(self):
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'served': self.served}
+
+# Shared last-known-good responses used by the API, one per tenant
+last_known_good = PerTenant(LastKnownGood)
+
+# ==================== Responses ====================
+
+def unavailable():
+    """503 while the database is unreachable"""
+    response = jsonify({'error': UNAVAILABLE_MESSAGE})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(breaker.retry_after())
+    return response
+
+def degraded_response(payload, status, source):
+    """A response served without the database; source names where it came from"""
+    response = jsonify(payload)
+    response.status_code = status
+    response.headers[DEGRADED_HEADER] = source
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def degraded_read(fallback):
+    """
+    Decorator for read routes that can answer without the database. While the
+    circuit is open, or when the database fails, fallback(*args, **kwargs)
+    answers instead: a degraded_response(), or None for 503.
+    Place it under @app.route (and @rate_limited, which stays in force while
+    degraded) so it runs before any query.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if breaker.allow():
+                try:
+                    return view(*args, **kwargs)
+                except ConnectionFailure:
+                    breaker.record_failure()
+            return fallback(*args, **kwargs) or unavailable()
+        wrapped.degraded_read = True
+        return wrapped
+    return decorator
+
+# ==================== Flask Hooks ====================
+
+def reject_when_open():
+    """before_request hook: answer at once instead of waiting on an unreachable database"""
+    if request.endpoint in DATABASE_FREE_ENDPOINTS or request.method == 'OPTIONS':
+        return None
+    if getattr(current_app.view_functions.get(request.endpoint), 'degraded_read', False):
+        return None
+    if breaker.allow():
+        return None
+    return unavailable()
+
+def handle_connection_failure(error):
+    """errorhandler for ConnectionFailure: count it towards opening the circuit"""
+    breaker.record_failure()
+    return unavailable()
+
+# ==================== MongoDB Command Listener ====================
+
+class CommandOutcomes(monitoring.CommandListener):
+    """Ends the failure streak on any successful command"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        breaker.record_success()
+
+    def failed(self, event):
+        # Connection errors are counted where they surface as ConnectionFailure
+        pass
@@ -0,0 +1,287 @@
+"""
+Dashboard - the admin, teacher and student dashboards in one request
+Counts, recent activity, pending certificates and per-course summaries come
+from one $facet aggregation per collection, scoped to what the role sees. The
+result is cached briefly per role and user and keyed on the version stamps of
+the collections it reads, so a write shows up on the next load.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+import os
+import threading
+import time
+from database import get_db
+from models import COLLECTIONS, serialize_doc
+from blockchain_utils import get_blockchain_stats
+from certificate_snapshots import resolve_names_many
+from entity_cache import user_cache, course_cache
+from http_cache import version_stamps
+from singleflight import lookups
+from storage_format import ref_query, refs_query
+from tenancy import PerTenant
+
+# Seconds a built dashboard is served before it is rebuilt, even without writes
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', '5'))
+DASHBOARD_CACHE_SIZE = int(os.environ.get('DASHBOARD_CACHE_SIZE', '1000'))
+
+# Items in each recent activity and pending list, and courses summarized
+DASHBOARD_RECENT_LIMIT = int(os.environ.get('DASHBOARD_RECENT_LIMIT', '10'))
+DASHBOARD_COURSE_LIMIT = int(os.environ.get('DASHBOARD_COURSE_LIMIT', '50'))
+
+ROLES = ('admin', 'teacher', 'student')
+
+# Collections a dashboard is built from; their version stamps key the cache and the ETag
+DASHBOARD_COLLECTIONS = ('users', 'courses', 'certificates', 'grades', 'blockchain_transactions')
+
+# Certificates not anchored on the blockchain yet
+PENDING_STATUSES = ('pending', 'issued')
+
+CERTIFICATE_FIELDS = {
+    'certificate_id': 1, 'student_id': 1, 'course_id': 1, 'student_name': 1, 'student_email': 1,
+    'course_name': 1, 'grade': 1, 'score': 1, 'status': 1, 'issue_date': 1, 'created_at': 1
+}
+GRADE_FIELDS = {
+    'student_id': 1, 'course_id': 1, 'grade': 1, 'score': 1, 'certificate_issued': 1,
+    'submission_date': 1, 'updated_at': 1
+}
+
+def _collection(name):
+    return get_db()[COLLECTIONS[name]]
+
+def _count_if(condition):
+    return {'$sum': {'$cond': [condition, 1, 0]}}
+
+def _recent(sort_field, fields):
+    return [{'$sort': {sort_field: -1}}, {'$limit': DASHBOARD_RECENT_LIMIT}, {'$project': fields}]
+
+def _first(facet, default):
+    return facet[0] if facet else default
+
+# ==================== Aggregations ====================
+
+def _certificate_facets(match):
+    pending = {'$in': ['$status', list(PENDING_STATUSES)]}
+    result = next(_collection('certificates').aggregate([
+        {'$match': match},
+        {'$facet': {
+            'by_status': [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}],
+            'recent': _recent('created_at', CERTIFICATE_FIELDS),
+            'pending': [
+                {'$match': {'status': {'$in': list(PENDING_STATUSES)}}},
+                {'$sort': {'created_at': 1}},
+                {'$limit': DASHBOARD_RECENT_LIMIT},
+                {'$project': CERTIFICATE_FIELDS}
+            ],
+            'per_course': [
+                {'$group': {
+                    '_id': {'$toString': '$course_id'},
+                    'certificates': {'$sum': 1},
+                    'verified': _count_if({'$eq': ['$status', 'verified']}),
+                    'pending': _count_if(pending)
+                }},
+                {'$sort': {'certificates': -1}},
+                {'$limit': DASHBOARD_COURSE_LIMIT}
+            ]
+        }}
+    ]))
+    by_status = {}
+    for entry in result['by_status']:
+        status = entry['_id'] or 'pending'
+        by_status[status] = by_status.get(status, 0) + entry['count']
+    return by_status, result
+
+def _grade_facets(match):
+    awaiting = {'$and': [{'$ne': ['$grade', None]}, {'$ne': ['$certificate_issued', True]}]}
+    return next(_collection('grades').aggregate([
+        {'$match': match},
+        {'$facet': {
+            'summary': [{'$group': {
+                '_id': None,
+                'grades': {'$sum': 1},
+                'average_score': {'$avg': '$score'},
+                'awaiting_certificate': _count_if(awaiting)
+            }}],
+            'students': [{'$group': {'_id': {'$toString': '$student_id'}}}, {'$count': 'count'}],
+            'recent': _recent('updated_at', GRADE_FIELDS),
+            'per_course': [
+                {'$group': {
+                    '_id': {'$toString': '$course_id'},
+                    'grades': {'$sum': 1},
+                    'average_score': {'$avg': '$score'},
+                    'awaiting_certificate': _count_if(awaiting)
+                }},
+                {'$sort': {'grades': -1}},
+                {'$limit': DASHBOARD_COURSE_LIMIT}
+            ]
+        }}
+    ]))
+
+def _user_facets():
+    return next(_collection('users').aggregate([
+        {'$facet': {
+            'by_role': [{'$group': {'_id': '$role', 'count': {'$sum': 1}}}],
+            'recent': _recent('created_at', {'email': 1, 'name': 1, 'role': 1, 'created_at': 1})
+        }}
+    ]))
+
+# ==================== Building ====================
+
+def _certificates_out(certificates):
+    items = []
+    for certificate, names in zip(certificates, resolve_names_many(certificates)):
+        certificate = serialize_doc(dict(certificate, **names))
+        certificate.setdefault('status', 'pending')
+        items.append(certificate)
+    return items
+
+def _grades_out(grades):
+    students = user_cache.get_many(grade.get('student_id') for grade in grades)
+    courses = course_cache.get_many(grade.get('course_id') for grade in grades)
+    items = []
+    for grade in grades:
+        student = students.get(str(grade.get('student_id')))
+        course = courses.get(str(grade.get('course_id')))
+        grade = serialize_doc(grade)
+        grade['student_name'] = student['name'] if student else None
+        grade['course_name'] = course['name'] if course else None
+        items.append(grade)
+    return items
+
+def _course_summaries(certificates, grades, courses):
+    """Merge the per-course facets, naming courses from `courses` ({id: doc}) or the course cache"""
+    summaries = {}
+    for entry in certificates:
+        summaries[entry['_id']] = {'certificates': entry['certificates'], 'verified': entry['verified'],
+                                   'pending': entry['pending']}
+    for entry in grades:
+        summary = summaries.setdefault(entry['_id'], {'certificates': 0, 'verified': 0, 'pending': 0})
+        summary.update(grades=entry['grades'], average_score=entry['average_score'],
+                       awaiting_certificate=entry['awaiting_certificate'])
+    for course_id in courses:
+        summaries.setdefault(course_id, {'certificates': 0, 'verified': 0, 'pending': 0})
+
+    missing = [course_id for course_id in summaries if course_id not in courses]
+    courses = {**courses, **course_cache.get_many(missing)}
+    ordered = sorted(summaries.items(), key=lambda item: (-item[1]['certificates'], -item[1].get('grades', 0)))
+    result = []
+    for course_id, summary in ordered[:DASHBOARD_COURSE_LIMIT]:
+        course = courses.get(course_id)
+        result.append({
+            'id': course_id,
+            'name': course['name'] if course else None,
+            'certificates': summary['certificates'],
+            'verified': summary['verified'],
+            'pending': summary['pending'],
+            'grades': summary.get('grades', 0),
+            'average_score': summary.get('average_score'),
+            'awaiting_certificate': summary.get('awaiting_certificate', 0)
+        })
+    return result
+
+def build_dashboard(role, user_id=None):
+    """
+    Dashboard for a role: the whole institution for admins, a teacher's own
+    courses, or a student's own certificates and grades
+    """
+    counts = {}
+    courses = {}
+    if role == 'admin':
+        scope = {}
+        counts['courses'] = _collection('courses').count_documents({})
+    elif role == 'teacher':
+        courses = {str(course['_id']): course
+                   for course in _collection('courses').find({'instructor_id': ref_query(user_id)}, {'name': 1})}
+        scope = {'course_id': refs_query(courses)}
+        counts['courses'] = len(courses)
+    else:
+        scope = {'student_id': ref_query(user_id)}
+
+    by_status, certificates = _certificate_facets(scope)
+    grades = _grade_facets(scope)
+    summary = _first(grades['summary'], {'grades': 0, 'average_score': None, 'awaiting_certificate': 0})
+
+    counts.update(
+        certificates=sum(by_status.values()),
+        certificates_by_status=by_status,
+        pending_certificates=sum(by_status.get(status, 0) for status in PENDING_STATUSES),
+        grades=summary['grades'],
+        average_score=summary['average_score'],
+        awaiting_certificate=summary['awaiting_certificate']
+    )
+    dashboard = {
+        'role': role,
+        'user_id': user_id,
+        'generated_at': datetime.utcnow().isoformat(),
+        'counts': counts,
+        'blockchain': get_blockchain_stats(),
+        'recent_certificates': _certificates_out(certificates['recent']),
+        'pending_certificates': _certificates_out(certificates['pending']),
+        'recent_grades': _grades_out(grades['recent']),
+        'courses': _course_summaries(certificates['per_course'], grades['per_course'], courses)
+    }
+
+    if role == 'admin':
+        users = _user_facets()
+        counts['users'] = {entry['_id']: entry['count'] for entry in users['by_role']}
+        dashboard['recent_users'] = [serialize_doc(user) for user in users['recent']]
+    elif role == 'teacher':
+        counts['students'] = _first(grades['students'], {'count': 0})['count']
+    else:
+        counts['courses'] = len(dashboard['courses'])
+    return dashboard
+
+# ==================== Cache ====================
+
+class DashboardCache:
+    """
+    Built dashboards per (role, user), valid while the version stamps of
+    DASHBOARD_COLLECTIONS are unchanged and for at most `ttl` seconds.
+    Concurrent misses for the same dashboard share one build.
+    """
+
+    def __init__(self, maxsize=DASHBOARD_CACHE_SIZE, ttl=DASHBOARD_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, role, user_id=None):
+        """The dashboard for a role (and user); shared between requests, so read-only"""
+        key = (role, user_id)
+        stamps = version_stamps.current(DASHBOARD_COLLECTIONS)
+        versions = tuple(stamps[name][0] for name in DASHBOARD_COLLECTIONS)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == versions and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        dashboard = lookups.do(('dashboard', role, user_id, versions), build_dashboard, role, user_id)
+        with self._lock:
+            self._entries[key] = (versions, dashboard, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return dashboard
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Size and hit statistics"""
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+# Shared dashboard cache used by the API, one per tenant
+dashboard_cache = PerTenant(DashboardCache)
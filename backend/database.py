@@ -2,10 +2,19 @@
 MongoDB Database Connection for ChainLearn
 """
 
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, MongoClient, monitoring
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from datetime import datetime
 import certifi
+import contextvars
+import json
+import logging
+import logging.handlers
 import os
+import queue
+import random
+import threading
+import time
 
 # MongoDB connection string
 MONGODB_URI = os.environ.get(
@@ -14,26 +23,110 @@ MONGODB_URI = os.environ.get(
 )
 
 # Database name
-DB_NAME = 'chainlearn'
+DB_NAME = os.environ.get('MONGODB_DB_NAME', 'chainlearn')
+
+# TLS is required by Atlas; set MONGODB_TLS=0 for a local mongod
+MONGODB_TLS = os.environ.get('MONGODB_TLS', '1') == '1'
+
+# Institutions hosted on this deployment (comma-separated IDs). Each tenant has its
+# own database, <MONGODB_DB_NAME>_<tenant>; MONGODB_URI_<TENANT> places it on another
+# cluster. Empty: a single-institution deployment on MONGODB_DB_NAME
+TENANTS = [tenant.strip() for tenant in os.environ.get('TENANTS', '').split(',') if tenant.strip()]
+
+# Connections each tenant's client may hold, so one tenant cannot starve the others' pools
+TENANT_MAX_POOL_SIZE = int(os.environ.get('TENANT_MAX_POOL_SIZE', '20'))
+
+# Tenant whose database get_db() returns; set per request by tenancy.py. Scripts
+# (seed_data.py, ledger_store.py, ...) run against the tenant in CHAINLEARN_TENANT
+current_tenant = contextvars.ContextVar('chainlearn_tenant', default=os.environ.get('CHAINLEARN_TENANT') or None)
 
 # Global database connection
 client = None
 db = None
 
-def init_db():
-    """Initialize MongoDB connection"""
-    global client, db
-    try:
-        client = MongoClient(
-            MONGODB_URI,
-            serverSelectionTimeoutMS=15000,
+# Per-tenant connections: {tenant: (client, database)}
+tenant_connections = {}
+_tenant_lock = threading.Lock()
+
+# Async connection used by the ASGI handlers (asgi.py), bound to the server's event loop
+async_client = None
+async_db = None
+
+# Per-tenant async connections: {tenant: (client, database)}
+async_tenant_connections = {}
+
+# Driver timeouts in milliseconds: finding a server, opening a connection, and
+# waiting on a reply. The circuit breaker (circuit_breaker.py) stops requests
+# from waiting on them once MongoDB is known to be unreachable
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '15000'))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGODB_CONNECT_TIMEOUT_MS', '15000'))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGODB_SOCKET_TIMEOUT_MS', '20000'))
+
+# pymongo event listeners (command/pool monitoring) attached to every client
+EVENT_LISTENERS = []
+
+# Listeners that are also safe on the async client. Listeners that attribute
+# events to the request running on the current thread are not: every async
+# request runs on the event loop thread.
+ASYNC_EVENT_LISTENERS = []
+
+def add_event_listener(listener, include_async=False):
+    """Register a pymongo event listener; must be called before init_db()"""
+    EVENT_LISTENERS.append(listener)
+    if include_async:
+        ASYNC_EVENT_LISTENERS.append(listener)
+
+def _client_options(listeners):
+    options = {
+        'serverSelectionTimeoutMS': MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        'connectTimeoutMS': MONGODB_CONNECT_TIMEOUT_MS,
+        'socketTimeoutMS': MONGODB_SOCKET_TIMEOUT_MS,
+    }
+    if listeners:
+        options['event_listeners'] = list(listeners)
+    if MONGODB_TLS:
+        options.update(
             tls=True,
             tlsCAFile=certifi.where(),
             tlsAllowInvalidCertificates=True,
             tlsAllowInvalidHostnames=True,
-            connectTimeoutMS=15000,
-            socketTimeoutMS=20000,
         )
+    return options
+
+def create_client(uri=MONGODB_URI, **options):
+    """
+    Create a MongoDB client
+    A mongomock:// URI gives an in-memory stand-in (requires mongomock), used by benchmarks
+    """
+    if uri.startswith('mongomock://'):
+        import mongomock
+        return mongomock.MongoClient()
+    
+    return MongoClient(uri, **_client_options(EVENT_LISTENERS), **options)
+
+def create_async_client(uri=MONGODB_URI, **options):
+    """
+    Create an async MongoDB client (pymongo's AsyncMongoClient)
+    mongomock has no async API, so a mongomock:// URI is rejected
+    """
+    if uri.startswith('mongomock://'):
+        raise ValueError('The async MongoDB client needs a real MongoDB server')
+    return AsyncMongoClient(uri, **_client_options(ASYNC_EVENT_LISTENERS), **options)
+
+def tenant_db_name(tenant):
+    """Database holding a tenant's data (MONGODB_DB_NAME without a tenant)"""
+    return DB_NAME if tenant is None else f'{DB_NAME}_{tenant}'
+
+def tenant_uri(tenant):
+    """Connection string for a tenant: MONGODB_URI_<TENANT> if set, else MONGODB_URI"""
+    variable = 'MONGODB_URI_' + ''.join(c if c.isalnum() else '_' for c in tenant).upper()
+    return os.environ.get(variable, MONGODB_URI)
+
+def init_db():
+    """Initialize MongoDB connection"""
+    global client, db
+    try:
+        client = create_client()
         # Test the connection
         client.admin.command('ping')
         db = client[DB_NAME]
@@ -41,21 +134,91 @@ def init_db():
         return True
     except (ConnectionFailure, ServerSelectionTimeoutError) as e:
         print(f"[ERROR] Failed to connect to MongoDB: {e}")
+        # The circuit breaker's probe retries, so do not leave this client's monitors running
+        if client is not None:
+            client.close()
+            client = None
         return False
 
 def get_db():
-    """Get database instance"""
+    """
+    Get the database instance of the current tenant. Raises ConnectionFailure
+    while MongoDB cannot be reached, so callers fail the way a query would
+    (and the circuit breaker counts it).
+    """
     global db
-    if db is None:
-        init_db()
+    tenant = current_tenant.get()
+    if tenant is not None:
+        return get_tenant_db(tenant)
+    if db is None and not init_db():
+        raise ConnectionFailure('No connection to MongoDB')
     return db
 
+def get_tenant_db(tenant):
+    """Database of a tenant, on a client of its own (connects lazily)"""
+    connection = tenant_connections.get(tenant)
+    if connection is None:
+        with _tenant_lock:
+            connection = tenant_connections.get(tenant)
+            if connection is None:
+                tenant_client = create_client(tenant_uri(tenant), maxPoolSize=TENANT_MAX_POOL_SIZE)
+                connection = (tenant_client, tenant_client[tenant_db_name(tenant)])
+                tenant_connections[tenant] = connection
+    return connection[1]
+
 def close_db():
     """Close database connection"""
     global client
     if client:
         client.close()
         print("MongoDB connection closed")
+    for tenant_client, _ in tenant_connections.values():
+        tenant_client.close()
+    tenant_connections.clear()
+
+async def init_async_db():
+    """Initialize the async MongoDB connection; call from the event loop that will use it"""
+    global async_client, async_db
+    try:
+        candidate = create_async_client()
+        await candidate.admin.command('ping')
+    except (ConnectionFailure, ServerSelectionTimeoutError, ValueError) as e:
+        print(f"[ERROR] Failed to connect async MongoDB client: {e}")
+        return False
+    async_client = candidate
+    async_db = async_client[DB_NAME]
+    print(f"[OK] Async client connected to MongoDB database: {DB_NAME}")
+    return True
+
+async def get_async_tenant_db(tenant):
+    """Async database of a tenant; None if its server cannot be reached"""
+    connection = async_tenant_connections.get(tenant)
+    if connection is None:
+        try:
+            candidate = create_async_client(tenant_uri(tenant), maxPoolSize=TENANT_MAX_POOL_SIZE)
+            await candidate.admin.command('ping')
+        except (ConnectionFailure, ServerSelectionTimeoutError, ValueError) as e:
+            print(f"[ERROR] Failed to connect async MongoDB client for tenant {tenant}: {e}")
+            return None
+        # Another request may have connected first while this one awaited the ping
+        if tenant in async_tenant_connections:
+            await candidate.close()
+        else:
+            async_tenant_connections[tenant] = (candidate, candidate[tenant_db_name(tenant)])
+        connection = async_tenant_connections[tenant]
+    return connection[1]
+
+async def close_async_db():
+    """Close the async database connection"""
+    global async_client, async_db
+    if async_client:
+        await async_client.close()
+        async_client = None
+        async_db = None
+        print("Async MongoDB connection closed")
+    for tenant_client, _ in list(async_tenant_connections.values()):
+        await tenant_client.close()
+    async_tenant_connections.clear()
 
 def print_admin_debug():
     """Print admin user debug info for troubleshooting login issues"""
@@ -70,3 +233,171 @@ def print_admin_debug():
     else:
         print("[DEBUG] Admin user NOT found in DB!")
 
+# ==================== Slow-Query Diagnostics ====================
+
+# Commands slower than this are logged with their explain() plan (0 disables the diagnostic mode)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '0'))
+SLOW_QUERY_LOG = os.environ.get(
+    'SLOW_QUERY_LOG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'slow_queries.log')
+)
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', '1'))
+SLOW_QUERY_EXPLAINS_PER_MINUTE = int(os.environ.get('SLOW_QUERY_EXPLAINS_PER_MINUTE', '10'))
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get('SLOW_QUERY_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', '5'))
+
+# Commands that can be re-run under explain
+EXPLAINABLE_COMMANDS = {'find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify'}
+
+# Session/transport fields that must not be passed back into explain
+_COMMAND_ENVELOPE = {'lsid', '$clusterTime', '$db', 'txnNumber', 'autocommit', 'startTransaction',
+                     '$readPreference', 'signature', 'apiVersion', 'apiStrict', 'apiDeprecationErrors'}
+
+def query_shape(value):
+    """Replace literal values with their type names so similar queries group together"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return type(value).__name__
+
+def _summarize_plan(stage):
+    """Render a winning plan as 'FETCH > IXSCAN(field_1)'"""
+    parts = []
+    while isinstance(stage, dict):
+        name = stage.get('stage', '?')
+        if stage.get('indexName'):
+            name += f"({stage['indexName']})"
+        parts.append(name)
+        stage = stage.get('inputStage') or (stage.get('inputStages') or [None])[0]
+    return ' > '.join(parts)
+
+def _request_route():
+    """Endpoint of the Flask request running on this thread, if any"""
+    try:
+        from flask import has_request_context, request
+    except ImportError:
+        return None
+    if has_request_context():
+        return f'{request.method} {request.endpoint or request.path}'
+    return None
+
+class SlowQueryListener(monitoring.CommandListener):
+    """
+    Times every command; slow ones are sampled and, within a per-minute budget,
+    re-run with explain('executionStats') on a background thread so the
+    request that hit the slow query is not delayed further.
+    """
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, sample_rate=SLOW_QUERY_SAMPLE_RATE,
+                 explains_per_minute=SLOW_QUERY_EXPLAINS_PER_MINUTE, log_path=SLOW_QUERY_LOG):
+        self.threshold_micros = threshold_ms * 1000
+        self.sample_rate = sample_rate
+        self.explains_per_minute = explains_per_minute
+        self._pending = {}
+        self._explain_times = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=100)
+        self._worker = None
+
+        self.logger = logging.getLogger('chainlearn.slow_queries')
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=SLOW_QUERY_LOG_MAX_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def started(self, event):
+        if event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        command = {key: value for key, value in event.command.items() if key not in _COMMAND_ENVELOPE}
+        self._pending[(event.connection_id, event.request_id)] = (
+            event.database_name, command, _request_route()
+        )
+
+    def succeeded(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None or event.duration_micros < self.threshold_micros:
+            return
+        if random.random() >= self.sample_rate:
+            return
+        self._record(event, *pending)
+
+    def failed(self, event):
+        self._pending.pop((event.connection_id, event.request_id), None)
+
+    def _allow_explain(self):
+        now = time.monotonic()
+        with self._lock:
+            self._explain_times = [t for t in self._explain_times if now - t < 60]
+            if len(self._explain_times) >= self.explains_per_minute:
+                return False
+            self._explain_times.append(now)
+            return True
+
+    def _record(self, event, database_name, command, route):
+        command_name = event.command_name
+        entry = {
+            'time': datetime.utcnow().isoformat(),
+            'command': command_name,
+            'collection': command.get(command_name),
+            'duration_ms': round(event.duration_micros / 1000, 3),
+            'route': route,
+            'filter_shape': query_shape(
+                command.get('filter') or command.get('query') or command.get('pipeline')
+                or [u.get('q') for u in command.get('updates', command.get('deletes', []))]
+            ),
+        }
+        if self._allow_explain():
+            try:
+                self._queue.put_nowait((database_name, command, entry))
+                self._ensure_worker()
+                return
+            except queue.Full:
+                pass
+        entry['explain'] = 'skipped (rate limited)'
+        self._write(entry)
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._explain_loop, name='slow-query-explain', daemon=True)
+            self._worker.start()
+
+    def _explain_loop(self):
+        while True:
+            database_name, command, entry = self._queue.get()
+            try:
+                # Tenant databases may live on another cluster
+                explain_client = next((tenant_client for tenant_client, tenant_db in list(tenant_connections.values())
+                                       if tenant_db.name == database_name), client)
+                result = explain_client[database_name].command(
+                    {'explain': command, 'verbosity': 'executionStats'}
+                )
+                stats = result.get('executionStats', {})
+                entry.update({
+                    'plan': _summarize_plan(result.get('queryPlanner', {}).get('winningPlan')),
+                    'keys_examined': stats.get('totalKeysExamined'),
+                    'docs_examined': stats.get('totalDocsExamined'),
+                    'docs_returned': stats.get('nReturned'),
+                    'explain_ms': stats.get('executionTimeMillis'),
+                })
+            except Exception as e:
+                # Diagnostics must never take the worker down
+                entry['explain_error'] = str(e)
+            self._write(entry)
+
+    def _write(self, entry):
+        self.logger.info(json.dumps(entry, default=str))
+
+if SLOW_QUERY_MS > 0:
+    # Keyed by connection and request id, so it also works on the async client
+    add_event_listener(SlowQueryListener(), include_async=True)
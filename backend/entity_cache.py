@@ -0,0 +1,128 @@
+"""
+Entity Cache - process-local read-through cache for users and courses by _id
+Write routes invalidate entries; a short TTL bounds staleness across workers
+"""
+
+from collections import OrderedDict
+import os
+import threading
+import time
+from bson import ObjectId
+from bson.errors import InvalidId
+from database import get_db
+from models import COLLECTIONS
+from tenancy import PerTenant
+
+# Configuration
+ENTITY_CACHE_SIZE = int(os.environ.get('ENTITY_CACHE_SIZE', '10000'))
+ENTITY_CACHE_TTL = float(os.environ.get('ENTITY_CACHE_TTL', '60'))
+
+def _as_object_id(entity_id):
+    if isinstance(entity_id, ObjectId):
+        return entity_id
+    if not entity_id:
+        return None
+    try:
+        return ObjectId(entity_id)
+    except (InvalidId, TypeError):
+        return None
+
+class EntityCache:
+    """
+    Size-bounded LRU cache of raw documents from one collection.
+    Callers receive shallow copies, so serialize_doc() may mutate them freely.
+    """
+
+    def __init__(self, collection_name, maxsize=ENTITY_CACHE_SIZE, ttl=ENTITY_CACHE_TTL):
+        self.collection_name = collection_name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _collection(self):
+        return get_db()[COLLECTIONS[self.collection_name]]
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        doc, expires_at = entry
+        if expires_at < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return doc
+
+    def _put(self, key, doc, now):
+        self._entries[key] = (doc, now + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, entity_id):
+        """Get one document by _id (ObjectId or string), or None"""
+        key = _as_object_id(entity_id)
+        if key is None:
+            return None
+        return self.get_many([key]).get(str(key))
+
+    def get_many(self, entity_ids):
+        """Get documents for many _ids with at most one query; returns {str(_id): doc}"""
+        found, missing = self.peek_many(entity_ids)
+        if missing:
+            docs = list(self._collection().find({'_id': {'$in': missing}}))
+            found.update(self.put_many(docs))
+        return found
+
+    def peek_many(self, entity_ids):
+        """
+        Look up cached documents without querying.
+        Returns ({str(_id): doc} for cached entries, [ObjectId] still to be fetched);
+        callers with their own client (e.g. the async handlers) fetch the rest and put_many() them.
+        """
+        keys = {key for key in map(_as_object_id, entity_ids) if key is not None}
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                doc = self._lookup(key, now)
+                if doc is not None:
+                    found[str(key)] = dict(doc)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found, [key for key in keys if str(key) not in found]
+
+    def put_many(self, docs):
+        """Cache freshly fetched documents; returns {str(_id): doc}"""
+        now = time.monotonic()
+        with self._lock:
+            for doc in docs:
+                self._put(doc['_id'], doc, now)
+        return {str(doc['_id']): dict(doc) for doc in docs}
+
+    def invalidate(self, entity_id):
+        """Drop a document after it was changed or deleted"""
+        key = _as_object_id(entity_id)
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop all cached documents"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Size and hit statistics"""
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+# Shared caches used by the API, one per tenant
+user_cache = PerTenant(lambda: EntityCache('users'))
+course_cache = PerTenant(lambda: EntityCache('courses'))
@@ -0,0 +1,342 @@
+"""
+Bulk Grade Import - stream a CSV or NDJSON grade sheet into the grades collection
+Rows are parsed one at a time, validated, and written in chunks: one batched
+$in query resolves the chunk's student emails and one unordered bulk_write
+upserts its grades keyed on (student_id, course_id), the same key
+POST /api/grades uses.
+
+Columns (CSV header or NDJSON keys):
+    student_email or student_id, course_id (unless given for the whole file),
+    grade, score, feedback
+
+Examples:
+    python grade_import.py grades.csv --course-id 65f0c2...   # every row is for one course
+    python grade_import.py grades.ndjson --errors errors.ndjson
+"""
+
+import argparse
+import codecs
+import csv
+from datetime import datetime
+import json
+import math
+import os
+import sys
+from bson import ObjectId
+import msgspec
+from pymongo import UpdateOne
+from models import COLLECTIONS
+from entity_cache import course_cache
+from storage_format import pack_ref, ref_query
+from schemas import import_row_decoder
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Row errors kept in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ('csv', 'ndjson')
+
+class ImportAborted(Exception):
+    """The file cannot be parsed any further (bad header, encoding or CSV syntax)"""
+
+    def __init__(self, line, message):
+        super().__init__(f'line {line}: {message}')
+        self.line = line
+        self.message = message
+
+def detect_format(filename=None, content_type=None):
+    """'csv' or 'ndjson' from a file name or MIME type; None if neither says"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.csv', '.ndjson', '.jsonl'):
+        return 'csv' if extension == '.csv' else 'ndjson'
+    mimetype = (content_type or '').split(';')[0].strip().lower()
+    if mimetype in ('text/csv', 'application/csv'):
+        return 'csv'
+    if mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/jsonlines'):
+        return 'ndjson'
+    return None
+
+# ==================== Parsing ====================
+
+def _text_lines(stream):
+    """Decode a binary stream line by line (a UTF-8 BOM is dropped)"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    for line in stream:
+        yield decoder.decode(line)
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+def iter_csv(stream):
+    """Yield (line number, row dict) from a binary CSV stream"""
+    reader = csv.DictReader(_text_lines(stream))
+    try:
+        header = [name.strip().lower() for name in reader.fieldnames or []]
+        if 'student_email' not in header and 'student_id' not in header:
+            raise ImportAborted(1, 'Header needs a student_email or student_id column')
+        reader.fieldnames = header
+        for row in reader:
+            if None in row:
+                yield reader.line_num, ValueError('More values than header columns')
+            elif any(value and value.strip() for value in row.values()):
+                yield reader.line_num, row
+    except csv.Error as e:
+        raise ImportAborted(reader.line_num, f'Malformed CSV: {e}')
+    except UnicodeDecodeError:
+        raise ImportAborted(reader.line_num + 1, 'File is not UTF-8 encoded')
+
+def iter_ndjson(stream):
+    """
+    Yield (line number, row dict) from a binary NDJSON stream. Each line is
+    parsed and type-checked in one pass, so a line that is not a flat JSON
+    object is rejected by the decoder itself.
+    """
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = import_row_decoder.decode(line)
+        except UnicodeDecodeError:
+            raise ImportAborted(number, 'File is not UTF-8 encoded')
+        except msgspec.ValidationError as e:
+            yield number, ValueError(f'Expected a flat JSON object: {e}')
+            continue
+        except msgspec.DecodeError as e:
+            yield number, ValueError(f'Invalid JSON: {e}')
+            continue
+        yield number, {key.lower(): value for key, value in row.items()}
+
+def iter_rows(stream, fmt):
+    if fmt == 'csv':
+        return iter_csv(stream)
+    if fmt == 'ndjson':
+        return iter_ndjson(stream)
+    raise ValueError(f'Unsupported format: {fmt}')
+
+# ==================== Validation ====================
+
+def _text(value):
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+def _score(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, bool):
+        raise ValueError('score must be a number')
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('score must be a number')
+    if not math.isfinite(score):
+        raise ValueError('score must be a number')
+    return int(score) if score.is_integer() else score
+
+def validate_row(row, default_course_id=None):
+    """
+    Check one parsed row. Returns (student key, course_id, fields): the student
+    key is ('email', value) or ('id', value), and fields holds the grade fields
+    present in the row. Raises ValueError with a message for the report.
+    """
+    student_id = _text(row.get('student_id'))
+    student_email = _text(row.get('student_email'))
+    if student_id:
+        if not ObjectId.is_valid(student_id):
+            raise ValueError('student_id is not a valid ID')
+        student = ('id', str(ObjectId(student_id)))
+    elif student_email:
+        student = ('email', student_email)
+    else:
+        raise ValueError('student_email or student_id is required')
+
+    course_id = _text(row.get('course_id')) or default_course_id
+    if not course_id:
+        raise ValueError('course_id is required')
+    if not ObjectId.is_valid(course_id):
+        raise ValueError('course_id is not a valid ID')
+
+    fields = {}
+    if _text(row.get('grade')) is not None:
+        fields['grade'] = _text(row['grade'])
+    score = _score(row.get('score'))
+    if score is not None:
+        fields['score'] = score
+    # Blank cells leave the stored value alone
+    if _text(row.get('feedback')) is not None:
+        fields['feedback'] = _text(row['feedback'])
+    if 'grade' not in fields and 'score' not in fields:
+        raise ValueError('grade or score is required')
+    return student, str(ObjectId(course_id)), fields
+
+# ==================== Writing ====================
+
+def _resolve_students(users_collection, keys):
+    """
+    Look up the students of one chunk with a single query.
+    Returns ({student key: student _id string}, {student _id string: role}).
+    """
+    emails = [value for kind, value in keys if kind == 'email']
+    ids = [ObjectId(value) for kind, value in keys if kind == 'id']
+    clauses = []
+    if emails:
+        clauses.append({'email': {'$in': emails}})
+    if ids:
+        clauses.append({'_id': {'$in': ids}})
+    if not clauses:
+        return {}, {}
+
+    resolved = {}
+    roles = {}
+    for user in users_collection.find({'$or': clauses}, {'email': 1, 'role': 1}):
+        user_id = str(user['_id'])
+        roles[user_id] = user.get('role')
+        resolved[('id', user_id)] = user_id
+        if user.get('email'):
+            resolved[('email', user['email'])] = user_id
+    return resolved, roles
+
+def write_chunk(db, rows, report):
+    """
+    Resolve and upsert one chunk of validated rows
+    [(line, student key, course_id, fields)], updating report in place.
+    """
+    resolved, roles = _resolve_students(db[COLLECTIONS['users']], {student for _, student, _, _ in rows})
+    courses = course_cache.get_many({course_id for _, _, course_id, _ in rows})
+
+    # Later rows for the same student and course win
+    grades = {}
+    for line, student, course_id, fields in rows:
+        student_id = resolved.get(student)
+        if student_id is None:
+            _add_error(report, line, f'Unknown student {student[1]}')
+        elif roles.get(student_id) != 'student':
+            _add_error(report, line, f'{student[1]} is not a student')
+        elif course_id not in courses:
+            _add_error(report, line, f'Unknown course {course_id}')
+        else:
+            grades.setdefault((student_id, course_id), {}).update(fields)
+
+    if not grades:
+        return
+
+    now = datetime.utcnow()
+    operations = []
+    for (student_id, course_id), fields in grades.items():
+        # Same defaults as POST /api/grades for a new grade
+        on_insert = {'student_id': pack_ref(student_id), 'course_id': pack_ref(course_id),
+                     'submission_date': now, 'created_at': now}
+        on_insert.update({field: None for field in ('grade', 'score') if field not in fields})
+        if 'feedback' not in fields:
+            on_insert['feedback'] = ''
+        operations.append(UpdateOne(
+            {'student_id': ref_query(student_id), 'course_id': ref_query(course_id)},
+            {
+                '$set': {**fields, 'certificate_issued': False, 'updated_at': now},
+                '$setOnInsert': on_insert
+            },
+            upsert=True
+        ))
+
+    result = db[COLLECTIONS['grades']].bulk_write(operations, ordered=False)
+    report['inserted'] += result.upserted_count
+    report['updated'] += result.matched_count
+
+def _add_error(report, line, message):
+    report['error_count'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({'line': line, 'error': message})
+
+def import_grades(db, stream, fmt, course_id=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Import a grade sheet from a binary stream without reading it whole.
+    Chunks are written as they fill, so if parsing is aborted the rows before
+    the bad line are already imported; the report says where it stopped.
+    Returns {'rows', 'inserted', 'updated', 'error_count', 'errors', 'aborted'}.
+    """
+    if course_id is not None and not ObjectId.is_valid(course_id):
+        raise ValueError('course_id is not a valid ID')
+
+    report = {'rows': 0, 'inserted': 0, 'updated': 0, 'error_count': 0, 'errors': [], 'aborted': None}
+    chunk = []
+
+    def flush():
+        if chunk:
+            write_chunk(db, chunk, report)
+            chunk.clear()
+        if progress:
+            progress(report)
+
+    try:
+        for line, row in iter_rows(stream, fmt):
+            report['rows'] += 1
+            if isinstance(row, Exception):
+                _add_error(report, line, str(row))
+                continue
+            try:
+                chunk.append((line, *validate_row(row, course_id)))
+            except ValueError as e:
+                _add_error(report, line, str(e))
+                continue
+            if len(chunk) >= chunk_size:
+                flush()
+    except ImportAborted as e:
+        report['aborted'] = {'line': e.line, 'error': e.message}
+    flush()
+    # Resolution errors are found after the chunk's parse errors
+    report['errors'].sort(key=lambda entry: entry['line'])
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import grades from a CSV or NDJSON file')
+    parser.add_argument('path', help='Grade sheet to import')
+    parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file extension)')
+    parser.add_argument('--course-id', help='Course for rows without a course_id column')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per bulk_write')
+    parser.add_argument('--errors', help='Write row errors to this NDJSON file')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or detect_format(args.path)
+    if fmt is None:
+        parser.error('cannot tell the format from the file name; pass --format')
+
+    from database import init_db, get_db
+
+    if not init_db():
+        print("[ERROR] Failed to connect to database")
+        return 1
+
+    def progress(report):
+        print(f"[INFO] {report['rows']} rows, {report['inserted']} inserted, {report['updated']} updated, "
+              f"{report['error_count']} errors", end='\r')
+
+    with open(args.path, 'rb') as stream:
+        report = import_grades(get_db(), stream, fmt, course_id=args.course_id,
+                               chunk_size=args.chunk_size, progress=progress)
+
+    if report['inserted'] or report['updated']:
+        from http_cache import bump_versions
+        bump_versions('grades')
+
+    print(f"\n[OK] Imported {report['inserted'] + report['updated']} grades from {report['rows']} rows "
+          f"({report['inserted']} new, {report['updated']} updated)")
+    if report['errors']:
+        if args.errors:
+            with open(args.errors, 'w') as f:
+                for entry in report['errors']:
+                    f.write(json.dumps(entry) + '\n')
+            print(f"[WARN] {report['error_count']} rows skipped, see {args.errors}")
+        else:
+            print(f"[WARN] {report['error_count']} rows skipped:")
+            for entry in report['errors']:
+                print(f"     line {entry['line']}: {entry['error']}")
+        if report['error_count'] > len(report['errors']):
+            print(f"     ... only the first {MAX_REPORTED_ERRORS} errors are listed")
+    if report['aborted']:
+        print(f"[ERROR] Stopped at line {report['aborted']['line']}: {report['aborted']['error']}")
+        return 1
+    return 2 if report['error_count'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+HTTP Conditional Requests - per-collection version stamps, strong ETags and gzip
+Unchanged list and detail responses are answered with 304 before any query runs
+"""
+
+from datetime import datetime, timedelta
+from functools import wraps
+import gzip
+import hashlib
+import os
+import threading
+import time
+from flask import request, make_response
+from pymongo import ReturnDocument
+from database import get_db, current_tenant
+from models import COLLECTIONS
+from tenancy import PerTenant
+
+# Seconds a worker trusts its copy of the version stamps before re-reading them,
+# i.e. the longest another worker's write can go unnoticed
+VERSION_STAMP_TTL = float(os.environ.get('VERSION_STAMP_TTL', '1'))
+
+# JSON bodies smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))
+
+# Suffix that distinguishes the ETag of the gzip representation
+GZIP_ETAG_SUFFIX = '-gzip'
+
+class VersionStamps:
+    """
+    Version counters per collection, stored in MongoDB so all workers agree.
+    Every write route bumps the stamps of the collections it changes.
+    """
+
+    def __init__(self, ttl=VERSION_STAMP_TTL):
+        self.ttl = ttl
+        self._stamps = {}
+        self._lock = threading.Lock()
+
+    def _collection(self):
+        return get_db()[COLLECTIONS['collection_versions']]
+
+    def _store(self, name, version, updated_at):
+        with self._lock:
+            self._stamps[name] = (version, updated_at, time.monotonic())
+
+    def bump(self, *names):
+        """Record that the given collections changed"""
+        now = datetime.utcnow()
+        for name in names:
+            doc = self._collection().find_one_and_update(
+                {'_id': name},
+                {'$inc': {'version': 1}, '$set': {'updated_at': now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            self._store(name, doc['version'], doc['updated_at'])
+
+    def current(self, names):
+        """Return {name: (version, updated_at)} for the given collections"""
+        now = time.monotonic()
+        stamps = {}
+        stale = []
+        for name in names:
+            cached = self._stamps.get(name)
+            if cached and now - cached[2] < self.ttl:
+                stamps[name] = cached[:2]
+            else:
+                stale.append(name)
+
+        if stale:
+            found = {
+                doc['_id']: doc
+                for doc in self._collection().find({'_id': {'$in': stale}})
+            }
+            for name in stale:
+                doc = found.get(name, {})
+                stamps[name] = (doc.get('version', 0), doc.get('updated_at'))
+                self._store(name, *stamps[name])
+        return stamps
+
+    def etag(self, names, full_path=None):
+        """Strong ETag for the current request (or full_path) given the collections it reads"""
+        stamps = self.current(names)
+        parts = [request.full_path if full_path is None else full_path]
+        if current_tenant.get() is not None:
+            # Tenants' version counters are independent, so their ETags must not collide
+            parts.append(f'tenant:{current_tenant.get()}')
+        parts.extend(f'{name}:{stamps[name][0]}' for name in sorted(stamps))
+        etag = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+        timestamps = [updated_at for _, updated_at in stamps.values() if updated_at]
+        last_modified = max(timestamps) if timestamps else None
+        # Last-Modified has whole-second precision, and another worker's write can go
+        # unseen for up to ttl, so it is only given (and If-Modified-Since only honoured)
+        # once no later write can carry the same second; until then the ETag alone applies
+        if last_modified is not None and datetime.utcnow() - last_modified < timedelta(seconds=1 + self.ttl):
+            last_modified = None
+        elif last_modified is not None:
+            last_modified = last_modified.replace(microsecond=0)
+        return etag, last_modified
+
+# Shared version stamps used by the API, one per tenant
+version_stamps = PerTenant(VersionStamps)
+
+def bump_versions(*names):
+    """Invalidate ETags of responses built from the given collections"""
+    version_stamps.bump(*names)
+
+def bumps_versions(*names):
+    """Decorator for write routes: bump the given collections after a successful response"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            response = make_response(view(*args, **kwargs))
+            if response.status_code < 400:
+                bump_versions(*names)
+            return response
+        return wrapped
+    return decorator
+
+def _etag_matches(etag, header):
+    """True if the If-None-Match header lists this ETag (for either representation)"""
+    if not header:
+        return False
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate.endswith(GZIP_ETAG_SUFFIX):
+            candidate = candidate[:-len(GZIP_ETAG_SUFFIX)]
+        if candidate == etag:
+            return True
+    return False
+
+def is_not_modified(etag, last_modified, if_none_match, if_modified_since):
+    """Whether a conditional GET can be answered with 304 (If-None-Match takes precedence)"""
+    if _etag_matches(etag, if_none_match):
+        return True
+    if if_none_match is not None or not last_modified or if_modified_since is None:
+        return False
+    return if_modified_since.replace(tzinfo=None) >= last_modified
+
+def conditional(*names):
+    """
+    Decorator for GET routes whose body depends only on the given collections.
+    Answers If-None-Match / If-Modified-Since with 304 before running the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            etag, last_modified = version_stamps.etag(names)
+
+            if is_not_modified(etag, last_modified, request.headers.get('If-None-Match'),
+                               request.if_modified_since):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapped
+    return decorator
+
+def compress_response(response):
+    """Gzip large JSON responses when the client accepts it"""
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + GZIP_ETAG_SUFFIX, weak)
+    return response
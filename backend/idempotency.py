@@ -0,0 +1,199 @@
+"""
+Idempotency Keys - safe client retries for write routes
+A request carrying an Idempotency-Key header runs once; retries with the same
+key get the first response replayed instead of minting another certificate or
+appending another ledger transaction. Records live in a TTL-indexed collection
+shared by all workers, with completed responses also kept in a process-local LRU.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+import hashlib
+import os
+import threading
+import time
+from flask import request, jsonify, make_response
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database import get_db
+from models import COLLECTIONS
+from tenancy import PerTenant
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+# Seconds a key and its response are kept
+IDEMPOTENCY_KEY_TTL = float(os.environ.get('IDEMPOTENCY_KEY_TTL', '86400'))
+
+# Seconds after which a request still marked in progress is presumed dead
+# (e.g. its worker crashed) and a retry may run it again
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', '60'))
+
+# Completed responses kept in memory per worker
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+
+MAX_KEY_LENGTH = 255
+
+class IdempotencyStore:
+    """Idempotency records in MongoDB, fronted by an LRU of completed responses"""
+
+    def __init__(self, ttl=IDEMPOTENCY_KEY_TTL, lock_timeout=IDEMPOTENCY_LOCK_TIMEOUT,
+                 cache_size=IDEMPOTENCY_CACHE_SIZE):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._indexed = False
+        self.hits = 0
+        self.misses = 0
+        self.replays = 0
+        self.conflicts = 0
+
+    def _collection(self):
+        collection = get_db()[COLLECTIONS['idempotency_keys']]
+        if not self._indexed:
+            # MongoDB removes records once expires_at has passed
+            collection.create_index('expires_at', expireAfterSeconds=0)
+            self._indexed = True
+        return collection
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._cache[key]
+            self.misses += 1
+            return None
+
+    def _remember(self, key, record):
+        with self._lock:
+            self._cache[key] = (record, time.monotonic() + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def begin(self, key, fingerprint):
+        """
+        Claim key for this request. Returns None if the caller should run the
+        request, or the existing record (in progress or completed) otherwise.
+        """
+        record = self._cached(key)
+        if record is not None:
+            return record
+
+        now = datetime.utcnow()
+        try:
+            self._collection().insert_one({
+                '_id': key,
+                'fingerprint': fingerprint,
+                'status': 'in_progress',
+                'locked_at': now,
+                'expires_at': now + timedelta(seconds=self.ttl)
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        # Take over a request whose worker died before completing it
+        record = self._collection().find_one_and_update(
+            {'_id': key, 'status': 'in_progress', 'fingerprint': fingerprint,
+             'locked_at': {'$lt': now - timedelta(seconds=self.lock_timeout)}},
+            {'$set': {'locked_at': now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if record is not None:
+            return None
+
+        record = self._collection().find_one({'_id': key})
+        if record is None:
+            # Expired or released in the meantime
+            return self.begin(key, fingerprint)
+        if record['status'] == 'completed':
+            self._remember(key, record)
+        return record
+
+    def complete(self, key, response):
+        """Store the response of a claimed key for replay"""
+        record = {
+            'status': 'completed',
+            'status_code': response.status_code,
+            'content_type': response.content_type,
+            'body': response.get_data()
+        }
+        record = self._collection().find_one_and_update(
+            {'_id': key}, {'$set': record}, return_document=ReturnDocument.AFTER
+        )
+        if record is not None:
+            self._remember(key, record)
+
+    def release(self, key):
+        """Forget a claimed key so a retry can run the request again"""
+        self._collection().delete_one({'_id': key, 'status': 'in_progress'})
+
+    def stats(self):
+        """Size and hit statistics"""
+        return {
+            'size': len(self._cache),
+            'maxsize': self.cache_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'replays': self.replays,
+            'conflicts': self.conflicts
+        }
+
+# Shared store used by the API, one per tenant
+idempotency_store = PerTenant(IdempotencyStore)
+
+def _replay(record):
+    response = make_response(record['body'], record['status_code'])
+    response.content_type = record['content_type']
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+def idempotent(view):
+    """
+    Decorator for write routes: honour the Idempotency-Key header.
+    Place it above @bumps_versions so replays do not bump version stamps.
+    Responses with a 5xx status are not stored, so the request can be retried.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key.strip() or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+
+        # Keys are scoped to the route and resource they were first used with
+        scoped_key = f'{request.method} {request.path} {key}'
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        record = idempotency_store.begin(scoped_key, fingerprint)
+
+        if record is not None:
+            if record['fingerprint'] != fingerprint:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used with a different request body'}), 422
+            if record['status'] != 'completed':
+                idempotency_store.conflicts += 1
+                response = make_response(jsonify({'error': 'A request with this idempotency key is in progress'}), 409)
+                response.headers['Retry-After'] = '1'
+                return response
+            idempotency_store.replays += 1
+            return _replay(record)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency_store.release(scoped_key)
+            raise
+        if response.status_code >= 500:
+            idempotency_store.release(scoped_key)
+        else:
+            idempotency_store.complete(scoped_key, response)
+        return response
+    return wrapped
@@ -0,0 +1,465 @@
+"""
+Ledger Partitions - blockchain transactions in one collection per issuance year
+Certificate IDs carry their issuance year (CERT-2026-...), so a certificate's
+transaction is found in blockchain_transactions_<year> without a lookup. The
+ledger_partitions catalog records each partition's block range, size and
+status; closed years are archived to read-only files that verification still
+queries, so MongoDB's working set only holds recent years.
+
+An archived year is kept as:
+    ledger-<year>.dat (+ .idx, .cidx)  ledger_store records, indexed by hash and certificate
+    ledger-<year>.ndjson.gz            the full transactions, for listings and restores
+
+Examples:
+    python ledger_partitions.py status
+    python ledger_partitions.py migrate           # move blockchain_transactions into year partitions
+    python ledger_partitions.py archive           # archive every closed year
+    python ledger_partitions.py archive --year 2024
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import gzip
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from pymongo import ASCENDING, ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database import get_db
+from models import COLLECTIONS
+from ledger_store import LedgerFile, write_ledger_file
+from tenancy import PerTenant, tenant_path
+
+# Directory of archived partitions (tenants' in tenants/<tenant>/); must be shared (or copied) to every API host
+LEDGER_ARCHIVE_DIR = os.environ.get(
+    'LEDGER_ARCHIVE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'ledger_archive')
+)
+
+# Seconds a worker trusts its copy of the catalog (and its view of the archive directory)
+LEDGER_CATALOG_TTL = float(os.environ.get('LEDGER_CATALOG_TTL', '30'))
+
+# Days after a year ends before it may be archived, so late anchoring of its certificates stays hot
+LEDGER_ARCHIVE_GRACE_DAYS = int(os.environ.get('LEDGER_ARCHIVE_GRACE_DAYS', '90'))
+
+# Longest a reserved block number may take to be written, in seconds (plus clock skew between workers)
+LEDGER_SETTLE_SECONDS = float(os.environ.get('LEDGER_SETTLE_SECONDS', '30'))
+
+# Unpartitioned collection from before partitioning; consulted until it has been migrated
+LEGACY_COLLECTION = COLLECTIONS['blockchain_transactions']
+PARTITION_PREFIX = LEGACY_COLLECTION + '_'
+
+HOT, ARCHIVING, ARCHIVED = 'hot', 'archiving', 'archived'
+
+# Counter document (in the counters collection) holding the last block number handed out
+BLOCK_COUNTER = 'block_number'
+
+_YEAR_IN_ID = re.compile(r'^CERT-(\d{4})-')
+
+class PartitionClosed(Exception):
+    """A transaction was written for a year that is being or has been archived"""
+
+def partition_year(certificate_id, timestamp=None):
+    """Partition year of a transaction: the year in its certificate ID, else its timestamp's"""
+    match = _YEAR_IN_ID.match(str(certificate_id or ''))
+    if match:
+        return int(match.group(1))
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return (timestamp or datetime.utcnow()).year
+
+def year_in_certificate_id(certificate_id):
+    """Year encoded in a certificate ID, or None for IDs in another format"""
+    match = _YEAR_IN_ID.match(str(certificate_id or ''))
+    return int(match.group(1)) if match else None
+
+def partition_name(year):
+    return f'{PARTITION_PREFIX}{year}'
+
+def archive_path(year, suffix='.dat'):
+    return tenant_path(os.path.join(LEDGER_ARCHIVE_DIR, f'ledger-{year}{suffix}'))
+
+def _ensure_indexes(collection):
+    collection.create_index([('certificate_id', ASCENDING)])
+    collection.create_index([('hash', ASCENDING)])
+    collection.create_index([('block_number', ASCENDING)])
+
+# ==================== Catalog ====================
+
+class PartitionCatalog:
+    """
+    The ledger_partitions catalog ({year: entry}), cached per worker for
+    LEDGER_CATALOG_TTL. Entries: collection, status, min_block, max_block, count.
+    """
+
+    def __init__(self, ttl=LEDGER_CATALOG_TTL):
+        self.ttl = ttl
+        self._entries = None
+        self._legacy = None
+        self._loaded_at = 0.0
+        self._archives = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, db=None):
+        return (db if db is not None else get_db())[COLLECTIONS['ledger_partitions']]
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+        self._archives = {}
+
+    def _load(self, db=None):
+        now = time.monotonic()
+        if self._entries is not None and now - self._loaded_at < self.ttl:
+            return
+        db = db if db is not None else get_db()
+        entries = {doc['_id']: doc for doc in self._collection(db).find()}
+        # A non-empty legacy collection means a migration is still pending
+        legacy = db[LEGACY_COLLECTION].estimated_document_count() > 0
+        with self._lock:
+            self._entries, self._legacy, self._loaded_at = entries, legacy, now
+
+    def entries(self, db=None):
+        """{year: catalog entry}"""
+        self._load(db)
+        return self._entries
+
+    def legacy_present(self, db=None):
+        self._load(db)
+        return self._legacy
+
+    def status(self, year, db=None):
+        """Status of a year's partition; years not in the catalog yet are hot"""
+        entry = self.entries(db).get(year)
+        return entry['status'] if entry else HOT
+
+    def hot_collections(self, db=None):
+        """Names of the collections holding hot transactions, newest year first"""
+        names = [entry['collection'] for year, entry in sorted(self.entries(db).items(), reverse=True)
+                 if entry['status'] != ARCHIVED]
+        if self.legacy_present(db):
+            names.append(LEGACY_COLLECTION)
+        return names
+
+    def archive(self, year):
+        """Reader for an archived year's ledger file, or None if there is none on this host"""
+        now = time.monotonic()
+        cached = self._archives.get(year)
+        if cached is not None and now - cached[1] < self.ttl:
+            return cached[0]
+        path = archive_path(year)
+        reader = cached[0] if cached else None
+        if reader is None or reader.is_stale():
+            try:
+                reader = LedgerFile(path) if os.path.exists(path) else None
+            except (OSError, ValueError, struct.error):
+                reader = None
+        self._archives[year] = (reader, now)
+        return reader
+
+    def record_write(self, year, block_number, db=None):
+        """Count a transaction written to a year's partition; the first one creates its indexes"""
+        db = db if db is not None else get_db()
+        result = self._collection(db).update_one(
+            {'_id': year},
+            {
+                '$min': {'min_block': block_number},
+                '$max': {'max_block': block_number},
+                '$inc': {'count': 1},
+                '$setOnInsert': {'collection': partition_name(year), 'status': HOT}
+            },
+            upsert=True
+        )
+        if result.upserted_id is not None:
+            _ensure_indexes(db[partition_name(year)])
+            self.invalidate()
+
+    def last_block(self, db=None):
+        """Highest block number in the ledger, 0 if empty"""
+        db = db if db is not None else get_db()
+        top = self._collection(db).find_one(sort=[('max_block', -1)])
+        last = top['max_block'] if top else 0
+        if self.legacy_present(db):
+            legacy_top = db[LEGACY_COLLECTION].find_one(sort=[('block_number', -1)])
+            if legacy_top:
+                last = max(last, legacy_top['block_number'])
+        return last
+
+    def reserve_blocks(self, count=1, db=None):
+        """
+        Reserve `count` consecutive block numbers and return the first. One atomic
+        $inc on the block counter, so concurrent writers never get the same
+        number; the counter starts from last_block() the first time it is used.
+        """
+        db = db if db is not None else get_db()
+        counters = db[COLLECTIONS['counters']]
+        counter = counters.find_one_and_update(
+            {'_id': BLOCK_COUNTER}, {'$inc': {'value': count}}, return_document=ReturnDocument.AFTER
+        )
+        if counter is None:
+            try:
+                counters.insert_one({'_id': BLOCK_COUNTER, 'value': self.last_block(db)})
+            except DuplicateKeyError:
+                # Another writer created it first
+                pass
+            counter = counters.find_one_and_update(
+                {'_id': BLOCK_COUNTER}, {'$inc': {'value': count}}, return_document=ReturnDocument.AFTER
+            )
+        return counter['value'] - count + 1
+
+# Shared catalog used by the API, one per tenant
+catalog = PerTenant(PartitionCatalog)
+
+# ==================== Routing ====================
+
+def route_certificate(certificate_id, db=None):
+    """
+    Where a certificate's transaction may be, in lookup order:
+    [('archive', year) | ('collection', name)]
+    """
+    year = year_in_certificate_id(certificate_id)
+    years = [year] if year is not None else sorted(catalog.entries(db), reverse=True)
+    sources = []
+    for candidate in years:
+        # Archive files are checked first: a worker whose catalog copy is stale
+        # may not know yet that the collection was dropped
+        if catalog.archive(candidate) is not None:
+            sources.append(('archive', candidate))
+        if catalog.status(candidate, db) != ARCHIVED:
+            sources.append(('collection', partition_name(candidate)))
+    if catalog.legacy_present(db):
+        sources.append(('collection', LEGACY_COLLECTION))
+    return sources
+
+def route_blocks(first_block=None, last_block=None, db=None):
+    """Partitions whose block range overlaps [first_block, last_block], as in route_certificate"""
+    sources = []
+    for year, entry in sorted(catalog.entries(db).items()):
+        # A hot partition's cached max_block may be behind writes made since it was loaded
+        if first_block is not None and entry['status'] != HOT and entry.get('max_block', 0) < first_block:
+            continue
+        if last_block is not None and entry.get('min_block', 0) > last_block:
+            continue
+        if entry['status'] == ARCHIVED:
+            sources.append(('archive', year))
+        else:
+            sources.append(('collection', entry['collection']))
+    if catalog.legacy_present(db):
+        sources.append(('collection', LEGACY_COLLECTION))
+    return sources
+
+def archived_transaction(year, certificate_id):
+    """Transaction for a certificate from an archived year's file, or None"""
+    archive = catalog.archive(year)
+    if archive is None:
+        return None
+    record = archive.find_by_certificate(certificate_id)
+    if record is None:
+        return None
+    return {
+        'certificate_id': certificate_id,
+        'hash': record['hash'],
+        'block_number': record['block_number'],
+        'timestamp': record['timestamp'],
+        'verified': True
+    }
+
+def iter_archived_transactions(year):
+    """Full transactions of an archived year, in block order"""
+    with gzip.open(archive_path(year, '.ndjson.gz'), 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+# ==================== Archival ====================
+
+def _closed(year, now=None):
+    now = now or datetime.utcnow()
+    return now >= datetime(year + 1, 1, 1) + timedelta(days=LEDGER_ARCHIVE_GRACE_DAYS)
+
+def _set_status(db, year, status, **fields):
+    db[COLLECTIONS['ledger_partitions']].update_one({'_id': year}, {'$set': {'status': status, **fields}})
+    catalog.invalidate()
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def archive_year(db, year, wait=True, progress=print):
+    """
+    Archive a closed year's partition and drop its collection.
+    Returns the number of transactions archived; raises ValueError if the year cannot be archived.
+    """
+    entry = db[COLLECTIONS['ledger_partitions']].find_one({'_id': year})
+    if entry is None:
+        raise ValueError(f'No ledger partition for {year}')
+    if entry['status'] == ARCHIVED:
+        raise ValueError(f'{year} is already archived')
+    if not _closed(year):
+        raise ValueError(f'{year} is not closed yet (grace period: {LEDGER_ARCHIVE_GRACE_DAYS} days)')
+
+    certificates = db[COLLECTIONS['certificates']]
+    if certificates.find_one({'certificate_id': {'$regex': f'^CERT-{year}-'}, 'blockchain_hash': None}, {'_id': 1}):
+        raise ValueError(f'{year} still has certificates that are not anchored')
+
+    _set_status(db, year, ARCHIVING)
+    try:
+        if wait:
+            # Let every worker's catalog copy see the new status before copying
+            progress(f"[INFO] Waiting {LEDGER_CATALOG_TTL:.0f}s for workers to stop writing to {year}")
+            time.sleep(LEDGER_CATALOG_TTL)
+
+        collection = db[entry['collection']]
+        os.makedirs(os.path.dirname(archive_path(year)), exist_ok=True)
+
+        def transactions():
+            return collection.find({}, {'_id': 0}).sort('block_number', 1)
+
+        ndjson_path = archive_path(year, '.ndjson.gz')
+        exported = 0
+        with gzip.open(ndjson_path + '.tmp', 'wt', encoding='utf-8') as f:
+            for transaction in transactions():
+                f.write(json.dumps(transaction, default=_json_default) + '\n')
+                exported += 1
+        written = write_ledger_file(archive_path(year) + '.new', transactions(), certificate_index=True)
+
+        # Refuse to drop anything that did not make it into the files
+        count = collection.count_documents({})
+        if exported != count or written != count:
+            raise ValueError(f'{year} changed while archiving ({count} transactions, {written} archived)')
+
+        os.replace(ndjson_path + '.tmp', ndjson_path)
+        for suffix in ('.cidx', '.idx', ''):
+            os.replace(archive_path(year) + '.new' + suffix, archive_path(year) + suffix)
+    except Exception:
+        _set_status(db, year, HOT)
+        raise
+
+    _set_status(db, year, ARCHIVED, count=count, archived_at=datetime.utcnow())
+    collection.drop()
+    return count
+
+def archive_closed_years(db, wait=True, progress=print):
+    """Archive every closed hot year; returns {year: transactions archived or error message}"""
+    results = {}
+    for year, entry in sorted(catalog.entries(db).items()):
+        if entry['status'] == ARCHIVED or not _closed(year):
+            continue
+        try:
+            results[year] = archive_year(db, year, wait=wait, progress=progress)
+        except ValueError as e:
+            results[year] = str(e)
+    return results
+
+# ==================== Migration ====================
+
+def rebuild_catalog(db):
+    """Recompute block ranges and counts of the hot partitions from their collections"""
+    partitions = db[COLLECTIONS['ledger_partitions']]
+    archived = {entry['_id'] for entry in partitions.find({'status': ARCHIVED}, {'_id': 1})}
+    for name in db.list_collection_names():
+        if not name.startswith(PARTITION_PREFIX) or not name[len(PARTITION_PREFIX):].isdigit():
+            continue
+        year = int(name[len(PARTITION_PREFIX):])
+        if year in archived:
+            continue
+        _ensure_indexes(db[name])
+        summary = next(db[name].aggregate([{'$group': {
+            '_id': None, 'min_block': {'$min': '$block_number'},
+            'max_block': {'$max': '$block_number'}, 'count': {'$sum': 1}
+        }}]), None)
+        if summary is None:
+            continue
+        partitions.update_one(
+            {'_id': year},
+            {'$set': {'collection': name, 'min_block': summary['min_block'],
+                      'max_block': summary['max_block'], 'count': summary['count']},
+             '$setOnInsert': {'status': HOT}},
+            upsert=True
+        )
+    catalog.invalidate()
+
+def migrate(db, batch_size=1000, progress=None):
+    """
+    Move the unpartitioned collection into year partitions, one batch at a time.
+    Documents keep their _id, so an interrupted migration can simply be rerun.
+    Returns the number of transactions moved.
+    """
+    legacy = db[LEGACY_COLLECTION]
+    moved = 0
+    while True:
+        batch = list(legacy.find().sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        by_year = {}
+        for transaction in batch:
+            year = partition_year(transaction.get('certificate_id'), transaction.get('timestamp'))
+            by_year.setdefault(year, []).append(ReplaceOne({'_id': transaction['_id']}, transaction, upsert=True))
+        for year, operations in by_year.items():
+            db[partition_name(year)].bulk_write(operations, ordered=False)
+        legacy.delete_many({'_id': {'$in': [transaction['_id'] for transaction in batch]}})
+        moved += len(batch)
+        if progress:
+            progress(moved)
+    rebuild_catalog(db)
+    return moved
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the year-partitioned ledger')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='Show the partition catalog')
+    migrate_parser = commands.add_parser('migrate', help='Move blockchain_transactions into year partitions')
+    migrate_parser.add_argument('--batch-size', type=int, default=1000)
+    archive_parser = commands.add_parser('archive', help='Archive closed years')
+    archive_parser.add_argument('--year', type=int, help='Archive only this year')
+    archive_parser.add_argument('--no-wait', action='store_true',
+                                help='Do not wait for workers to refresh their catalog (only when no API is running)')
+    args = parser.parse_args(argv)
+
+    from database import init_db
+
+    if not init_db():
+        print("[ERROR] Failed to connect to database")
+        return 1
+    db = get_db()
+
+    if args.command == 'migrate':
+        moved = migrate(db, batch_size=args.batch_size,
+                        progress=lambda n: print(f"[INFO] {n} transactions moved", end='\r'))
+        print(f"\n[OK] Moved {moved} transactions into year partitions")
+    elif args.command == 'archive':
+        if args.year:
+            try:
+                results = {args.year: archive_year(db, args.year, wait=not args.no_wait)}
+            except ValueError as e:
+                results = {args.year: str(e)}
+        else:
+            results = archive_closed_years(db, wait=not args.no_wait)
+        for year, result in results.items():
+            if isinstance(result, int):
+                print(f"[OK] Archived {year}: {result} transactions -> {archive_path(year)}")
+            else:
+                print(f"[WARN] Skipped {year}: {result}")
+        if not results:
+            print("[OK] No closed years to archive")
+        if args.year and not isinstance(results[args.year], int):
+            return 1
+
+    if args.command != 'status':
+        # Cached listings and stats must be rebuilt from the new layout
+        from http_cache import bump_versions
+        bump_versions('blockchain_transactions')
+
+    catalog.invalidate()
+    for year, entry in sorted(catalog.entries(db).items()):
+        print(f"     {year}: {entry['status']:<9} {entry.get('count', 0):>10} transactions, "
+              f"blocks {entry.get('min_block')}-{entry.get('max_block')}")
+    if catalog.legacy_present(db):
+        print(f"     {LEGACY_COLLECTION}: not migrated yet")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
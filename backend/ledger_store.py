@@ -0,0 +1,487 @@
+"""
+Local Ledger File - append-only copy of blockchain_transactions on disk
+Fixed-size records plus a sorted hash index, opened with mmap so that
+verification can be answered by binary search without a database round trip.
+
+Run this module to build or extend the file from MongoDB:
+    python ledger_store.py            # append new blocks
+    python ledger_store.py --rebuild  # rewrite the file from scratch
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from tenancy import PerTenant, tenant_path
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: concurrent syncs of one file are not serialized
+    fcntl = None
+
+# Location of the ledger data file (the hash index lives next to it as <path>.idx);
+# tenants' files are in tenants/<tenant>/ next to it
+LEDGER_FILE_PATH = os.environ.get(
+    'LEDGER_FILE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'ledger.dat')
+)
+
+# How often (seconds) readers check whether a sync job replaced the index
+LEDGER_FILE_RELOAD_INTERVAL = float(os.environ.get('LEDGER_FILE_RELOAD_INTERVAL', '2'))
+
+# Data file: header, then one record per block
+#   block_number (uint64), sha256(certificate_id), hash (32 bytes), timestamp (int64 microseconds since epoch, UTC)
+DATA_MAGIC = b'CLLEDGER'
+DATA_VERSION = 1
+DATA_HEADER = struct.Struct('<8sII')
+RECORD = struct.Struct('<Q32s32sq')
+
+# Index file: header, then (hash, record number) pairs sorted by hash
+INDEX_MAGIC = b'CLLHIDX1'
+INDEX_HEADER = struct.Struct('<8sQ')
+INDEX_ENTRY = struct.Struct('<32sQ')
+
+# Optional certificate index (<path>.cidx, written for archived ledger partitions):
+# same layout, (certificate digest, record number) pairs sorted by digest
+CERTIFICATE_INDEX_MAGIC = b'CLLCIDX1'
+
+EPOCH = datetime(1970, 1, 1)
+
+def certificate_digest(certificate_id):
+    """SHA256 digest of a certificate ID as stored in ledger records"""
+    return hashlib.sha256(str(certificate_id).encode('utf-8')).digest()
+
+def _to_micros(timestamp):
+    """Convert a transaction timestamp (datetime or ISO string) to microseconds since epoch"""
+    if not timestamp:
+        return 0
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+def _from_micros(micros):
+    """Convert microseconds since epoch back to the ISO format used by the API"""
+    if not micros:
+        return None
+    return (EPOCH + timedelta(microseconds=micros)).isoformat()
+
+class LedgerFile:
+    """Read-only, memory-mapped view of a ledger data file and its hash index"""
+
+    def __init__(self, path=LEDGER_FILE_PATH):
+        self.path = path
+        self.index_path = path + '.idx'
+        self._data_fd = open(path, 'rb')
+        self._index_fd = open(self.index_path, 'rb')
+        self._index_stat = os.fstat(self._index_fd.fileno())
+        self._data = mmap.mmap(self._data_fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index = mmap.mmap(self._index_fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self._certificate_index = None
+        if os.path.exists(path + '.cidx'):
+            self._certificate_index_fd = open(path + '.cidx', 'rb')
+            self._certificate_index = mmap.mmap(self._certificate_index_fd.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._certificate_index[:8] != CERTIFICATE_INDEX_MAGIC:
+                self.close()
+                raise ValueError(f'Unsupported ledger certificate index format: {path}.cidx')
+
+        magic, version, record_size = DATA_HEADER.unpack_from(self._data, 0)
+        if magic != DATA_MAGIC or version != DATA_VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f'Unsupported ledger file format: {path}')
+        magic, count = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f'Unsupported ledger index format: {self.index_path}')
+        # An index from before a rebuild may be paired with the new, shorter data file
+        if count > (len(self._data) - DATA_HEADER.size) // RECORD.size:
+            self.close()
+            raise ValueError(f'Ledger index covers more records than {path} holds')
+
+        # Only records covered by the index are visible to readers
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """Unmap and close the underlying files"""
+        for handle in (getattr(self, '_data', None), getattr(self, '_index', None),
+                       getattr(self, '_certificate_index', None), getattr(self, '_data_fd', None),
+                       getattr(self, '_index_fd', None), getattr(self, '_certificate_index_fd', None)):
+            if handle is not None:
+                handle.close()
+
+    def is_stale(self):
+        """True if a sync job has replaced the index since this view was opened"""
+        try:
+            current = os.stat(self.index_path)
+        except OSError:
+            return True
+        return (current.st_ino, current.st_mtime_ns, current.st_size) != (
+            self._index_stat.st_ino, self._index_stat.st_mtime_ns, self._index_stat.st_size)
+
+    def record(self, record_number):
+        """Return a ledger record as a dict"""
+        block_number, digest, hash_bytes, micros = RECORD.unpack_from(
+            self._data, DATA_HEADER.size + record_number * RECORD.size
+        )
+        return {
+            'block_number': block_number,
+            'certificate_digest': digest,
+            'hash': hash_bytes.hex(),
+            'timestamp': _from_micros(micros)
+        }
+
+    def last_block(self):
+        """Block number of the last indexed record, 0 if empty"""
+        if not self.count:
+            return 0
+        return self.record(self.count - 1)['block_number']
+
+    def find_by_block(self, block_number):
+        """Binary search the block-ordered records for a block; returns the record or None"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if RECORD.unpack_from(self._data, DATA_HEADER.size + mid * RECORD.size)[0] < block_number:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count:
+            record = self.record(lo)
+            if record['block_number'] == block_number:
+                return record
+        return None
+
+    def _first_index_position(self, hash_bytes, index=None):
+        """Binary search for the first index entry whose key is >= hash_bytes"""
+        lo, hi = 0, self.count
+        index = self._index if index is None else index
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = INDEX_HEADER.size + mid * INDEX_ENTRY.size
+            if index[offset:offset + 32] < hash_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find_by_hash(self, hash_value):
+        """Return all records carrying the given hex hash"""
+        try:
+            hash_bytes = bytes.fromhex(hash_value)
+        except (TypeError, ValueError):
+            return []
+        if len(hash_bytes) != 32:
+            return []
+
+        records = []
+        position = self._first_index_position(hash_bytes)
+        while position < self.count:
+            entry_hash, record_number = INDEX_ENTRY.unpack_from(
+                self._index, INDEX_HEADER.size + position * INDEX_ENTRY.size
+            )
+            if entry_hash != hash_bytes:
+                break
+            record = self.record(record_number)
+            # Guards against an index built for another version of the data file
+            if record['hash'] == hash_bytes.hex():
+                records.append(record)
+            position += 1
+        return records
+
+    def find_by_certificate(self, certificate_id):
+        """
+        Return the last record for a certificate, or None.
+        Needs the certificate index, so only archived partitions answer this.
+        """
+        if self._certificate_index is None:
+            raise ValueError(f'No certificate index for {self.path}')
+        digest = certificate_digest(certificate_id)
+        position = self._first_index_position(digest, self._certificate_index)
+        found = None
+        while position < self.count:
+            entry_digest, record_number = INDEX_ENTRY.unpack_from(
+                self._certificate_index, INDEX_HEADER.size + position * INDEX_ENTRY.size
+            )
+            if entry_digest != digest:
+                break
+            record = self.record(record_number)
+            if record['certificate_digest'] == digest:
+                found = record
+            position += 1
+        return found
+
+    def lookup(self, certificate_id, expected_hash):
+        """
+        Return the record anchoring expected_hash for certificate_id, or None.
+        A miss is not authoritative: the file may lag the database.
+        """
+        digest = certificate_digest(certificate_id)
+        for record in self.find_by_hash(expected_hash):
+            if record['certificate_digest'] == digest:
+                return record
+        return None
+
+class _ReaderSlot:
+    """Process-wide reader, reopened when the sync job publishes a new index"""
+
+    def __init__(self):
+        self.reader = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+# One reader per tenant
+_readers = PerTenant(_ReaderSlot)
+
+def get_ledger_file():
+    """Get the shared ledger file reader, or None if no ledger file has been built"""
+    slot = _readers.instance()
+    now = time.monotonic()
+    if slot.reader is not None and now - slot.checked_at < LEDGER_FILE_RELOAD_INTERVAL:
+        return slot.reader
+
+    with slot.lock:
+        if slot.reader is not None and now - slot.checked_at < LEDGER_FILE_RELOAD_INTERVAL:
+            return slot.reader
+        slot.checked_at = now
+        if slot.reader is not None and not slot.reader.is_stale():
+            return slot.reader
+        # Old mappings are left for the garbage collector; a concurrent lookup may still be using them
+        try:
+            slot.reader = LedgerFile(tenant_path(LEDGER_FILE_PATH))
+        except (OSError, ValueError, struct.error):
+            slot.reader = None
+        return slot.reader
+
+def lookup_ledger_file(certificate_id, expected_hash):
+    """Look up a certificate in the local ledger file; None if absent or no file"""
+    ledger = get_ledger_file()
+    if ledger is None:
+        return None
+    return ledger.lookup(certificate_id, expected_hash)
+
+# ==================== Sync Job ====================
+
+def _valid_record_count(path):
+    """Number of complete records in a data file, or None if it is missing or invalid"""
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            header = f.read(DATA_HEADER.size)
+    except OSError:
+        return None
+    if len(header) != DATA_HEADER.size:
+        return None
+    magic, version, record_size = DATA_HEADER.unpack(header)
+    if magic != DATA_MAGIC or version != DATA_VERSION or record_size != RECORD.size:
+        return None
+    return (size - DATA_HEADER.size) // RECORD.size
+
+# Records or index entries read per chunk while indexing
+INDEX_CHUNK = 4096
+
+def _write_index(path, certificates=False, incremental=False):
+    """
+    Rebuild the sorted hash index for a data file and publish it atomically;
+    with certificates, the certificate digest index (<path>.cidx) instead.
+    incremental merges records appended since into the published index.
+    """
+    index_path = path + ('.cidx' if certificates else '.idx')
+    count = _prepare_index(path, index_path + '.tmp', certificates,
+                           previous=index_path if incremental else None)
+    os.replace(index_path + '.tmp', index_path)
+    return count
+
+def _record_keys(data_path, first, count, certificates):
+    """(hash or certificate digest, record number) of records first..count-1, in file order"""
+    # certificate digest starts after block_number (8 bytes), hash after the digest
+    start = 8 if certificates else 40
+    with open(data_path, 'rb') as f:
+        f.seek(DATA_HEADER.size + first * RECORD.size)
+        for chunk_start in range(first, count, INDEX_CHUNK):
+            chunk = f.read(min(INDEX_CHUNK, count - chunk_start) * RECORD.size)
+            for offset in range(0, len(chunk), RECORD.size):
+                yield chunk[offset + start:offset + start + 32], chunk_start + offset // RECORD.size
+
+def _index_count(index_path, magic):
+    """Number of entries of an index file, or None if it is missing or invalid"""
+    try:
+        size = os.path.getsize(index_path)
+        with open(index_path, 'rb') as f:
+            header = f.read(INDEX_HEADER.size)
+    except OSError:
+        return None
+    if len(header) != INDEX_HEADER.size:
+        return None
+    index_magic, count = INDEX_HEADER.unpack(header)
+    if index_magic != magic or size != INDEX_HEADER.size + count * INDEX_ENTRY.size:
+        return None
+    return count
+
+def _index_entries(index_path, count):
+    """The (key, record number) entries of an index file, in its sorted order"""
+    with open(index_path, 'rb') as f:
+        f.seek(INDEX_HEADER.size)
+        for chunk_start in range(0, count, INDEX_CHUNK):
+            yield from INDEX_ENTRY.iter_unpack(f.read(min(INDEX_CHUNK, count - chunk_start) * INDEX_ENTRY.size))
+
+def _prepare_index(data_path, tmp_path, certificates=False, previous=None):
+    """
+    Write the index of the data file at data_path to tmp_path, unpublished;
+    returns the record count. With previous, the published index of the same
+    file, only the records appended since are sorted and merged into it.
+    """
+    magic = CERTIFICATE_INDEX_MAGIC if certificates else INDEX_MAGIC
+    count = _valid_record_count(data_path) or 0
+    indexed = _index_count(previous, magic) if previous else None
+    if indexed is None or indexed > count:
+        indexed = 0
+
+    appended = sorted(_record_keys(data_path, indexed, count, certificates))
+    entries = heapq.merge(_index_entries(previous, indexed), appended) if indexed else appended
+
+    with open(tmp_path, 'wb') as f:
+        f.write(INDEX_HEADER.pack(magic, count))
+        for hash_bytes, record_number in entries:
+            f.write(INDEX_ENTRY.pack(hash_bytes, record_number))
+        f.flush()
+        os.fsync(f.fileno())
+    return count
+
+@contextmanager
+def _sync_lock(path):
+    """Exclusive lock on <path>.lock, so that overlapping syncs of a file run one after another"""
+    with open(path + '.lock', 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def pack_record(transaction):
+    """Ledger record bytes for a transaction document, or None if its hash is malformed"""
+    hash_bytes = transaction.get('hash') or b''
+    if not isinstance(hash_bytes, bytes):
+        # Transactions not converted by storage_format.py yet hold the hash as hex
+        try:
+            hash_bytes = bytes.fromhex(hash_bytes)
+        except ValueError:
+            return None
+    if len(hash_bytes) != 32:
+        return None
+    return RECORD.pack(
+        transaction['block_number'],
+        certificate_digest(transaction.get('certificate_id', '')),
+        hash_bytes,
+        _to_micros(transaction.get('timestamp'))
+    )
+
+def write_ledger_file(path, transactions, certificate_index=False):
+    """
+    Write a new ledger file and its indexes from transactions in block order.
+    A reader opening the file before its indexes are published fails to load it
+    and treats it as missing. Returns the number of records written.
+    """
+    tmp_path = path + '.tmp'
+    written = 0
+    with open(tmp_path, 'wb') as f:
+        f.write(DATA_HEADER.pack(DATA_MAGIC, DATA_VERSION, RECORD.size))
+        for transaction in transactions:
+            record = pack_record(transaction)
+            if record is not None:
+                f.write(record)
+                written += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if certificate_index:
+        _write_index(path, certificates=True)
+    _write_index(path)
+    return written
+
+def sync_ledger_file(path=None, rebuild=False, batch_size=1000):
+    """
+    Build or extend the ledger file from the hot ledger partitions (archived
+    partitions are verified from their own files), up to the settled watermark
+    so that a block written late is appended by a later sync rather than skipped.
+    Returns the number of records appended.
+    """
+    path = path or tenant_path(LEDGER_FILE_PATH)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Two syncs would both append the same blocks and race on the tmp and index files
+    with _sync_lock(path):
+        return _sync(path, rebuild, batch_size)
+
+def _sync(path, rebuild, batch_size):
+    from blockchain_utils import iter_settled_transactions
+
+    existing = None if rebuild else _valid_record_count(path)
+    # A leftover index tmp file means the last sync was interrupted, possibly between
+    # swapping in a rebuilt data file and its index; the published index is not trusted then
+    incremental = not os.path.exists(path + '.idx.tmp')
+
+    if existing is None:
+        # Start a fresh file and swap it in once it is complete
+        target = path + '.tmp'
+        with open(target, 'wb') as f:
+            f.write(DATA_HEADER.pack(DATA_MAGIC, DATA_VERSION, RECORD.size))
+        last_block = 0
+    else:
+        target = path
+        # Drop a partially written trailing record left by an interrupted sync
+        with open(target, 'r+b') as f:
+            f.truncate(DATA_HEADER.size + existing * RECORD.size)
+            if existing:
+                f.seek(DATA_HEADER.size + (existing - 1) * RECORD.size)
+                last_block = RECORD.unpack(f.read(RECORD.size))[0]
+            else:
+                last_block = 0
+
+    transactions = iter_settled_transactions(first_block=last_block + 1, batch_size=batch_size)
+
+    appended = 0
+    with open(target, 'ab') as f:
+        for transaction in transactions:
+            record = pack_record(transaction)
+            if record is None:
+                continue
+            f.write(record)
+            appended += 1
+        f.flush()
+        os.fsync(f.fileno())
+
+    if target != path:
+        # Index the new file before swapping it in, so the data file and its
+        # index are replaced back to back (readers also check the pair, see LedgerFile)
+        _prepare_index(target, path + '.idx.tmp')
+        os.replace(target, path)
+        os.replace(path + '.idx.tmp', path + '.idx')
+    else:
+        _write_index(path, incremental=incremental)
+    return appended
+
+if __name__ == '__main__':
+    from database import init_db
+
+    if not init_db():
+        print("[ERROR] Failed to connect to database")
+        sys.exit(1)
+
+    rebuild = '--rebuild' in sys.argv[1:]
+    appended = sync_ledger_file(rebuild=rebuild)
+    path = tenant_path(LEDGER_FILE_PATH)
+    total = _valid_record_count(path) or 0
+    print(f"[OK] Ledger file {'rebuilt' if rebuild else 'synced'}: {appended} records appended, {total} total")
+    print(f"     {path}")
@@ -0,0 +1,331 @@
+"""
+Prometheus Metrics for ChainLearn
+Counters, gauges and histograms are sharded per thread: each thread only
+writes its own dict, so recording a sample never takes a lock, and a scrape
+sums the shards. Shards of exited threads are folded into one retired total.
+Exposed in the Prometheus text format at /metrics.
+"""
+
+import bisect
+import threading
+import time
+from flask import g, request
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Shards:
+    """
+    One dict per thread; only the owning thread writes to it. Shards of threads
+    that have exited are folded into a retired total by merge(retired, shard)
+    and dropped, so short-lived threads (one per request under app.run) do not
+    accumulate.
+    """
+
+    def __init__(self, merge):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._merge = merge
+        self._lock = threading.Lock()
+
+    def mine(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # Taken once per thread, never on the recording path
+            with self._lock:
+                self._prune()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _prune(self):
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                # A thread that has exited no longer writes to its shard
+                self._merge(self._retired, shard)
+        self._shards = live
+
+    def all(self):
+        with self._lock:
+            self._prune()
+            return [dict(self._retired)] + [shard for _, shard in self._shards]
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonically increasing value per label set"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards(self._merge)
+
+    @staticmethod
+    def _merge(total, shard):
+        for key, value in list(shard.items()):
+            total[key] = total.get(key, 0) + value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        shard = self._shards.mine()
+        shard[key] = shard.get(key, 0) + amount
+
+    def collect(self):
+        totals = {}
+        for shard in self._shards.all():
+            self._merge(totals, shard)
+        return totals
+
+    def render(self):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                for key, value in sorted(self.collect().items())]
+
+class Gauge(Counter):
+    """Value that can go up and down (summed across threads)"""
+
+    type = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram:
+    """Bucketed distribution of observed values per label set"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _Shards(self._merge)
+
+    @staticmethod
+    def _merge(total, shard):
+        # Series are replaced rather than added to in place, so copies of `total` stay unchanged
+        for key, series in list(shard.items()):
+            current = total.get(key)
+            series = list(series)
+            total[key] = series if current is None else [a + b for a, b in zip(current, series)]
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        shard = self._shards.mine()
+        series = shard.get(key)
+        if series is None:
+            # bucket counts (last one is +Inf), then sum
+            series = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        merged = {}
+        for shard in self._shards.all():
+            self._merge(merged, shard)
+
+        lines = []
+        for key, series in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", _format_value(float(bound))))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+class CallbackMetric:
+    """Metric whose values are read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, metric_type, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.type = metric_type
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                for key, value in sorted(self.callback().items())]
+
+class Registry:
+    """Set of metrics rendered together"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                samples = metric.render()
+            except Exception:
+                # A failing callback must not break the whole scrape
+                continue
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+# ==================== ChainLearn Metrics ====================
+
+request_duration = registry.register(Histogram(
+    'chainlearn_http_request_duration_seconds', 'HTTP request latency by route',
+    ('method', 'route', 'status')
+))
+requests_in_flight = registry.register(Gauge(
+    'chainlearn_http_requests_in_flight', 'HTTP requests currently being handled'
+))
+pool_checkout_wait = registry.register(Histogram(
+    'chainlearn_mongo_pool_checkout_wait_seconds', 'Time spent waiting for a MongoDB connection',
+    ('outcome',), buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+))
+certificates_issued = registry.register(Counter(
+    'chainlearn_certificates_issued_total', 'Certificates issued'
+))
+blocks_written = registry.register(Counter(
+    'chainlearn_ledger_blocks_written_total', 'Blocks written to the ledger (use rate() for blocks per second)'
+))
+verifications = registry.register(Counter(
+    'chainlearn_verifications_total', 'Public certificate verifications by result (hit, miss, failure)',
+    ('result',)
+))
+rate_limit_decisions = registry.register(Counter(
+    'chainlearn_rate_limit_decisions_total', 'Rate limiter decisions by budget (allowed, limited, error)',
+    ('budget', 'decision')
+))
+admission_decisions = registry.register(Counter(
+    'chainlearn_admission_decisions_total', 'Admission control decisions (admitted, queued, queue_full, timeout)',
+    ('decision',)
+))
+
+_caches = {}
+
+def _collect_cache_stats():
+    values = {}
+    for name, stats_fn in list(_caches.items()):
+        for stat, value in stats_fn().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values[(name, stat)] = value
+    return values
+
+registry.register(CallbackMetric(
+    'chainlearn_cache_stats', 'Cache statistics (hits, misses, size, ...) by cache',
+    'gauge', ('cache', 'stat'), _collect_cache_stats
+))
+
+def register_cache(name, stats_fn):
+    """Expose a cache's stats() dict on /metrics"""
+    _caches[name] = stats_fn
+
+def render():
+    """Current metrics in the Prometheus text exposition format"""
+    return registry.render()
+
+# ==================== Flask Hooks ====================
+
+def start_request():
+    """before_request hook"""
+    g.metrics_started = time.perf_counter()
+    g.metrics_recorded = False
+    requests_in_flight.inc()
+
+def _route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+def finish_request(response):
+    """after_request hook: record latency with the final status code"""
+    started = g.get('metrics_started')
+    if started is not None and not g.get('metrics_recorded'):
+        request_duration.observe(
+            time.perf_counter() - started,
+            method=request.method, route=_route(), status=str(response.status_code)
+        )
+        g.metrics_recorded = True
+    return response
+
+def teardown_request(error=None):
+    """teardown_request hook: requests that raised are recorded as 500"""
+    started = g.get('metrics_started')
+    if started is None:
+        return
+    if not g.get('metrics_recorded'):
+        request_duration.observe(
+            time.perf_counter() - started, method=request.method, route=_route(), status='500'
+        )
+    requests_in_flight.dec()
+
+# ==================== MongoDB Pool Listener ====================
+
+class PoolCheckoutTimer(monitoring.ConnectionPoolListener):
+    """Measures how long threads wait to check a connection out of the pool"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def _observe(self, outcome):
+        started = getattr(self._local, 'started', None)
+        if started is not None:
+            self._local.started = None
+            pool_checkout_wait.observe(time.perf_counter() - started, outcome=outcome)
+
+    def connection_checked_out(self, event):
+        self._observe('success')
+
+    def connection_check_out_failed(self, event):
+        self._observe('failed')
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
@@ -12,7 +12,12 @@ COLLECTIONS = {
     'courses': 'courses',
     'certificates': 'certificates',
     'grades': 'grades',
-    'blockchain_transactions': 'blockchain_transactions'
+    'blockchain_transactions': 'blockchain_transactions',
+    'collection_versions': 'collection_versions',
+    'idempotency_keys': 'idempotency_keys',
+    'rate_limits': 'rate_limits',
+    'ledger_partitions': 'ledger_partitions',
+    'counters': 'counters'
 }
 
 def serialize_doc(doc):
@@ -32,6 +37,9 @@ def serialize_doc(doc):
                 doc[key] = value.isoformat()
             elif isinstance(value, ObjectId):
                 doc[key] = str(value)
+            elif isinstance(value, bytes):
+                # Hashes are stored as binary (see storage_format.py)
+                doc[key] = value.hex()
         
         return doc
     
@@ -58,7 +66,7 @@ Course Collection Schema:
     "_id": ObjectId,
     "name": str,
     "description": str,
-    "instructor_id": str (ObjectId reference to users),
+    "instructor_id": ObjectId (reference to users; str before storage_format migrate),
     "created_at": datetime
 }
 
@@ -66,13 +74,16 @@ Certificate Collection Schema:
 {
     "_id": ObjectId,
     "certificate_id": str (unique),
-    "student_id": str (ObjectId reference to users),
-    "course_id": str (ObjectId reference to courses),
+    "student_id": ObjectId (reference to users; str before storage_format migrate),
+    "course_id": ObjectId (reference to courses; str before storage_format migrate),
+    "student_name": str,  # snapshot at issuance, frozen once anchored
+    "student_email": str,  # snapshot at issuance, frozen once anchored
+    "course_name": str,  # snapshot at issuance, frozen once anchored
     "grade": str,
     "score": int,
     "instructor_name": str,
     "issue_date": datetime,
-    "blockchain_hash": str,
+    "blockchain_hash": bytes,  # 32-byte SHA256 (hex str before storage_format migrate)
     "blockchain_block_number": int,
     "status": str,  # 'pending', 'issued', 'verified'
     "created_at": datetime
@@ -81,8 +92,8 @@ Certificate Collection Schema:
 Grade Collection Schema:
 {
     "_id": ObjectId,
-    "student_id": str (ObjectId reference to users),
-    "course_id": str (ObjectId reference to courses),
+    "student_id": ObjectId (reference to users; str before storage_format migrate),
+    "course_id": ObjectId (reference to courses; str before storage_format migrate),
     "grade": str,
     "score": int,
     "feedback": str,
@@ -92,13 +103,53 @@ Grade Collection Schema:
     "updated_at": datetime
 }
 
-BlockchainTransaction Collection Schema:
+BlockchainTransaction Collection Schema (one collection per issuance year, blockchain_transactions_<year>;
+blockchain_transactions itself only holds transactions not migrated yet):
 {
     "_id": ObjectId,
     "certificate_id": str,
-    "hash": str (unique),
+    "hash": bytes (unique),  # 32-byte SHA256 (hex str before storage_format migrate)
     "block_number": int,
     "timestamp": datetime,
     "verified": bool
 }
+
+CollectionVersion Collection Schema (HTTP ETag version stamps):
+{
+    "_id": str,  # collection name
+    "version": int,
+    "updated_at": datetime
+}
+
+IdempotencyKey Collection Schema (replayable write responses, TTL index on expires_at):
+{
+    "_id": str,  # "<method> <path> <Idempotency-Key header>"
+    "fingerprint": str,  # sha256 of the request body
+    "status": str,  # 'in_progress', 'completed'
+    "status_code": int,
+    "content_type": str,
+    "body": bytes,
+    "locked_at": datetime,
+    "expires_at": datetime
+}
+
+RateLimit Collection Schema (token buckets for RATE_LIMIT_BACKEND=mongodb, TTL index on expires_at):
+{
+    "_id": str,  # "<budget>|ip:<address>" or "<budget>|key:<sha256 prefix>"
+    "tokens": float,
+    "updated": float,  # unix time
+    "allowed": bool,  # outcome of the last request
+    "expires_at": datetime
+}
+
+LedgerPartition Collection Schema (catalog of the year-partitioned ledger):
+{
+    "_id": int,  # year
+    "collection": str,  # "blockchain_transactions_<year>"
+    "status": str,  # 'hot', 'archiving', 'archived'
+    "min_block": int,
+    "max_block": int,
+    "count": int,
+    "archived_at": datetime
+}
 """
@@ -0,0 +1,351 @@
+"""
+Offline Verifier - check certificates against a signed verification bundle
+Verifiers download a bundle (a signed manifest plus a sorted entry file) from
+/api/bundles, keep it current with the delta feed, and verify certificates
+locally instead of calling POST /api/certificates/verify for each one.
+
+Standalone: needs only the standard library and certificate_hashing.py. The
+`cryptography` package is used for signature checks when installed; otherwise
+a pure-Python Ed25519 verification is used (slower, but bundles are checked once
+per download). Pin the public key from a trusted channel; do not fetch it along
+with the bundle.
+
+Bundle format (chainlearn-bundle/1):
+    manifest  JSON, signed with Ed25519 over its canonical form without "signature"
+    entries   80-byte records sorted by certificate digest, one per certificate:
+              block_number (uint64), sha256(certificate_id), hash (32 bytes),
+              timestamp (int64 microseconds since epoch, UTC), all little-endian
+    merkle_root  RFC 6962 Merkle tree hash over the entries of the full snapshot
+    A delta holds the entries added since its base snapshot; applied to the
+    base it must reproduce the signed merkle_root of the new sequence.
+
+Examples:
+    python offline_verifier.py --public-key <hex> --manifest snapshot-12.json --entries snapshot-12.bin \\
+        --delta delta-13.json delta-13.bin CERT-2026-0001-WEBDE --hash 3f2a...
+"""
+
+import argparse
+import base64
+import bisect
+from datetime import datetime, timedelta
+import hashlib
+import json
+import struct
+import sys
+from certificate_hashing import generate_certificate_hash
+
+BUNDLE_FORMAT = 'chainlearn-bundle/1'
+ENTRY = struct.Struct('<Q32s32sq')
+DIGEST_OFFSET = 8
+
+EPOCH = datetime(1970, 1, 1)
+
+class BundleError(Exception):
+    """A bundle failed a signature, integrity or sequence check"""
+
+def certificate_digest(certificate_id):
+    return hashlib.sha256(str(certificate_id).encode('utf-8')).digest()
+
+def canonical_manifest(manifest):
+    """The signed bytes of a manifest: its JSON without "signature", keys sorted, no whitespace"""
+    unsigned = {key: value for key, value in manifest.items() if key != 'signature'}
+    return json.dumps(unsigned, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+def key_id(public_key):
+    """Short identifier of a raw 32-byte Ed25519 public key"""
+    return hashlib.sha256(public_key).hexdigest()[:16]
+
+# ==================== Merkle Tree ====================
+
+def leaf_hash(entry):
+    return hashlib.sha256(b'\x00' + entry).digest()
+
+def node_hash(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+class MerkleBuilder:
+    """RFC 6962 Merkle tree hash computed over a stream of leaves in O(log n) memory"""
+
+    def __init__(self):
+        self._stack = []
+
+    def add(self, entry):
+        size, digest = 1, leaf_hash(entry)
+        # Merge complete subtrees of equal size, like binary addition
+        while self._stack and self._stack[-1][0] == size:
+            left_size, left = self._stack.pop()
+            size, digest = size + left_size, node_hash(left, digest)
+        self._stack.append((size, digest))
+
+    def root(self):
+        if not self._stack:
+            return hashlib.sha256(b'').hexdigest()
+        digest = self._stack[-1][1]
+        for _, left in reversed(self._stack[:-1]):
+            digest = node_hash(left, digest)
+        return digest.hex()
+
+def iter_entries(data):
+    for offset in range(0, len(data), ENTRY.size):
+        yield data[offset:offset + ENTRY.size]
+
+def merkle_root(entries):
+    builder = MerkleBuilder()
+    for entry in entries:
+        builder.add(entry)
+    return builder.root()
+
+def merge_entries(base, added):
+    """
+    Merge two digest-sorted entry sequences; an entry in added replaces the
+    base entry for the same certificate. Yields entries in digest order.
+    """
+    added = iter(added)
+    next_added = next(added, None)
+    for entry in base:
+        digest = entry[DIGEST_OFFSET:DIGEST_OFFSET + 32]
+        while next_added is not None and next_added[DIGEST_OFFSET:DIGEST_OFFSET + 32] < digest:
+            yield next_added
+            next_added = next(added, None)
+        if next_added is not None and next_added[DIGEST_OFFSET:DIGEST_OFFSET + 32] == digest:
+            yield next_added
+            next_added = next(added, None)
+        else:
+            yield entry
+    while next_added is not None:
+        yield next_added
+        next_added = next(added, None)
+
+# ==================== Ed25519 (RFC 8032) ====================
+
+_P = 2 ** 255 - 19
+_Q = 2 ** 252 + 27742317777372353535851937790883648493
+_D = -121665 * pow(121666, _P - 2, _P) % _P
+_SQRT_M1 = pow(2, (_P - 1) // 4, _P)
+
+def _point_add(a, b):
+    x = (a[1] - a[0]) * (b[1] - b[0]) % _P
+    y = (a[1] + a[0]) * (b[1] + b[0]) % _P
+    c = 2 * a[3] * b[3] * _D % _P
+    d = 2 * a[2] * b[2] % _P
+    e, f, g, h = y - x, d - c, d + c, y + x
+    return (e * f, g * h, f * g, e * h)
+
+def _point_mul(scalar, point):
+    result = (0, 1, 1, 0)
+    while scalar > 0:
+        if scalar & 1:
+            result = _point_add(result, point)
+        point = _point_add(point, point)
+        scalar >>= 1
+    return result
+
+def _point_equal(a, b):
+    return (a[0] * b[2] - b[0] * a[2]) % _P == 0 and (a[1] * b[2] - b[1] * a[2]) % _P == 0
+
+def _recover_x(y, sign):
+    if y >= _P:
+        return None
+    x2 = (y * y - 1) * pow(_D * y * y + 1, _P - 2, _P)
+    if x2 == 0:
+        return None if sign else 0
+    x = pow(x2, (_P + 3) // 8, _P)
+    if (x * x - x2) % _P != 0:
+        x = x * _SQRT_M1 % _P
+    if (x * x - x2) % _P != 0:
+        return None
+    if (x & 1) != sign:
+        x = _P - x
+    return x
+
+def _decompress(data):
+    y = int.from_bytes(data, 'little')
+    sign = y >> 255
+    y &= (1 << 255) - 1
+    x = _recover_x(y, sign)
+    if x is None:
+        return None
+    return (x, y, 1, x * y % _P)
+
+_G_Y = 4 * pow(5, _P - 2, _P) % _P
+_G_X = _recover_x(_G_Y, 0)
+_G = (_G_X, _G_Y, 1, _G_X * _G_Y % _P)
+
+def _ed25519_verify_python(public_key, message, signature):
+    if len(public_key) != 32 or len(signature) != 64:
+        return False
+    a = _decompress(public_key)
+    r = _decompress(signature[:32])
+    if a is None or r is None:
+        return False
+    s = int.from_bytes(signature[32:], 'little')
+    if s >= _Q:
+        return False
+    h = int.from_bytes(hashlib.sha512(signature[:32] + public_key + message).digest(), 'little') % _Q
+    return _point_equal(_point_mul(s, _G), _point_add(r, _point_mul(h, a)))
+
+def ed25519_verify(public_key, message, signature):
+    """True if signature is a valid Ed25519 signature of message by public_key (raw 32 bytes)"""
+    try:
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+    except ImportError:
+        return _ed25519_verify_python(public_key, message, signature)
+    try:
+        Ed25519PublicKey.from_public_bytes(public_key).verify(signature, message)
+        return True
+    except (InvalidSignature, ValueError):
+        return False
+
+# ==================== Bundles ====================
+
+def check_manifest(manifest, public_key, kind=None):
+    """Check a manifest's format and signature; raises BundleError"""
+    if manifest.get('format') != BUNDLE_FORMAT:
+        raise BundleError(f"Unsupported bundle format: {manifest.get('format')}")
+    if kind and manifest.get('kind') != kind:
+        raise BundleError(f"Expected a {kind} manifest, got {manifest.get('kind')}")
+    if manifest.get('key_id') != key_id(public_key):
+        raise BundleError('Bundle was signed with a different key')
+    try:
+        signature = base64.b64decode(manifest.get('signature', ''), validate=True)
+    except ValueError:
+        raise BundleError('Malformed bundle signature')
+    if not ed25519_verify(public_key, canonical_manifest(manifest), signature):
+        raise BundleError('Bundle signature is invalid')
+
+def _check_entries(manifest, entries):
+    if len(entries) % ENTRY.size or len(entries) // ENTRY.size != manifest['count']:
+        raise BundleError('Entry file does not match the manifest entry count')
+    if hashlib.sha256(entries).hexdigest() != manifest['entries_sha256']:
+        raise BundleError('Entry file does not match the manifest checksum')
+
+def _timestamp(micros):
+    if not micros:
+        return None
+    return (EPOCH + timedelta(microseconds=micros)).isoformat()
+
+class Bundle:
+    """A verified snapshot of the ledger held in memory"""
+
+    def __init__(self, manifest, entries, public_key):
+        self.manifest = manifest
+        self.entries = entries
+        self.public_key = public_key
+        self._digests = _DigestView(entries)
+
+    @classmethod
+    def load(cls, manifest, entries, public_key):
+        """
+        Verify and load a snapshot: manifest (dict, JSON text or path), entries
+        (bytes or path), public_key (raw bytes or hex). Raises BundleError.
+        """
+        manifest, entries, public_key = _read(manifest, entries, public_key)
+        check_manifest(manifest, public_key, 'snapshot')
+        _check_entries(manifest, entries)
+        if merkle_root(iter_entries(entries)) != manifest['merkle_root']:
+            raise BundleError('Entries do not match the signed Merkle root')
+        return cls(manifest, entries, public_key)
+
+    @property
+    def sequence(self):
+        return self.manifest['sequence']
+
+    def apply_delta(self, manifest, entries):
+        """
+        Return the next snapshot: this one plus a signed delta. The result must
+        reproduce the Merkle root signed for the new sequence. Raises BundleError.
+        """
+        manifest, entries, _ = _read(manifest, entries, self.public_key)
+        check_manifest(manifest, self.public_key, 'delta')
+        if manifest['base_sequence'] != self.sequence or manifest['base_root'] != self.manifest['merkle_root']:
+            raise BundleError(f"Delta {manifest['sequence']} does not apply to bundle {self.sequence}")
+        _check_entries(manifest, entries)
+        merged = b''.join(merge_entries(iter_entries(self.entries), iter_entries(entries)))
+        if merkle_root(iter_entries(merged)) != manifest['merkle_root']:
+            raise BundleError('Delta does not reproduce the signed Merkle root')
+        snapshot = dict(manifest, kind='snapshot', count=len(merged) // ENTRY.size)
+        return Bundle(snapshot, merged, self.public_key)
+
+    def lookup(self, certificate_id):
+        """The bundle entry for a certificate as a dict, or None"""
+        digest = certificate_digest(certificate_id)
+        position = bisect.bisect_left(self._digests, digest)
+        if position >= len(self._digests) or self._digests[position] != digest:
+            return None
+        block_number, _, hash_bytes, micros = ENTRY.unpack_from(self.entries, position * ENTRY.size)
+        return {'block_number': block_number, 'hash': hash_bytes.hex(), 'timestamp': _timestamp(micros)}
+
+    def verify(self, certificate_id, certificate_data=None, expected_hash=None):
+        """
+        Verify a certificate from its fields (hashed like the API does) or its hash.
+        Same result shape as the API; a certificate anchored after the bundle was
+        generated is reported as not found, so check 'lastBlock' and fall back to the API.
+        """
+        if certificate_data is not None:
+            expected_hash = generate_certificate_hash(certificate_data)
+        entry = self.lookup(certificate_id)
+        result = {'bundleSequence': self.sequence, 'lastBlock': self.manifest['last_block']}
+        if entry is None:
+            return {**result, 'isValid': False, 'blockNumber': None, 'timestamp': None,
+                    'message': 'Certificate not found in bundle'}
+        if entry['hash'] != expected_hash:
+            return {**result, 'isValid': False, 'blockNumber': entry['block_number'], 'timestamp': entry['timestamp'],
+                    'message': 'Certificate hash does not match - potential tampering detected'}
+        return {**result, 'isValid': True, 'blockNumber': entry['block_number'], 'timestamp': entry['timestamp'],
+                'message': 'Certificate verified successfully'}
+
+class _DigestView:
+    """Sequence view of the entries' certificate digests, for bisect"""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries) // ENTRY.size
+
+    def __getitem__(self, index):
+        offset = index * ENTRY.size + DIGEST_OFFSET
+        return self.entries[offset:offset + 32]
+
+def _read(manifest, entries, public_key):
+    if isinstance(manifest, str) and not manifest.lstrip().startswith('{'):
+        with open(manifest, encoding='utf-8') as f:
+            manifest = f.read()
+    if isinstance(manifest, (str, bytes)):
+        manifest = json.loads(manifest)
+    if isinstance(entries, str):
+        with open(entries, 'rb') as f:
+            entries = f.read()
+    if isinstance(public_key, str):
+        public_key = bytes.fromhex(public_key)
+    return manifest, bytes(entries), public_key
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Verify a certificate against a signed ChainLearn bundle')
+    parser.add_argument('--public-key', required=True, help='Bundle signing public key (hex)')
+    parser.add_argument('--manifest', required=True, help='Snapshot manifest (JSON)')
+    parser.add_argument('--entries', required=True, help='Snapshot entry file')
+    parser.add_argument('--delta', nargs=2, action='append', default=[], metavar=('MANIFEST', 'ENTRIES'),
+                        help='Delta to apply, in order (repeatable)')
+    parser.add_argument('certificate_id')
+    parser.add_argument('--hash', help='Expected certificate hash')
+    parser.add_argument('--data', help='Certificate fields as JSON, hashed locally')
+    args = parser.parse_args(argv)
+    if not args.hash and not args.data:
+        parser.error('pass --hash or --data')
+
+    try:
+        bundle = Bundle.load(args.manifest, args.entries, args.public_key)
+        for delta_manifest, delta_entries in args.delta:
+            bundle = bundle.apply_delta(delta_manifest, delta_entries)
+    except (BundleError, OSError, ValueError, KeyError) as e:
+        print(f"[ERROR] {e}")
+        return 1
+
+    result = bundle.verify(args.certificate_id, json.loads(args.data) if args.data else None, args.hash)
+    print(json.dumps(result, indent=2))
+    return 0 if result['isValid'] else 2
+
+if __name__ == '__main__':
+    sys.exit(main())
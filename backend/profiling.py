@@ -0,0 +1,150 @@
+"""
+Request Profiling - per-request database command counts and timings
+Counts MongoDB commands with a pymongo CommandListener, times JSON
+serialization, and reports both through the Server-Timing response header.
+"""
+
+import cProfile
+from datetime import datetime
+import os
+import random
+import threading
+import time
+from flask import request, current_app
+from schemas import JSONProvider
+from pymongo import monitoring
+
+# Per-request profiling (Server-Timing headers, command counting); off by default
+# because it exposes database timings to clients and adds a listener to every command
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING', '0') == '1'
+
+# Log any request that issues more database commands than this (0 disables the check)
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', '0'))
+
+# Fraction of requests to run under cProfile (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'profiles')
+)
+
+_local = threading.local()
+
+# cProfile hooks the whole interpreter (Python 3.12+ allows one active profiler),
+# so at most one sampled request is profiled at a time
+_profiler_lock = threading.Lock()
+
+class RequestStats:
+    """Measurements collected while handling one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_commands = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.response_size = None
+        self.profiler = None
+
+def current_stats():
+    """Stats of the request being handled by this thread, or None"""
+    return getattr(_local, 'stats', None)
+
+class CommandCounter(monitoring.CommandListener):
+    """Attributes every MongoDB command to the request running on the calling thread"""
+
+    def started(self, event):
+        stats = current_stats()
+        if stats is not None:
+            stats.db_commands += 1
+
+    def succeeded(self, event):
+        stats = current_stats()
+        if stats is not None:
+            stats.db_time += event.duration_micros / 1e6
+
+    def failed(self, event):
+        stats = current_stats()
+        if stats is not None:
+            stats.db_time += event.duration_micros / 1e6
+
+class TimedJSONProvider(JSONProvider):
+    """Flask JSON provider that records how long building JSON responses takes"""
+
+    def response(self, *args, **kwargs):
+        started = time.perf_counter()
+        response = super().response(*args, **kwargs)
+        stats = current_stats()
+        if stats is not None:
+            stats.serialization_time += time.perf_counter() - started
+        return response
+
+def start_request():
+    """before_request hook: begin collecting stats for this request"""
+    if not REQUEST_PROFILING:
+        return
+    stats = _local.stats = RequestStats()
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        # Skipped, never failed, when another request (or tool) is being profiled
+        if not _profiler_lock.acquire(blocking=False):
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            _profiler_lock.release()
+            return
+        stats.profiler = profiler
+
+def _stop_profiler(stats):
+    stats.profiler.disable()
+    _profiler_lock.release()
+
+def _dump_profile(profiler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = (request.endpoint or 'unknown').replace('.', '_')
+    path = os.path.join(PROFILE_DIR, f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{name}.prof")
+    profiler.dump_stats(path)
+    return path
+
+def finish_request(response):
+    """after_request hook: attach Server-Timing and enforce the query budget"""
+    stats = current_stats()
+    if stats is None:
+        return response
+    _local.stats = None
+
+    if stats.profiler is not None:
+        _stop_profiler(stats)
+        try:
+            _dump_profile(stats.profiler)
+        except OSError as e:
+            current_app.logger.warning('Failed to write profile: %s', e)
+
+    total = time.perf_counter() - stats.started
+    if not response.direct_passthrough:
+        stats.response_size = response.calculate_content_length()
+
+    timings = [
+        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.db_commands} queries"',
+        f'serialize;dur={stats.serialization_time * 1000:.2f}',
+        f'total;dur={total * 1000:.2f}'
+    ]
+    if stats.response_size is not None:
+        timings.append(f'size;desc="{stats.response_size} bytes"')
+    response.headers.add('Server-Timing', ', '.join(timings))
+
+    if QUERY_BUDGET and stats.db_commands > QUERY_BUDGET:
+        current_app.logger.warning(
+            'Query budget exceeded: %s %s (%s) issued %d queries, budget %d',
+            request.method, request.path, request.endpoint, stats.db_commands, QUERY_BUDGET
+        )
+
+    return response
+
+def abandon_request(error=None):
+    """teardown_request hook: make sure a failed request does not leak stats or a running profiler"""
+    stats = current_stats()
+    if stats is not None:
+        _local.stats = None
+        if stats.profiler is not None:
+            _stop_profiler(stats)
@@ -0,0 +1,351 @@
+"""
+Rate Limiting and Admission Control
+Token buckets per client and budget (verification, login, issuance) answer
+excess requests with 429, and a per-worker concurrency cap with a bounded wait
+queue sheds load with 503 before requests pile up on the MongoDB pool.
+"""
+
+import asyncio
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from functools import wraps
+import hashlib
+import math
+import os
+import threading
+import time
+from flask import g, request, jsonify, make_response
+from pymongo import ReturnDocument
+from database import get_db
+from circuit_breaker import breaker
+from models import COLLECTIONS
+from tenancy import PerTenant, tenancy_enabled, TENANT_MAX_CONCURRENT_REQUESTS
+import metrics
+
+# Configuration
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+
+# 'memory' (per worker) or 'mongodb' (shared by all workers, one query per limited request)
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+
+# Budgets as '<requests>/<second|minute|hour>'; the count is also the burst size
+RATE_LIMIT_BUDGETS = {
+    'verify': os.environ.get('RATE_LIMIT_VERIFY', '60/minute'),
+    'login': os.environ.get('RATE_LIMIT_LOGIN', '10/minute'),
+    'issue': os.environ.get('RATE_LIMIT_ISSUE', '120/minute')
+}
+
+# Comma-separated API keys that get their own bucket instead of sharing their IP's;
+# unknown keys are ignored, so rotating made-up keys does not bypass the limit
+RATE_LIMIT_API_KEYS = {key.strip() for key in os.environ.get('RATE_LIMIT_API_KEYS', '').split(',') if key.strip()}
+RATE_LIMIT_API_KEY_MULTIPLIER = float(os.environ.get('RATE_LIMIT_API_KEY_MULTIPLIER', '10'))
+API_KEY_HEADER = 'X-API-Key'
+
+# Number of reverse proxies in front of the app whose X-Forwarded-For entries are trusted
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+
+# Buckets kept by the memory backend (least recently used are dropped first)
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+
+# Requests handled at once per worker (pymongo's default maxPoolSize is 100),
+# how many may wait for a slot, and for how long
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', '100'))
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', '200'))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '2'))
+
+# Paths that bypass admission control so the service stays observable under load
+ADMISSION_EXEMPT_PATHS = ('/api/health', '/metrics')
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+def parse_rate(spec):
+    """'60/minute' -> (bucket capacity, tokens refilled per second)"""
+    count, _, period = spec.partition('/')
+    count = float(count)
+    seconds = PERIODS.get(period.strip().rstrip('s'))
+    if count <= 0 or seconds is None:
+        raise ValueError(f'Invalid rate limit: {spec!r}')
+    return count, count / seconds
+
+def _retry_after(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+# ==================== Token Bucket Stores ====================
+
+class MemoryBucketStore:
+    """Token buckets in a bounded LRU, local to the worker"""
+
+    # take() never waits on I/O, so the async routes call it on the event loop
+    blocking = False
+
+    def __init__(self, maxsize=RATE_LIMIT_MAX_KEYS):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """Take one token; returns (allowed, seconds until a token is available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                # An evicted client simply starts again with a full bucket
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def stats(self):
+        return {'keys': len(self._buckets)}
+
+class MongoBucketStore:
+    """Token buckets in MongoDB, updated atomically with one pipeline update per request"""
+
+    # take() is a synchronous query, so the async routes call it in a thread
+    blocking = True
+
+    def __init__(self):
+        self._indexed = False
+
+    def _collection(self):
+        collection = get_db()[COLLECTIONS['rate_limits']]
+        if not self._indexed:
+            collection.create_index('expires_at', expireAfterSeconds=0)
+            self._indexed = True
+        return collection
+
+    def take(self, key, capacity, rate):
+        now = time.time()
+        refilled = {'$min': [capacity, {'$add': [
+            {'$ifNull': ['$tokens', capacity]},
+            {'$multiply': [{'$max': [0, {'$subtract': [now, {'$ifNull': ['$updated', now]}]}]}, rate]}
+        ]}]}
+        bucket = self._collection().find_one_and_update(
+            {'_id': key},
+            [
+                {'$set': {'tokens': refilled, 'updated': now,
+                          # A bucket left alone this long is full again and can be dropped
+                          'expires_at': datetime.utcnow() + timedelta(seconds=capacity / rate)}},
+                {'$set': {'allowed': {'$gte': ['$tokens', 1]},
+                          'tokens': {'$cond': [{'$gte': ['$tokens', 1]}, {'$subtract': ['$tokens', 1]}, '$tokens']}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket['allowed']:
+            return True, 0.0
+        return False, (1 - bucket['tokens']) / rate
+
+    def stats(self):
+        return {}
+
+# ==================== Rate Limiter ====================
+
+class RateLimiter:
+    """Named budgets applied per client (IP address, or a registered API key)"""
+
+    def __init__(self, budgets, store, api_keys=(), api_key_multiplier=RATE_LIMIT_API_KEY_MULTIPLIER,
+                 trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES, enabled=RATE_LIMIT_ENABLED):
+        self.budgets = {name: parse_rate(spec) for name, spec in budgets.items()}
+        self.store = store
+        # Used while a shared store is unreachable, so limits keep holding per worker
+        self.local = store if not store.blocking else MemoryBucketStore()
+        self.api_keys = set(api_keys)
+        self.api_key_multiplier = api_key_multiplier
+        self.trusted_proxies = trusted_proxies
+        self.enabled = enabled
+
+    def client_ip(self, remote_addr, forwarded_for=None):
+        """The client address, looking through the trusted proxies' X-Forwarded-For entries"""
+        if self.trusted_proxies and forwarded_for:
+            hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+            if len(hops) >= self.trusted_proxies:
+                return hops[-self.trusted_proxies]
+        return remote_addr or 'unknown'
+
+    def hit(self, budget, remote_addr, forwarded_for=None, api_key=None):
+        """Count one request against a budget; returns (allowed, retry_after seconds)"""
+        if not self.enabled:
+            return True, 0.0
+        capacity, rate = self.budgets[budget]
+        if api_key and api_key in self.api_keys:
+            # Hashed so keys never show up in the shared store
+            client = 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:32]
+            capacity, rate = capacity * self.api_key_multiplier, rate * self.api_key_multiplier
+        else:
+            client = 'ip:' + self.client_ip(remote_addr, forwarded_for)
+
+        key = f'{budget}|{client}'
+        # While the circuit is open the shared store is not waited on
+        store = self.local if breaker.is_open() else self.store
+        try:
+            allowed, retry_after = store.take(key, capacity, rate)
+        except Exception as e:
+            # A failing shared store must not take the API down with it
+            print(f"[ERROR] Rate limit store failed: {e}")
+            metrics.rate_limit_decisions.inc(budget=budget, decision='error')
+            if store is self.local:
+                return True, 0.0
+            allowed, retry_after = self.local.take(key, capacity, rate)
+        metrics.rate_limit_decisions.inc(budget=budget, decision='allowed' if allowed else 'limited')
+        return allowed, retry_after
+
+    def stats(self):
+        return self.store.stats()
+
+def create_store(backend=RATE_LIMIT_BACKEND):
+    if backend == 'mongodb':
+        return MongoBucketStore()
+    if backend == 'memory':
+        return MemoryBucketStore()
+    raise ValueError(f'Unknown RATE_LIMIT_BACKEND: {backend!r}')
+
+# Shared limiter used by the API
+rate_limiter = RateLimiter(RATE_LIMIT_BUDGETS, create_store(), api_keys=RATE_LIMIT_API_KEYS)
+
+def too_many_requests(retry_after):
+    response = make_response(jsonify({'error': 'Too many requests'}), 429)
+    response.headers['Retry-After'] = _retry_after(retry_after)
+    return response
+
+def rate_limited(budget):
+    """Decorator for routes: count each request against the client's budget"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            allowed, retry_after = rate_limiter.hit(
+                budget, request.remote_addr,
+                request.headers.get('X-Forwarded-For'), request.headers.get(API_KEY_HEADER)
+            )
+            if not allowed:
+                return too_many_requests(retry_after)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+# ==================== Admission Control ====================
+
+class AdmissionControl:
+    """
+    Concurrency cap for request threads. Requests beyond the cap wait in a
+    bounded queue; when the queue is full or the wait times out they are rejected.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS, max_queue=ADMISSION_QUEUE_SIZE,
+                 timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Returns 'admitted' or 'queued' once a slot is held, or 'queue_full' / 'timeout'"""
+        with self._condition:
+            if self.active < self.max_concurrent:
+                self.active += 1
+                return 'admitted'
+            if self.waiting >= self.max_queue:
+                return 'queue_full'
+            self.waiting += 1
+            try:
+                if not self._condition.wait_for(lambda: self.active < self.max_concurrent, self.timeout):
+                    return 'timeout'
+                self.active += 1
+                return 'queued'
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def stats(self):
+        return {'active': self.active, 'waiting': self.waiting, 'max_concurrent': self.max_concurrent}
+
+class AsyncAdmissionControl:
+    """AdmissionControl for coroutines on one event loop (the async routes in asgi.py)"""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS, max_queue=ADMISSION_QUEUE_SIZE,
+                 timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = deque()
+
+    async def acquire(self):
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return 'admitted'
+        if len(self._waiters) >= self.max_queue:
+            return 'queue_full'
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # release() hands its slot straight to the waiter
+            await asyncio.wait_for(waiter, self.timeout)
+            return 'queued'
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait timed out
+                return 'queued'
+            return 'timeout'
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {'active': self.active, 'waiting': len(self._waiters), 'max_concurrent': self.max_concurrent}
+
+# Shared admission control for the Flask request threads
+admission = AdmissionControl()
+
+# Each tenant's share of the request threads (only with TENANTS set)
+tenant_admission = PerTenant(lambda: AdmissionControl(max_concurrent=TENANT_MAX_CONCURRENT_REQUESTS))
+
+def service_unavailable():
+    response = make_response(jsonify({'error': 'Server is busy, try again shortly'}), 503)
+    response.headers['Retry-After'] = _retry_after(ADMISSION_QUEUE_TIMEOUT)
+    return response
+
+def admit_request():
+    """before_request hook: hold a slot for the request, or shed it with 503"""
+    if request.path in ADMISSION_EXEMPT_PATHS or request.method == 'OPTIONS':
+        return None
+    if tenancy_enabled():
+        # The tenant's own cap comes first, so its backlog does not occupy the shared queue
+        tenant_slot = tenant_admission.instance()
+        decision = tenant_slot.acquire()
+        if decision not in ('admitted', 'queued'):
+            metrics.admission_decisions.inc(decision='tenant_' + decision)
+            return service_unavailable()
+        g.tenant_slot = tenant_slot
+    decision = admission.acquire()
+    metrics.admission_decisions.inc(decision=decision)
+    if decision not in ('admitted', 'queued'):
+        return service_unavailable()
+    g.admitted = True
+    return None
+
+def release_request(error=None):
+    """teardown_request hook"""
+    if g.pop('admitted', False):
+        admission.release()
+    tenant_slot = g.pop('tenant_slot', None)
+    if tenant_slot is not None:
+        tenant_slot.release()
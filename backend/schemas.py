@@ -0,0 +1,222 @@
+"""
+Schemas - typed request and response models for the API
+Request bodies are decoded straight into msgspec Structs by decoders compiled
+once per model, so parsing, type checks and constraints (required fields, ID
+format, lengths) happen in one pass over the raw bytes; a malformed body gets
+400 before the view runs. Responses are Structs (or plain dicts) encoded by one
+shared msgspec encoder, installed as the app's JSON provider so jsonify() and
+the async handlers produce the same bytes.
+"""
+
+from typing import Annotated, Optional, Union
+import msgspec
+from msgspec import Meta, Struct, UNSET, UnsetType
+from bson import ObjectId
+from flask import request, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+NonEmpty = Annotated[str, Meta(min_length=1)]
+Email = Annotated[str, Meta(min_length=3, pattern='@')]
+Password = Annotated[str, Meta(min_length=6)]
+ObjectIdString = Annotated[str, Meta(pattern='^[0-9a-fA-F]{24}$')]
+Score = Union[int, float]
+
+# ==================== Requests ====================
+
+class LoginRequest(Struct, kw_only=True):
+    email: NonEmpty
+    password: NonEmpty
+
+class RegisterRequest(Struct, kw_only=True):
+    email: Email
+    password: Password
+    name: NonEmpty
+    # Unknown roles fall back to student
+    role: str = 'student'
+
+class CourseRequest(Struct, kw_only=True):
+    name: NonEmpty
+    description: str = ''
+    instructor_id: Optional[ObjectIdString] = None
+
+class CourseUpdate(Struct, kw_only=True):
+    """Fields left out are not changed"""
+    name: Union[NonEmpty, UnsetType] = UNSET
+    description: Union[str, None, UnsetType] = UNSET
+    instructor_id: Union[ObjectIdString, None, UnsetType] = UNSET
+
+class GradeRequest(Struct, kw_only=True):
+    """Creates a grade, or updates the fields given when (student_id, course_id) has one"""
+    student_id: ObjectIdString
+    course_id: ObjectIdString
+    grade: Union[str, None, UnsetType] = UNSET
+    score: Union[Score, None, UnsetType] = UNSET
+    feedback: Union[str, None, UnsetType] = UNSET
+
+class GradeUpdate(Struct, kw_only=True):
+    """Fields left out are not changed"""
+    grade: Union[str, None, UnsetType] = UNSET
+    score: Union[Score, None, UnsetType] = UNSET
+    feedback: Union[str, None, UnsetType] = UNSET
+    certificate_issued: Union[bool, UnsetType] = UNSET
+
+class CertificateRequest(Struct, kw_only=True):
+    student_id: ObjectIdString
+    course_id: ObjectIdString
+    # Abbreviated into the certificate ID only; the stored name comes from the course
+    course_name: str = 'COURSE'
+    grade: Optional[str] = None
+    score: Optional[Score] = None
+    instructor_name: str = 'Dr. Sarah Smith'
+
+class VerifyRequest(Struct, kw_only=True):
+    certificate_id: Optional[str] = None
+    hash: Optional[str] = None
+
+# One field of a bulk import row; CSV cells are strings, NDJSON may hold numbers
+ImportValue = Union[str, int, float, bool, None]
+
+# ==================== Responses ====================
+
+class User(Struct, kw_only=True):
+    id: str
+    email: str
+    name: str
+    role: str
+
+class Course(Struct, kw_only=True):
+    id: str
+    name: Optional[str]
+    description: Optional[str] = ''
+    instructor_id: Optional[str] = None
+
+class CourseDetail(Course, kw_only=True):
+    instructor_name: Optional[str] = None
+
+class CourseListing(CourseDetail, kw_only=True):
+    created_at: Optional[str] = None
+    student_count: int = 0
+
+class Grade(Struct, kw_only=True):
+    id: str
+    student_id: Optional[str]
+    course_id: Optional[str]
+    grade: Optional[str] = None
+    score: Optional[Score] = None
+    feedback: Optional[str] = None
+    # Only reported by PUT /api/grades/<id>
+    certificate_issued: Union[bool, UnsetType] = UNSET
+
+class GradeListing(Grade, kw_only=True):
+    student_name: Optional[str] = None
+    student_email: Optional[str] = None
+    course_name: Optional[str] = None
+    submission_date: Optional[str] = None
+
+class IssuedCertificate(Struct, kw_only=True):
+    id: str
+    certificate_id: str
+    student_id: Optional[str]
+    course_id: Optional[str]
+    grade: Optional[str]
+    score: Optional[Score]
+    issue_date: str
+    status: str
+
+class Certificate(Struct, kw_only=True):
+    id: str
+    certificate_id: Optional[str]
+    student_id: Optional[str]
+    student_name: Optional[str]
+    student_email: Optional[str]
+    course_id: Optional[str]
+    course_name: Optional[str]
+    grade: Optional[str] = None
+    score: Optional[Score] = None
+    issue_date: Optional[str] = None
+    blockchain_hash: Optional[str] = None
+    blockchain_block_number: Optional[int] = None
+    status: str = 'pending'
+    instructor_name: Optional[str] = None
+
+class LedgerEntry(Struct, kw_only=True):
+    certificate_id: Optional[str]
+    hash: Optional[str]
+    block_number: Optional[int]
+    timestamp: Optional[str]
+    verified: bool = True
+
+# ==================== Decoding ====================
+
+REQUEST_MODELS = (
+    LoginRequest, RegisterRequest, CourseRequest, CourseUpdate, GradeRequest, GradeUpdate,
+    CertificateRequest, VerifyRequest
+)
+
+# Compiled once: each decoder validates while it parses
+_decoders = {model: msgspec.json.Decoder(model) for model in REQUEST_MODELS}
+
+# NDJSON grade import rows: a flat object, rejected in the same pass if a value is nested
+import_row_decoder = msgspec.json.Decoder(dict[str, ImportValue])
+
+class InvalidPayload(Exception):
+    """The request body is not JSON, or does not match its model"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def decode(model, body):
+    """Decode and validate a JSON body (bytes) into `model`; raises InvalidPayload"""
+    try:
+        return _decoders[model].decode(body)
+    except msgspec.ValidationError as e:
+        raise InvalidPayload(str(e))
+    except msgspec.DecodeError as e:
+        raise InvalidPayload(f'Malformed JSON: {e}')
+
+def load(model):
+    """The current request's JSON body as `model`; raises InvalidPayload"""
+    if not request.is_json:
+        raise InvalidPayload('Request body must be JSON (Content-Type: application/json)', 415)
+    return decode(model, request.get_data())
+
+def invalid_payload(error):
+    """errorhandler for InvalidPayload"""
+    return jsonify({'error': error.message}), error.status
+
+def present(struct):
+    """{field: value} of the fields a partial update (e.g. CourseUpdate) was given"""
+    return {
+        field: getattr(struct, field) for field in struct.__struct_fields__
+        if getattr(struct, field) is not UNSET
+    }
+
+# ==================== Encoding ====================
+
+def _encode_fallback(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, bytes):
+        # Hashes are stored as binary (see storage_format.py)
+        return value.hex()
+    raise NotImplementedError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+# Keys are sorted like Flask's default provider, so response bodies keep their layout
+encoder = msgspec.json.Encoder(enc_hook=_encode_fallback, order='sorted')
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by msgspec: jsonify() encodes dicts and Structs in one pass"""
+
+    def dumps(self, obj, **kwargs):
+        return encoder.encode(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return msgspec.json.decode(s)
+
+    def response(self, *args, **kwargs):
+        body = encoder.encode(self._prepare_response_obj(args, kwargs))
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            body = msgspec.json.format(body, indent=2)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,296 @@
+"""
+Certificate Search Index - in-memory inverted index for /api/certificates/search
+Certificate IDs, student names and emails and course names are tokenized into a
+term -> certificates map with a sorted term list, so prefix and one-typo matches
+are a handful of binary searches instead of a collection scan.
+"""
+
+import bisect
+import contextvars
+from datetime import datetime, timedelta
+import itertools
+import os
+import re
+import threading
+import time
+from bson import ObjectId
+from database import get_db
+from models import COLLECTIONS
+from certificate_snapshots import resolve_names_many
+from tenancy import PerTenant
+
+# Configuration
+SEARCH_INDEX_ENABLED = os.environ.get('SEARCH_INDEX_ENABLED', '1') == '1'
+
+# Seconds between catch-up scans for certificates issued by other workers
+SEARCH_REFRESH_INTERVAL = float(os.environ.get('SEARCH_REFRESH_INTERVAL', '5'))
+
+# Seconds between background rebuilds, which pick up other workers' renames
+SEARCH_REBUILD_INTERVAL = float(os.environ.get('SEARCH_REBUILD_INTERVAL', '600'))
+
+# Query words at least this long also match terms one typo away
+SEARCH_MIN_FUZZY_LENGTH = int(os.environ.get('SEARCH_MIN_FUZZY_LENGTH', '4'))
+
+# ObjectIds are generated client-side, so catch-up scans overlap the previous window by this much
+SEARCH_REFRESH_OVERLAP = timedelta(seconds=60)
+
+# Certificates read per batch while (re)building; names of certificates
+# without a snapshot are resolved with one query per batch
+SEARCH_LOAD_BATCH_SIZE = 1000
+
+# Page size limit for /api/certificates/search
+SEARCH_MAX_PER_PAGE = 100
+
+# Whole certificate IDs are indexed under this prefix so "CERT-2026-00" matches as typed
+CERTIFICATE_ID_TERM = '#'
+
+_WORD = re.compile(r'[0-9a-z]+')
+_ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'
+
+# Match quality per query word
+EXACT, PREFIX, FUZZY = 3, 2, 1
+CERTIFICATE_ID_MATCH = 10
+
+SEARCH_PROJECTION = {'certificate_id': 1, 'student_id': 1, 'course_id': 1,
+                     'student_name': 1, 'student_email': 1, 'course_name': 1}
+
+def tokenize(text):
+    """Lowercase alphanumeric words of a string"""
+    return _WORD.findall(str(text).lower()) if text else []
+
+def _edits(word):
+    """Strings one delete, transpose, replace or insert away from word"""
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    edits = {left + right[1:] for left, right in splits if right}
+    edits.update(left + right[1] + right[0] + right[2:] for left, right in splits if len(right) > 1)
+    edits.update(left + c + right[1:] for left, right in splits if right for c in _ALPHABET)
+    edits.update(left + c + right for left, right in splits for c in _ALPHABET)
+    edits.discard(word)
+    return edits
+
+def certificate_terms(certificate):
+    """Index terms of a certificate (snapshot fields already resolved)"""
+    terms = set()
+    certificate_id = certificate.get('certificate_id')
+    if certificate_id:
+        terms.add(CERTIFICATE_ID_TERM + str(certificate_id).lower())
+        terms.update(tokenize(certificate_id))
+    email = certificate.get('student_email')
+    if email:
+        terms.add(str(email).lower())
+        terms.update(tokenize(email))
+    terms.update(tokenize(certificate.get('student_name')))
+    terms.update(tokenize(certificate.get('course_name')))
+    return terms
+
+class InvertedIndex:
+    """Term -> set of document numbers, plus a sorted term list for prefix lookups"""
+
+    def __init__(self):
+        self.postings = {}
+        self.terms = []
+        self.doc_ids = []
+        self.doc_terms = []
+        self.numbers = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def add(self, doc_id, terms, sort=True):
+        """Index (or re-index) one document; bulk loads pass sort=False and call finish()"""
+        with self._lock:
+            number = self.numbers.get(doc_id)
+            if number is None:
+                number = self.numbers[doc_id] = len(self.doc_ids)
+                self.doc_ids.append(doc_id)
+                self.doc_terms.append(())
+            for term in self.doc_terms[number]:
+                self.postings[term].discard(number)
+            for term in terms:
+                posting = self.postings.get(term)
+                if posting is None:
+                    posting = self.postings[term] = set()
+                    if sort:
+                        bisect.insort(self.terms, term)
+                    else:
+                        self.terms.append(term)
+                posting.add(number)
+            self.doc_terms[number] = tuple(terms)
+
+    def finish(self):
+        """Sort the term list after a bulk load"""
+        self.terms.sort()
+
+    def prefix(self, prefix):
+        """Union of the postings of every term starting with prefix"""
+        docs = set()
+        terms = self.terms
+        i = bisect.bisect_left(terms, prefix)
+        while i < len(terms) and terms[i].startswith(prefix):
+            docs |= self.postings[terms[i]]
+            i += 1
+        return docs
+
+    def search(self, query):
+        """Return document numbers matching query, best first"""
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        scores = None
+        for word in tokenize(query):
+            matches = dict.fromkeys(self.prefix(word) if len(word) > 1 else (), PREFIX)
+            matches.update(dict.fromkeys(self.postings.get(word, ()), EXACT))
+            if len(word) >= SEARCH_MIN_FUZZY_LENGTH:
+                for variant in _edits(word):
+                    for number in self.prefix(variant) if len(variant) >= SEARCH_MIN_FUZZY_LENGTH - 1 else ():
+                        matches.setdefault(number, FUZZY)
+            # Every word has to match
+            if scores is None:
+                scores = matches
+            else:
+                scores = {number: score + matches[number] for number, score in scores.items() if number in matches}
+            if not scores:
+                break
+        scores = scores or {}
+
+        for number in self.prefix(CERTIFICATE_ID_TERM + query):
+            scores[number] = scores.get(number, 0) + CERTIFICATE_ID_MATCH
+
+        # Newer certificates first among equal scores
+        return sorted(scores, key=lambda number: (-scores[number], -number))
+
+class CertificateSearch:
+    """
+    Search over certificates, kept current by the write routes.
+    Other workers' new certificates arrive through periodic catch-up scans and
+    their renames through periodic background rebuilds.
+    """
+
+    def __init__(self, enabled=SEARCH_INDEX_ENABLED):
+        self.enabled = enabled
+        self.index = None
+        self.built_at = None
+        self._refreshed_at = None
+        self._refreshed_monotonic = 0.0
+        self._refresh_lock = threading.Lock()
+        self._rebuilding = threading.Lock()
+
+    def _load(self, index, query, sort=True):
+        """Index the certificates matching query, resolving names of certificates without a snapshot"""
+        cursor = get_db()[COLLECTIONS['certificates']].find(
+            query, SEARCH_PROJECTION, batch_size=SEARCH_LOAD_BATCH_SIZE
+        ).sort('_id', 1)
+        loaded = 0
+        while True:
+            batch = list(itertools.islice(cursor, SEARCH_LOAD_BATCH_SIZE))
+            if not batch:
+                return loaded
+            legacy = [cert for cert in batch if 'student_name' not in cert]
+            for cert, names in zip(legacy, resolve_names_many(legacy)):
+                cert.update(names)
+            for cert in batch:
+                index.add(cert['_id'], certificate_terms(cert), sort=sort)
+            loaded += len(batch)
+
+    def build(self):
+        """Build the index from a projected scan of the certificates"""
+        if not self.enabled:
+            return False
+        started_at = datetime.utcnow()
+        index = InvertedIndex()
+        self._load(index, {}, sort=False)
+        index.finish()
+
+        self.index = index
+        self.built_at = started_at
+        self._refreshed_at = started_at
+        self._refreshed_monotonic = time.monotonic()
+        return True
+
+    def refresh(self):
+        """Catch up with certificates inserted by other workers since the last scan"""
+        if self.index is None or not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            started_at = datetime.utcnow()
+            since = ObjectId.from_datetime(self._refreshed_at - SEARCH_REFRESH_OVERLAP)
+            self._load(self.index, {'_id': {'$gte': since}})
+            self._refreshed_at = started_at
+        finally:
+            self._refreshed_monotonic = time.monotonic()
+            self._refresh_lock.release()
+
+    def _rebuild_in_background(self):
+        if not self._rebuilding.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.build()
+            except Exception as e:
+                print(f"[ERROR] Failed to rebuild search index: {e}")
+            finally:
+                self._rebuilding.release()
+        # The copied context keeps the rebuild on the current tenant's database
+        threading.Thread(target=contextvars.copy_context().run, args=(run,),
+                         name='search-index-rebuild', daemon=True).start()
+
+    def add(self, certificate):
+        """Index a certificate written by this worker (raw document with snapshot fields)"""
+        if self.index is not None:
+            self.index.add(certificate['_id'], certificate_terms(certificate))
+
+    def reindex(self, query):
+        """Re-read and re-index certificates matching query, e.g. after a rename"""
+        if self.index is not None:
+            self._load(self.index, query)
+
+    def search(self, query):
+        """ObjectIds of matching certificates, best first; None if the index is not built"""
+        index = self.index
+        if index is None:
+            return None
+        if time.monotonic() - self._refreshed_monotonic > SEARCH_REFRESH_INTERVAL:
+            try:
+                self.refresh()
+            except Exception:
+                pass
+        if (datetime.utcnow() - self.built_at).total_seconds() > SEARCH_REBUILD_INTERVAL:
+            self._rebuild_in_background()
+        return [index.doc_ids[number] for number in index.search(query)]
+
+    def stats(self):
+        """Size of the index"""
+        index = self.index
+        if index is None:
+            return {'enabled': self.enabled, 'built': False}
+        return {
+            'enabled': self.enabled,
+            'built': True,
+            'built_at': self.built_at.isoformat(),
+            'documents': len(index),
+            'terms': len(index.postings)
+        }
+
+def search_database(query, limit=1000):
+    """
+    Fallback when the index is disabled: case-insensitive prefix match on the
+    snapshot fields, newest first (no typo tolerance, capped at limit results)
+    """
+    pattern = {'$regex': '^' + re.escape(query.strip()), '$options': 'i'}
+    word_pattern = {'$regex': r'\b' + re.escape(query.strip()), '$options': 'i'}
+    cursor = get_db()[COLLECTIONS['certificates']].find(
+        {'$or': [
+            {'certificate_id': pattern},
+            {'student_email': pattern},
+            {'student_name': word_pattern},
+            {'course_name': word_pattern}
+        ]},
+        {'_id': 1}
+    ).sort('_id', -1).limit(limit)
+    return [doc['_id'] for doc in cursor]
+
+# Shared index used by the API, one per tenant
+certificate_search = PerTenant(CertificateSearch)
@@ -0,0 +1,329 @@
+"""
+Synthetic Dataset Generator for ChainLearn
+Seeds users, courses, grades, certificates and ledger transactions at scale,
+with Zipfian course sizes and a hot subset of certificates.
+Certificate hashes are computed with generate_certificate_hash, so seeded
+certificates verify exactly like ones issued through the API.
+
+Examples:
+    python seed_data.py --certificates 100000
+    python seed_data.py --students 200000 --courses 2000 --certificates 1000000 --workers 8
+    python seed_data.py --drop --certificates 10000 --hot-output hot.json
+"""
+
+import argparse
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import hashlib
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from blockchain_utils import generate_certificate_hash
+from storage_format import pack_hash
+from models import COLLECTIONS
+from ledger_partitions import catalog, partition_name, partition_year, rebuild_catalog, PARTITION_PREFIX
+
+DEFAULT_PASSWORD = 'Seed@123'
+GRADES = ['A+', 'A', 'A-', 'B+', 'B', 'B-', 'C+', 'C']
+FIRST_NAMES = ['Alice', 'Bob', 'Carol', 'David', 'Eva', 'Farah', 'George', 'Hana', 'Ivan', 'Julia',
+               'Kofi', 'Lena', 'Mateo', 'Nora', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sven', 'Yuki']
+LAST_NAMES = ['Johnson', 'Smith', 'Davis', 'Garcia', 'Nguyen', 'Okafor', 'Patel', 'Rossi',
+              'Schmidt', 'Tanaka', 'Williams', 'Kowalski', 'Haddad', 'Silva', 'Larsen']
+SUBJECTS = ['Web Development', 'Blockchain Basics', 'Data Structures', 'Machine Learning',
+            'Databases', 'Cryptography', 'Operating Systems', 'Networks', 'Statistics', 'UX Design']
+
+def _person_name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+def _millisecond_precision(value):
+    """MongoDB stores datetimes with millisecond precision; hash what will be read back"""
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+class BatchInserter:
+    """Runs insert_many batches on a thread pool with a bounded number in flight"""
+
+    def __init__(self, workers, progress=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers * 2)
+        self.futures = []
+        self.inserted = {}
+        self.progress = progress
+        self._lock = threading.Lock()
+
+    def _insert(self, collection, docs):
+        try:
+            collection.insert_many(docs, ordered=False)
+            with self._lock:
+                self.inserted[collection.name] = self.inserted.get(collection.name, 0) + len(docs)
+                if self.progress:
+                    self.progress(collection.name, self.inserted[collection.name])
+        finally:
+            self.slots.release()
+
+    def submit(self, collection, docs):
+        self.slots.acquire()
+        self.futures.append(self.executor.submit(self._insert, collection, docs))
+
+    def wait(self):
+        self.executor.shutdown(wait=True)
+        for future in self.futures:
+            future.result()
+        return self.inserted
+
+def seed(db, students=1000, teachers=20, courses=50, certificates=10000,
+         anchored_fraction=0.9, zipf_s=1.1, hot_fraction=0.01, batch_size=5000,
+         workers=4, rng=None, password=DEFAULT_PASSWORD, sample_size=10000,
+         drop=False, progress=None):
+    """
+    Generate and insert a dataset. Returns a summary with the seeded IDs that
+    benchmarks need (students, courses, a sample of anchored certificates and
+    the hot certificates).
+    """
+    rng = rng or random.Random()
+    tag = uuid.UUID(int=rng.getrandbits(128)).hex[:8]
+    now = datetime.utcnow()
+
+    if drop:
+        for name in COLLECTIONS.values():
+            db.drop_collection(name)
+        for name in db.list_collection_names():
+            if name.startswith(PARTITION_PREFIX):
+                db.drop_collection(name)
+        catalog.invalidate()
+
+    users_collection = db[COLLECTIONS['users']]
+    courses_collection = db[COLLECTIONS['courses']]
+    certificates_collection = db[COLLECTIONS['certificates']]
+    grades_collection = db[COLLECTIONS['grades']]
+
+    # Continue numbering after whatever is already in the database
+    next_sequence = certificates_collection.estimated_document_count() + 1
+    # Reserved up front so live writers never reuse them; unanchored certificates leave gaps
+    next_block = catalog.reserve_blocks(certificates, db) if certificates else catalog.last_block(db) + 1
+
+    password_hash = hashlib.sha256(password.encode()).hexdigest()
+    inserter = BatchInserter(workers, progress)
+
+    # Users and courses are small enough to keep in memory for reference
+    teacher_docs = [{
+        'email': f'teacher{i}.{tag}@seed.chainlearn', 'name': f'Dr. {_person_name(rng)}',
+        'role': 'teacher', 'password_hash': password_hash, 'created_at': now
+    } for i in range(teachers)]
+    student_docs = [{
+        'email': f'student{i}.{tag}@seed.chainlearn', 'name': _person_name(rng),
+        'role': 'student', 'password_hash': password_hash, 'created_at': now
+    } for i in range(students)]
+    for batch in _batches(teacher_docs + student_docs, batch_size):
+        inserter.submit(users_collection, batch)
+
+    # insert_many assigns _id in place, so users must be written before courses reference them
+    inserter.wait()
+
+    course_docs = []
+    instructor_names = []
+    for i in range(courses):
+        instructor = rng.choice(teacher_docs)
+        course_docs.append({
+            'name': f'{rng.choice(SUBJECTS)} {100 + i}',
+            'description': 'Generated course',
+            'instructor_id': instructor['_id'],
+            'created_at': now
+        })
+        instructor_names.append(instructor['name'])
+    inserter = BatchInserter(workers, progress)
+    for batch in _batches(course_docs, batch_size):
+        inserter.submit(courses_collection, batch)
+    inserter.wait()
+
+    # Zipfian enrollment: course k gets weight 1 / k^s
+    cumulative_weights = list(itertools.accumulate(1.0 / (rank ** zipf_s) for rank in range(1, courses + 1)))
+    total_weight = cumulative_weights[-1] if cumulative_weights else 0
+
+    hot_count = max(1, int(certificates * hot_fraction)) if certificates else 0
+    hot_certificates = []
+    sample = []
+    seen_grades = set()
+    counts = {'certificates': 0, 'blockchain_transactions': 0, 'grades': 0}
+
+    def generate():
+        block_number = next_block
+        for i in range(certificates):
+            student = student_docs[rng.randrange(students)]
+            course_index = min(bisect.bisect(cumulative_weights, rng.random() * total_weight), courses - 1)
+            course = course_docs[course_index]
+            instructor_name = instructor_names[course_index]
+            issue_date = _millisecond_precision(now - timedelta(seconds=rng.randrange(3 * 365 * 86400)))
+            grade = rng.choice(GRADES)
+            score = rng.randint(60, 100)
+            sequence = next_sequence + i
+            certificate_id = f'CERT-{issue_date.year}-{str(sequence).zfill(4)}-{course["name"].upper()[:5]}'
+
+            certificate = {
+                'certificate_id': certificate_id,
+                'student_id': student['_id'],
+                'course_id': course['_id'],
+                'student_name': student['name'],
+                'student_email': student['email'],
+                'course_name': course['name'],
+                'grade': grade,
+                'score': score,
+                'instructor_name': instructor_name,
+                'issue_date': issue_date,
+                'status': 'issued',
+                'created_at': issue_date
+            }
+            transaction = None
+            if rng.random() < anchored_fraction:
+                hash_value = generate_certificate_hash({
+                    'student_name': student['name'],
+                    'course_name': course['name'],
+                    'grade': grade,
+                    'issue_date': issue_date.isoformat(),
+                    'instructor_name': instructor_name
+                })
+                certificate.update({
+                    'blockchain_hash': pack_hash(hash_value),
+                    'blockchain_block_number': block_number,
+                    'status': 'verified'
+                })
+                transaction = {
+                    'certificate_id': certificate_id,
+                    'hash': pack_hash(hash_value),
+                    'block_number': block_number,
+                    'timestamp': issue_date,
+                    'verified': True
+                }
+                block_number += 1
+                if len(hot_certificates) < hot_count:
+                    hot_certificates.append((certificate_id, hash_value))
+                elif len(sample) < sample_size:
+                    sample.append((certificate_id, hash_value))
+                elif rng.random() < sample_size / (i + 1):
+                    sample[rng.randrange(sample_size)] = (certificate_id, hash_value)
+
+            grade_doc = None
+            pair = (certificate['student_id'], certificate['course_id'])
+            if pair not in seen_grades:
+                seen_grades.add(pair)
+                grade_doc = {
+                    'student_id': pair[0],
+                    'course_id': pair[1],
+                    'grade': grade,
+                    'score': score,
+                    'feedback': '',
+                    'submission_date': issue_date,
+                    'certificate_issued': True,
+                    'created_at': issue_date,
+                    'updated_at': issue_date
+                }
+            yield certificate, transaction, grade_doc
+
+    inserter = BatchInserter(workers, progress)
+    for rows in _batches(generate(), batch_size):
+        certificate_batch = [row[0] for row in rows]
+        transaction_batch = [row[1] for row in rows if row[1]]
+        grade_batch = [row[2] for row in rows if row[2]]
+        inserter.submit(certificates_collection, certificate_batch)
+        # Transactions go to the ledger partition of their issuance year
+        by_year = {}
+        for transaction in transaction_batch:
+            by_year.setdefault(partition_year(transaction['certificate_id']), []).append(transaction)
+        for year, transactions in by_year.items():
+            inserter.submit(db[partition_name(year)], transactions)
+        if grade_batch:
+            inserter.submit(grades_collection, grade_batch)
+        counts['certificates'] += len(certificate_batch)
+        counts['blockchain_transactions'] += len(transaction_batch)
+        counts['grades'] += len(grade_batch)
+    inserter.wait()
+    rebuild_catalog(db)
+
+    return {
+        'tag': tag,
+        'counts': {'users': teachers + students, 'courses': courses, **counts},
+        'students': [str(student['_id']) for student in student_docs],
+        'student_emails': [student['email'] for student in student_docs],
+        'courses': [(str(course['_id']), course['name']) for course in course_docs],
+        'hot_certificates': hot_certificates,
+        'certificates': hot_certificates + sample
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed ChainLearn with a synthetic dataset')
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--teachers', type=int, default=20)
+    parser.add_argument('--courses', type=int, default=50)
+    parser.add_argument('--certificates', type=int, default=10000)
+    parser.add_argument('--anchored-fraction', type=float, default=0.9,
+                        help='Fraction of certificates already submitted to the ledger')
+    parser.add_argument('--zipf-s', type=float, default=1.1, help='Zipf exponent for course sizes')
+    parser.add_argument('--hot-fraction', type=float, default=0.01,
+                        help='Fraction of certificates reported as hot')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=4, help='Parallel insert_many batches')
+    parser.add_argument('--seed', type=int, help='Random seed for a reproducible dataset')
+    parser.add_argument('--password', default=DEFAULT_PASSWORD, help='Password for all seeded users')
+    parser.add_argument('--drop', action='store_true', help='Drop all ChainLearn collections first')
+    parser.add_argument('--hot-output', help='Write the hot certificate IDs and hashes to this JSON file')
+    args = parser.parse_args(argv)
+
+    from database import init_db, get_db
+    from http_cache import bump_versions
+
+    if not init_db():
+        print("[ERROR] Failed to connect to database")
+        return 1
+    if args.drop:
+        answer = input(f"Drop all ChainLearn collections in '{get_db().name}'? [y/N] ")
+        if answer.strip().lower() != 'y':
+            return 1
+
+    last_report = [0.0]
+
+    def progress(collection, inserted):
+        now = time.monotonic()
+        if now - last_report[0] >= 2:
+            last_report[0] = now
+            print(f"  {collection}: {inserted} inserted")
+
+    started = time.monotonic()
+    summary = seed(
+        get_db(), students=args.students, teachers=args.teachers, courses=args.courses,
+        certificates=args.certificates, anchored_fraction=args.anchored_fraction,
+        zipf_s=args.zipf_s, hot_fraction=args.hot_fraction, batch_size=args.batch_size,
+        workers=args.workers, rng=random.Random(args.seed), password=args.password,
+        drop=args.drop, progress=progress
+    )
+    # Out-of-band writes must invalidate cached API responses
+    bump_versions('users', 'courses', 'certificates', 'grades', 'blockchain_transactions')
+
+    print("=" * 60)
+    print(f"SEEDED DATASET {summary['tag']} in {time.monotonic() - started:.1f}s")
+    print("=" * 60)
+    for name, count in summary['counts'].items():
+        print(f"{name:<26}{count:>12}")
+    print(f"Password for all seeded users: {args.password}")
+    print("=" * 60)
+
+    if args.hot_output:
+        with open(args.hot_output, 'w') as f:
+            json.dump([{'certificate_id': c, 'hash': h} for c, h in summary['hot_certificates']], f, indent=2)
+        print(f"[OK] Hot certificates written to {args.hot_output}")
+    print("Run 'python ledger_store.py' to extend the local ledger file.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
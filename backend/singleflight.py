@@ -0,0 +1,102 @@
+"""
+Single-Flight Request Coalescing
+Concurrent identical lookups within a worker share one in-flight database fetch
+"""
+
+import asyncio
+import threading
+from tenancy import PerTenant
+
+class _Call:
+    """An in-flight call that other threads can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls by key.
+    The first caller runs the function; callers arriving while it is still
+    running wait for it and receive the same result (or exception).
+    Results are shared between threads and must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once for all concurrent callers with the same key"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.executed += 1
+            else:
+                leader = False
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """Number of executed and coalesced calls"""
+        return {
+            'executed': self.executed,
+            'shared': self.shared,
+            'in_flight': len(self._calls)
+        }
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines running on one event loop.
+    Waiters share the leader's task; results must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) once for all concurrent callers with the same key"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn(*args, **kwargs))
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            self.executed += 1
+        else:
+            self.shared += 1
+        # A cancelled waiter must not cancel the shared lookup
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """Number of executed and coalesced calls"""
+        return {
+            'executed': self.executed,
+            'shared': self.shared,
+            'in_flight': len(self._tasks)
+        }
+
+# Shared coalescing group for verification and certificate detail lookups; tenants
+# have separate groups since their certificate IDs may coincide
+lookups = PerTenant(SingleFlight)
@@ -0,0 +1,202 @@
+"""
+Storage Format - compact BSON for certificate hashes and ID references
+Hashes (certificates.blockchain_hash, ledger transaction hash) are stored as
+32-byte binary instead of 64-character hex, and the student_id, course_id and
+instructor_id references as ObjectId instead of 24-character strings. The API
+keeps speaking hex: serialize_doc converts both back at the boundary.
+
+Documents written before this format still hold strings, so queries match both
+forms until `migrate` has converted every collection; then set
+LEGACY_STORAGE_READS=0 to drop the string alternative from queries.
+
+Examples:
+    python storage_format.py status
+    python storage_format.py migrate --batch-size 1000 --pause 0.1
+"""
+
+import argparse
+import os
+import sys
+import time
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+
+# Whether queries also match the string forms written before the compact format
+LEGACY_STORAGE_READS = os.environ.get('LEGACY_STORAGE_READS', '1') != '0'
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Fields stored compactly, per collection (ledger partitions are added at migration time)
+HASH_FIELDS = {'certificates': ('blockchain_hash',)}
+REFERENCE_FIELDS = {
+    'certificates': ('student_id', 'course_id'),
+    'grades': ('student_id', 'course_id'),
+    'courses': ('instructor_id',)
+}
+LEDGER_HASH_FIELDS = ('hash',)
+
+# ==================== Conversion ====================
+
+def pack_hash(value):
+    """32-byte binary for a hex hash; other values (None, malformed input) are returned unchanged"""
+    if isinstance(value, str) and len(value) == 64:
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            return value
+    return value
+
+def unpack_hash(value):
+    """Hex string of a stored hash in either form"""
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+def pack_ref(value):
+    """ObjectId for a reference given as a string; invalid IDs are returned unchanged"""
+    if isinstance(value, str):
+        try:
+            return ObjectId(value)
+        except InvalidId:
+            return value
+    return value
+
+def unpack_ref(value):
+    """String form of a stored reference"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+# ==================== Queries ====================
+
+def _either(packed, legacy):
+    if LEGACY_STORAGE_READS and packed != legacy:
+        return {'$in': [packed, legacy]}
+    return packed
+
+def hash_query(value):
+    """Query value matching a hex hash stored in either form"""
+    return _either(pack_hash(value), unpack_hash(value))
+
+def ref_query(value):
+    """Query value matching a reference (string or ObjectId) stored in either form"""
+    return _either(pack_ref(value), unpack_ref(value))
+
+def refs_query(values):
+    """$in query matching any of several references, stored in either form"""
+    values = list(values)
+    packed = [pack_ref(value) for value in values]
+    if LEGACY_STORAGE_READS:
+        return {'$in': packed + [unpack_ref(value) for value in values]}
+    return {'$in': packed}
+
+# ==================== Migration ====================
+
+def _targets(db):
+    """(collection name, hash fields, reference fields) of everything to convert"""
+    from ledger_partitions import catalog
+    from models import COLLECTIONS
+
+    for name in ('certificates', 'grades', 'courses'):
+        yield COLLECTIONS[name], HASH_FIELDS.get(name, ()), REFERENCE_FIELDS.get(name, ())
+    # Archived years live in their ledger files, which store binary hashes already
+    for name in catalog.hot_collections(db):
+        yield name, LEDGER_HASH_FIELDS, ()
+
+def _legacy_query(fields):
+    return {'$or': [{field: {'$type': 'string'}} for field in fields]}
+
+def migrate_collection(collection, hash_fields, ref_fields, batch_size=DEFAULT_BATCH_SIZE, pause=0,
+                       progress=None):
+    """
+    Convert one collection in _id order, one bulk_write per batch. Each update
+    is conditional on the old values, so concurrent writes are never overwritten.
+    Returns {'scanned': n, 'converted': n}.
+    """
+    fields = tuple(hash_fields) + tuple(ref_fields)
+    query = _legacy_query(fields)
+    projection = {field: 1 for field in fields}
+    counts = {'scanned': 0, 'converted': 0}
+    last_id = None
+    while True:
+        batch_query = {'$and': [query, {'_id': {'$gt': last_id}}]} if last_id else query
+        batch = list(collection.find(batch_query, projection).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+
+        operations = []
+        for doc in batch:
+            update = {}
+            for field in fields:
+                value = doc.get(field)
+                packed = pack_hash(value) if field in hash_fields else pack_ref(value)
+                # Values that are not a hash or ObjectId (e.g. malformed input) stay as they are
+                if packed is not value:
+                    update[field] = packed
+            if update:
+                operations.append(UpdateOne(
+                    {'_id': doc['_id'], **{field: doc[field] for field in update}},
+                    {'$set': update}
+                ))
+
+        if operations:
+            counts['converted'] += collection.bulk_write(operations, ordered=False).modified_count
+        counts['scanned'] += len(batch)
+        if progress:
+            progress(collection.name, counts)
+        if pause:
+            time.sleep(pause)
+    return counts
+
+def migrate(db, batch_size=DEFAULT_BATCH_SIZE, pause=0, progress=None):
+    """Convert every collection; returns {collection name: counts}"""
+    return {
+        name: migrate_collection(db[name], hash_fields, ref_fields, batch_size, pause, progress)
+        for name, hash_fields, ref_fields in _targets(db)
+    }
+
+def remaining(db):
+    """{collection name: documents still holding a string hash or reference}"""
+    return {
+        name: db[name].count_documents(_legacy_query(tuple(hash_fields) + tuple(ref_fields)))
+        for name, hash_fields, ref_fields in _targets(db)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert hashes and ID references to compact BSON')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='Count documents not converted yet')
+    migrate_parser = commands.add_parser('migrate', help='Convert documents in batches')
+    migrate_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    migrate_parser.add_argument('--pause', type=float, default=0,
+                                help='Seconds to sleep between batches, to limit load on a live cluster')
+    args = parser.parse_args(argv)
+
+    from database import init_db, get_db
+
+    if not init_db():
+        print("[ERROR] Failed to connect to database")
+        return 1
+    db = get_db()
+
+    if args.command == 'migrate':
+        def progress(name, counts):
+            print(f"     {name}: {counts['scanned']} scanned, {counts['converted']} converted", end='\r')
+
+        for name, counts in migrate(db, args.batch_size, args.pause, progress).items():
+            print(f"[OK] {name}: {counts['scanned']} scanned, {counts['converted']} converted".ljust(60))
+
+    left = remaining(db)
+    for name, count in left.items():
+        print(f"     {name}: {count} documents with a string hash or reference")
+    if any(left.values()):
+        print("[INFO] Keep LEGACY_STORAGE_READS on while convertible documents remain "
+              "(malformed values are left as strings)")
+    else:
+        print("[OK] All documents use the compact format; LEGACY_STORAGE_READS=0 can be set")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Tenancy - several institutions on one deployment
+The X-Tenant-ID header selects a request's tenant. database.get_db() then returns
+that tenant's own database on its own connection pool, and every cache wrapped in
+PerTenant keeps a separate instance per tenant, so neither data nor cache space
+nor connections are shared between institutions.
+"""
+
+from contextlib import contextmanager
+import os
+import re
+import threading
+from flask import request, jsonify, g
+from database import TENANTS, current_tenant
+
+TENANT_HEADER = 'X-Tenant-ID'
+
+# Tenant for requests without the header; empty serves them from MONGODB_DB_NAME
+DEFAULT_TENANT = os.environ.get('DEFAULT_TENANT', '').strip().lower() or None
+
+# Requests one tenant may have in flight per worker, so a bulk job of one
+# institution cannot take every slot of the admission cap
+TENANT_MAX_CONCURRENT_REQUESTS = int(os.environ.get('TENANT_MAX_CONCURRENT_REQUESTS', '50'))
+
+TENANT_ID_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,47}$')
+
+for _tenant in TENANTS:
+    if not TENANT_ID_PATTERN.match(_tenant):
+        raise ValueError(f'Invalid tenant ID in TENANTS: {_tenant!r} (lowercase letters, digits, - and _)')
+if DEFAULT_TENANT is not None and DEFAULT_TENANT not in TENANTS:
+    raise ValueError(f'DEFAULT_TENANT {DEFAULT_TENANT!r} is not listed in TENANTS')
+
+def tenancy_enabled():
+    return bool(TENANTS)
+
+def served_tenants():
+    """Tenants this deployment serves; None stands for the MONGODB_DB_NAME database"""
+    if not TENANTS:
+        return [None]
+    return ([None] if DEFAULT_TENANT is None else []) + list(TENANTS)
+
+def resolve_tenant(header_value):
+    """(tenant, error message) for a request's X-Tenant-ID header"""
+    if not TENANTS:
+        return None, None
+    if not header_value or not header_value.strip():
+        return DEFAULT_TENANT, None
+    tenant = header_value.strip().lower()
+    if tenant not in TENANTS:
+        return None, 'Unknown tenant'
+    return tenant, None
+
+@contextmanager
+def use_tenant(tenant):
+    """Run a block (e.g. a startup job) against one tenant"""
+    token = current_tenant.set(tenant)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
+
+def for_each_tenant(fn):
+    """Call fn() once per served tenant; returns {tenant: result}"""
+    results = {}
+    for tenant in served_tenants():
+        with use_tenant(tenant):
+            results[tenant] = fn()
+    return results
+
+def tenant_path(path):
+    """A file path for the current tenant: <dir>/tenants/<tenant>/<name> (path itself without a tenant)"""
+    tenant = current_tenant.get()
+    if tenant is None:
+        return path
+    return os.path.join(os.path.dirname(path), 'tenants', tenant, os.path.basename(path))
+
+class PerTenant:
+    """
+    Proxy to one instance per tenant of a cache or other per-process state,
+    created on first use by factory(). Attribute access goes to the current
+    tenant's instance; stats() sums the numeric stats of all instances.
+    """
+
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_instances', {})
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def instance(self):
+        """The current tenant's instance"""
+        tenant = current_tenant.get()
+        instance = self._instances.get(tenant)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(tenant)
+                if instance is None:
+                    instance = self._factory()
+                    self._instances[tenant] = instance
+        return instance
+
+    def instances(self):
+        """{tenant: instance} for the tenants used so far"""
+        return dict(self._instances)
+
+    def __getattr__(self, name):
+        return getattr(self.instance(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.instance(), name, value)
+
+    def stats(self):
+        instances = list(self._instances.values()) or [self.instance()]
+        if len(instances) == 1:
+            return instances[0].stats()
+        totals = {}
+        for instance in instances:
+            for stat, value in instance.stats().items():
+                if isinstance(value, bool):
+                    totals[stat] = totals.get(stat, True) and value
+                elif isinstance(value, (int, float)):
+                    totals[stat] = totals.get(stat, 0) + value
+                else:
+                    totals.setdefault(stat, value)
+        return totals
+
+# ==================== Flask Hooks ====================
+
+def enter_tenant():
+    """before_request hook: bind the request to its tenant; 404 for unknown tenants"""
+    tenant, error = resolve_tenant(request.headers.get(TENANT_HEADER))
+    if error:
+        return jsonify({'error': error}), 404
+    g.tenant_token = current_tenant.set(tenant)
+    return None
+
+def exit_tenant(error=None):
+    """teardown_request hook"""
+    token = g.pop('tenant_token', None)
+    if token is not None:
+        current_tenant.reset(token)
+
+def vary_on_tenant(response):
+    """after_request hook: cached responses differ per tenant"""
+    if TENANTS:
+        response.vary.add(TENANT_HEADER)
+    return response
@@ -0,0 +1,98 @@
+"""
+Tests for circuit_breaker.py against an unreachable MongoDB: the API starts
+with the database down, the circuit opens after CIRCUIT_FAILURE_THRESHOLD
+failed requests, and verification keeps answering from the local ledger file.
+
+Needs no MongoDB server; MONGODB_URI points at a closed local port.
+
+Run with:
+    python -m unittest test_circuit_breaker    (or: python -m pytest test_circuit_breaker.py)
+"""
+
+from datetime import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+_instance = tempfile.mkdtemp(prefix='chainlearn-test-')
+os.environ.update({
+    'MONGODB_URI': 'mongodb://127.0.0.1:9/',
+    'MONGODB_TLS': '0',
+    'MONGODB_SERVER_SELECTION_TIMEOUT_MS': '200',
+    'MONGODB_CONNECT_TIMEOUT_MS': '200',
+    'CIRCUIT_FAILURE_THRESHOLD': '2',
+    'CIRCUIT_RESET_TIMEOUT': '600',
+    'RATE_LIMIT_ENABLED': '0',
+    'LEDGER_FILE_PATH': os.path.join(_instance, 'ledger.dat'),
+})
+os.environ.pop('CHAINLEARN_TENANT', None)
+os.environ.pop('TENANTS', None)
+
+from pymongo.errors import ConnectionFailure
+import database
+from app import app
+from circuit_breaker import breaker, CIRCUIT_FAILURE_THRESHOLD, DEGRADED_HEADER
+from ledger_store import write_ledger_file
+
+CERTIFICATE_ID = 'CERT-2026-000001'
+CERTIFICATE_HASH = hashlib.sha256(b'certificate').hexdigest()
+UNKNOWN_HASH = hashlib.sha256(b'unknown').hexdigest()
+
+def setUpModule():
+    write_ledger_file(os.environ['LEDGER_FILE_PATH'], [{
+        'block_number': 1,
+        'certificate_id': CERTIFICATE_ID,
+        'hash': CERTIFICATE_HASH,
+        'timestamp': datetime(2026, 1, 1)
+    }], certificate_index=True)
+
+def tearDownModule():
+    shutil.rmtree(_instance, ignore_errors=True)
+
+class DatabaseDownTest(unittest.TestCase):
+
+    def setUp(self):
+        # Every test starts with a closed circuit and no connection
+        breaker.record_success()
+        self.client = app.test_client()
+
+    def verify(self, **payload):
+        return self.client.post('/api/certificates/verify', json=payload)
+
+    def test_get_db_raises_connection_failure(self):
+        with self.assertRaises(ConnectionFailure):
+            database.get_db()
+
+    def test_failed_requests_open_the_circuit(self):
+        for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+            self.assertFalse(breaker.is_open())
+            self.verify(certificate_id=CERTIFICATE_ID, hash=CERTIFICATE_HASH)
+        self.assertTrue(breaker.is_open())
+
+    def test_verify_degrades_to_the_ledger_file(self):
+        for _ in range(CIRCUIT_FAILURE_THRESHOLD + 1):
+            response = self.verify(certificate_id=CERTIFICATE_ID, hash=CERTIFICATE_HASH)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers[DEGRADED_HEADER], 'ledger-file')
+            self.assertTrue(response.json['isValid'])
+            self.assertEqual(response.json['blockNumber'], 1)
+
+        response = self.verify(hash=CERTIFICATE_HASH)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers[DEGRADED_HEADER], 'ledger-file')
+
+    def test_unconfirmed_verification_is_unavailable(self):
+        # A miss in the ledger file is not proof the certificate does not exist
+        response = self.verify(hash=UNKNOWN_HASH)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+
+    def test_other_routes_answer_503(self):
+        response = self.client.post('/api/auth/login', json={'email': 'a@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('error', response.json)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+"""
+Tests for offline_verifier.py: the pure-Python Ed25519 check against the
+RFC 8032 test vectors, the Merkle tree hash against the RFC 6962 reference
+roots, and bundles that were tampered with.
+
+Run with:
+    python -m unittest test_offline_verifier    (or: python -m pytest test_offline_verifier.py)
+"""
+
+import base64
+import hashlib
+import unittest
+import offline_verifier
+from offline_verifier import (
+    Bundle, BundleError, ENTRY, MerkleBuilder, canonical_manifest, certificate_digest, key_id, merkle_root,
+    _ed25519_verify_python, _Q
+)
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+except ImportError:
+    Ed25519PrivateKey = None
+
+# ==================== Ed25519 (RFC 8032) ====================
+
+# RFC 8032 section 7.1, TEST 1-3 and TEST SHA(abc): (public key, message, signature)
+RFC8032_VECTORS = [
+    (
+        'd75a980182b10ab7d54bfed3c964073a0ee172f3daa62325af021a68f707511a',
+        '',
+        'e5564300c360ac729086e2cc806e828a84877f1eb8e5d974d873e065224901555fb8821590a33bacc61e39701cf9b46bd25bf5f0595bbe24655141438e7a100b'
+    ),
+    (
+        '3d4017c3e843895a92b70aa74d1b7ebc9c982ccf2ec4968cc0cd55f12af4660c',
+        '72',
+        '92a009a9f0d4cab8720e820b5f642540a2b27b5416503f8fb3762223ebdb69da085ac1e43e15996e458f3613d0f11d8c387b2eaeb4302aeeb00d291612bb0c00'
+    ),
+    (
+        'fc51cd8e6218a1a38da47ed00230f0580816ed13ba3303ac5deb911548908025',
+        'af82',
+        '6291d657deec24024827e69c3abe01a30ce548a284743a445e3680d7db5ac3ac18ff9b538d16f290ae67f760984dc6594a7c15e9716ed28dc027beceea1ec40a'
+    ),
+    (
+        'ec172b93ad5e563bf4932c70e1245034c35467ef2efd4d64ebf819683467e2bf',
+        'ddaf35a193617abacc417349ae20413112e6fa4e89a97ea20a9eeee64b55d39a'
+        '2192992a274fc1a836ba3c23a3feebbd454d4423643ce80e2a9ac94fa54ca49f',
+        'dc2a4459e7369633a52b1bf277839a00201009a3efbf3ecb69bea2186c26b58909351fc9ac90b3ecfdfbc7c66431e0303dca179c138ac17ad9bef1177331a704'
+    ),
+]
+
+class Ed25519Test(unittest.TestCase):
+
+    def test_rfc8032_vectors(self):
+        for public_key, message, signature in RFC8032_VECTORS:
+            with self.subTest(public_key=public_key[:16]):
+                self.assertTrue(_ed25519_verify_python(
+                    bytes.fromhex(public_key), bytes.fromhex(message), bytes.fromhex(signature)
+                ))
+
+    def test_rejects_changed_message(self):
+        public_key, message, signature = (bytes.fromhex(value) for value in RFC8032_VECTORS[2])
+        self.assertFalse(_ed25519_verify_python(public_key, message + b'\x00', signature))
+        self.assertFalse(_ed25519_verify_python(public_key, b'\xaf\x83', signature))
+
+    def test_rejects_changed_signature(self):
+        public_key, message, signature = (bytes.fromhex(value) for value in RFC8032_VECTORS[1])
+        for index in (0, 31, 32, 63):
+            with self.subTest(byte=index):
+                forged = bytearray(signature)
+                forged[index] ^= 0x01
+                self.assertFalse(_ed25519_verify_python(public_key, message, bytes(forged)))
+
+    def test_rejects_wrong_key(self):
+        _, message, signature = (bytes.fromhex(value) for value in RFC8032_VECTORS[1])
+        other_key = bytes.fromhex(RFC8032_VECTORS[2][0])
+        self.assertFalse(_ed25519_verify_python(other_key, message, signature))
+
+    def test_rejects_non_canonical_s(self):
+        # S + L verifies under the group law but is rejected as malleable (RFC 8032 5.1.7)
+        public_key, message, signature = (bytes.fromhex(value) for value in RFC8032_VECTORS[0])
+        s = int.from_bytes(signature[32:], 'little') + _Q
+        self.assertFalse(_ed25519_verify_python(public_key, message, signature[:32] + s.to_bytes(32, 'little')))
+
+    def test_rejects_malformed_lengths(self):
+        public_key, message, signature = (bytes.fromhex(value) for value in RFC8032_VECTORS[0])
+        self.assertFalse(_ed25519_verify_python(public_key[:31], message, signature))
+        self.assertFalse(_ed25519_verify_python(public_key, message, signature[:63]))
+
+    def test_library_and_fallback_agree(self):
+        for public_key, message, signature in RFC8032_VECTORS:
+            self.assertTrue(offline_verifier.ed25519_verify(
+                bytes.fromhex(public_key), bytes.fromhex(message), bytes.fromhex(signature)
+            ))
+
+# ==================== Merkle Tree (RFC 6962) ====================
+
+# Leaves and roots of the RFC 6962 reference test vectors (certificate-transparency merkle_tree_test)
+RFC6962_LEAVES = ['', '00', '10', '2021', '3031', '40414243', '5051525354555657', '606162636465666768696a6b6c6d6e6f']
+RFC6962_ROOTS = [
+    'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855',
+    '6e340b9cffb37a989ca544e6bb780a2c78901d3fb33738768511a30617afa01d',
+    'fac54203e7cc696cf0dfcb42c92a1d9dbaf70ad9e621f4bd8d98662f00e3c125',
+    'aeb6bcfe274b70a14fb067a5e5578264db0fa9b51af5e0ba159158f329e06e77',
+    'd37ee418976dd95753c1c73862b9398fa2a2cf9b4ff0fdfe8b30cd95209614b7',
+    '4e3bbb1f7b478dcfe71fb631631519a3bca12c9aefca1612bfce4c13a86264d4',
+    '76e67dadbcdf1e10e1b74ddc608abd2f98dfb16fbce75277b5232a127f2087ef',
+    'ddb89be403809e325750d3d263cd78929c2942b7942a34b77e122c9594a74c8c',
+    '5dc9da79a70659a9ad559cb701ded9a2ab9d823aad2f4960cfe370eff4604328',
+]
+
+def _reference_root(leaves):
+    """RFC 6962 section 2.1 MTH, computed recursively"""
+    if not leaves:
+        return hashlib.sha256(b'').digest()
+    if len(leaves) == 1:
+        return hashlib.sha256(b'\x00' + leaves[0]).digest()
+    split = 1
+    while split * 2 < len(leaves):
+        split *= 2
+    return hashlib.sha256(b'\x01' + _reference_root(leaves[:split]) + _reference_root(leaves[split:])).digest()
+
+class MerkleTest(unittest.TestCase):
+
+    def test_rfc6962_roots(self):
+        leaves = [bytes.fromhex(leaf) for leaf in RFC6962_LEAVES]
+        for size, expected in enumerate(RFC6962_ROOTS):
+            with self.subTest(size=size):
+                self.assertEqual(merkle_root(leaves[:size]), expected)
+
+    def test_streaming_matches_recursive_definition(self):
+        leaves = [ENTRY.pack(i, certificate_digest(i), bytes(32), 0) for i in range(70)]
+        builder = MerkleBuilder()
+        for size, leaf in enumerate(leaves, 1):
+            builder.add(leaf)
+            self.assertEqual(builder.root(), _reference_root(leaves[:size]).hex())
+
+    def test_leaf_and_node_hashes_are_domain_separated(self):
+        # A leaf holding the concatenation of two child hashes must not yield their parent
+        left, right = b'\x00' * 32, b'\x11' * 32
+        self.assertNotEqual(merkle_root([left + right]), merkle_root([left, right]))
+
+# ==================== Bundles ====================
+
+def _entry(certificate_id, block_number, hash_hex, micros=1_700_000_000_000_000):
+    return ENTRY.pack(block_number, certificate_digest(certificate_id), bytes.fromhex(hash_hex), micros)
+
+def _entries(*entries):
+    return b''.join(sorted(entries, key=lambda entry: entry[8:40]))
+
+def _hash(n):
+    return hashlib.sha256(str(n).encode('ascii')).hexdigest()
+
+@unittest.skipIf(Ed25519PrivateKey is None, 'signing test bundles needs the cryptography package')
+class BundleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.private_key = Ed25519PrivateKey.generate()
+        self.public_key = self.private_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+        self.base_entries = _entries(_entry('CERT-2026-0001-A', 1, _hash(1)), _entry('CERT-2026-0002-B', 2, _hash(2)))
+        self.base_manifest = self._snapshot(1, self.base_entries, last_block=2)
+
+    def _sign(self, manifest, private_key=None):
+        private_key = private_key or self.private_key
+        public_key = private_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+        manifest['key_id'] = key_id(public_key)
+        manifest['signature'] = base64.b64encode(private_key.sign(canonical_manifest(manifest))).decode('ascii')
+        return manifest
+
+    def _snapshot(self, sequence, entries, last_block, **fields):
+        return self._sign({
+            'format': offline_verifier.BUNDLE_FORMAT, 'kind': 'snapshot', 'sequence': sequence,
+            'last_block': last_block, 'count': len(entries) // ENTRY.size,
+            'entries_sha256': hashlib.sha256(entries).hexdigest(),
+            'merkle_root': merkle_root(offline_verifier.iter_entries(entries)), **fields
+        })
+
+    def _delta(self, base_manifest, base_entries, added, sequence, last_block):
+        merged = b''.join(offline_verifier.merge_entries(
+            offline_verifier.iter_entries(base_entries), offline_verifier.iter_entries(added)
+        ))
+        return self._sign({
+            'format': offline_verifier.BUNDLE_FORMAT, 'kind': 'delta', 'sequence': sequence,
+            'base_sequence': base_manifest['sequence'], 'base_root': base_manifest['merkle_root'],
+            'last_block': last_block, 'count': len(added) // ENTRY.size,
+            'entries_sha256': hashlib.sha256(added).hexdigest(),
+            'merkle_root': merkle_root(offline_verifier.iter_entries(merged))
+        }), merged
+
+    def test_valid_bundle_verifies(self):
+        bundle = Bundle.load(self.base_manifest, self.base_entries, self.public_key)
+        self.assertTrue(bundle.verify('CERT-2026-0001-A', expected_hash=_hash(1))['isValid'])
+        self.assertFalse(bundle.verify('CERT-2026-0001-A', expected_hash=_hash(2))['isValid'])
+        self.assertIsNone(bundle.lookup('CERT-2026-0003-C'))
+
+    def test_changed_entry_is_rejected(self):
+        forged = _entries(_entry('CERT-2026-0001-A', 1, _hash(99)), _entry('CERT-2026-0002-B', 2, _hash(2)))
+        with self.assertRaisesRegex(BundleError, 'checksum'):
+            Bundle.load(self.base_manifest, forged, self.public_key)
+
+    def test_changed_entry_with_matching_checksum_is_rejected(self):
+        # Updating the manifest to match the forged entries breaks its signature
+        forged = _entries(_entry('CERT-2026-0001-A', 1, _hash(99)), _entry('CERT-2026-0002-B', 2, _hash(2)))
+        manifest = dict(self.base_manifest, entries_sha256=hashlib.sha256(forged).hexdigest(),
+                        merkle_root=merkle_root(offline_verifier.iter_entries(forged)))
+        with self.assertRaisesRegex(BundleError, 'signature is invalid'):
+            Bundle.load(manifest, forged, self.public_key)
+
+    def test_entries_not_matching_the_signed_root_are_rejected(self):
+        # Signed by the right key, but over a root the entries do not produce
+        manifest = self._snapshot(1, self.base_entries, last_block=2)
+        manifest = self._sign(dict(manifest, merkle_root='00' * 32))
+        with self.assertRaisesRegex(BundleError, 'Merkle root'):
+            Bundle.load(manifest, self.base_entries, self.public_key)
+
+    def test_wrong_key_is_rejected(self):
+        other_key = Ed25519PrivateKey.generate()
+        other_public = other_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+        with self.assertRaisesRegex(BundleError, 'different key'):
+            Bundle.load(self.base_manifest, self.base_entries, other_public)
+        # A manifest signed by another key but claiming the pinned key's id
+        manifest = self._sign(dict(self.base_manifest), other_key)
+        manifest['key_id'] = key_id(self.public_key)
+        with self.assertRaisesRegex(BundleError, 'signature is invalid'):
+            Bundle.load(manifest, self.base_entries, self.public_key)
+
+    def test_delta_applies_to_its_base(self):
+        base = Bundle.load(self.base_manifest, self.base_entries, self.public_key)
+        added = _entries(_entry('CERT-2026-0003-C', 3, _hash(3)))
+        delta, _ = self._delta(self.base_manifest, self.base_entries, added, 2, last_block=3)
+        updated = base.apply_delta(delta, added)
+        self.assertEqual(updated.sequence, 2)
+        self.assertTrue(updated.verify('CERT-2026-0003-C', expected_hash=_hash(3))['isValid'])
+        self.assertTrue(updated.verify('CERT-2026-0001-A', expected_hash=_hash(1))['isValid'])
+
+    def test_delta_on_wrong_base_is_rejected(self):
+        base = Bundle.load(self.base_manifest, self.base_entries, self.public_key)
+        added = _entries(_entry('CERT-2026-0003-C', 3, _hash(3)))
+        delta, merged = self._delta(self.base_manifest, self.base_entries, added, 2, last_block=3)
+        next_added = _entries(_entry('CERT-2026-0004-D', 4, _hash(4)))
+        next_delta, _ = self._delta(delta, merged, next_added, 3, last_block=4)
+        # Skipping sequence 2
+        with self.assertRaisesRegex(BundleError, 'does not apply'):
+            base.apply_delta(next_delta, next_added)
+        # Right sequence number, but built on a different snapshot
+        other_entries = _entries(_entry('CERT-2026-0001-A', 1, _hash(1)))
+        other_base = Bundle.load(self._snapshot(1, other_entries, last_block=1), other_entries, self.public_key)
+        with self.assertRaisesRegex(BundleError, 'does not apply'):
+            other_base.apply_delta(delta, added)
+
+    def test_delta_with_changed_entries_is_rejected(self):
+        base = Bundle.load(self.base_manifest, self.base_entries, self.public_key)
+        added = _entries(_entry('CERT-2026-0003-C', 3, _hash(3)))
+        delta, _ = self._delta(self.base_manifest, self.base_entries, added, 2, last_block=3)
+        forged = _entries(_entry('CERT-2026-0003-C', 3, _hash(99)))
+        with self.assertRaisesRegex(BundleError, 'checksum'):
+            base.apply_delta(delta, forged)
+        # A delta whose entries match its checksum but not the signed root of the new sequence
+        delta = self._sign(dict(delta, entries_sha256=hashlib.sha256(forged).hexdigest()))
+        with self.assertRaisesRegex(BundleError, 'reproduce'):
+            base.apply_delta(delta, forged)
+
+if __name__ == '__main__':
+    unittest.main()
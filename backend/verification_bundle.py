@@ -0,0 +1,292 @@
+"""
+Verification Bundles - signed ledger snapshots for offline verification
+Each build publishes the next sequence: a full snapshot of the ledger (one
+entry per certificate, sorted for binary search) and, from the second build
+on, a delta holding only the certificates anchored since the previous one.
+Both carry an Ed25519-signed manifest with the snapshot's Merkle root; the
+format and the verifying side are in offline_verifier.py.
+
+Signing needs the `cryptography` package and a key from `keygen`; serving
+bundles (GET /api/bundles) needs neither.
+
+Examples:
+    python verification_bundle.py keygen      # create the signing key (once)
+    python verification_bundle.py build       # publish the next bundle (e.g. hourly from cron)
+    python verification_bundle.py build --rebuild
+    python verification_bundle.py status
+"""
+
+import argparse
+import base64
+from datetime import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+from ledger_store import pack_record
+from offline_verifier import (BUNDLE_FORMAT, ENTRY, DIGEST_OFFSET, MerkleBuilder, canonical_manifest,
+                              key_id, merge_entries)
+from tenancy import tenant_path
+
+# Directory bundles are published to (tenants' in tenants/<tenant>/)
+BUNDLE_DIR = os.environ.get(
+    'BUNDLE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'bundles')
+)
+
+# Ed25519 private key (PEM) used by `build`; only the host building bundles needs it
+BUNDLE_SIGNING_KEY = os.environ.get(
+    'BUNDLE_SIGNING_KEY',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'bundle_signing_key.pem')
+)
+
+# Sequences kept on disk; verifiers further behind download a full snapshot
+BUNDLE_KEEP = int(os.environ.get('BUNDLE_KEEP', '48'))
+
+PUBLIC_KEY_FILE = 'public_key.hex'
+
+_FILE_NAME = re.compile(r'^(snapshot|delta)-(\d+)\.json$')
+
+def bundle_dir():
+    return os.path.dirname(tenant_path(os.path.join(BUNDLE_DIR, PUBLIC_KEY_FILE)))
+
+def bundle_path(kind, sequence, suffix='.json'):
+    """Path of a snapshot or delta manifest ('.json') or entry file ('.bin')"""
+    return os.path.join(bundle_dir(), f'{kind}-{sequence}{suffix}')
+
+# ==================== Keys ====================
+
+def generate_signing_key(path=BUNDLE_SIGNING_KEY):
+    """Create a new Ed25519 signing key; returns the raw public key"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+    if os.path.exists(path):
+        raise FileExistsError(f'{path} already exists')
+    private_key = Ed25519PrivateKey.generate()
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descriptor, 'wb') as f:
+        f.write(pem)
+    return _public_bytes(private_key)
+
+def load_signing_key(path=BUNDLE_SIGNING_KEY):
+    from cryptography.hazmat.primitives import serialization
+
+    with open(path, 'rb') as f:
+        return serialization.load_pem_private_key(f.read(), password=None)
+
+def _public_bytes(private_key):
+    from cryptography.hazmat.primitives import serialization
+
+    return private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+
+def sign_manifest(manifest, private_key):
+    """Add key_id and signature to a manifest"""
+    manifest['key_id'] = key_id(_public_bytes(private_key))
+    manifest['signature'] = base64.b64encode(private_key.sign(canonical_manifest(manifest))).decode('ascii')
+    return manifest
+
+# ==================== Reading ====================
+
+def sequences(kind):
+    """Published sequence numbers of one kind, ascending"""
+    try:
+        names = os.listdir(bundle_dir())
+    except FileNotFoundError:
+        return []
+    found = []
+    for name in names:
+        match = _FILE_NAME.match(name)
+        if match and match.group(1) == kind:
+            found.append(int(match.group(2)))
+    return sorted(found)
+
+def read_manifest(kind, sequence):
+    try:
+        with open(bundle_path(kind, sequence), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def latest_manifest():
+    """Manifest of the newest snapshot, or None before the first build"""
+    published = sequences('snapshot')
+    return read_manifest('snapshot', published[-1]) if published else None
+
+def delta_chain(since):
+    """
+    Delta manifests leading from sequence `since` to the latest snapshot;
+    None if one has been pruned (or the chain was broken by a rebuild)
+    """
+    latest = sequences('snapshot')
+    if not latest or since > latest[-1]:
+        return None
+    chain = []
+    for sequence in range(since + 1, latest[-1] + 1):
+        manifest = read_manifest('delta', sequence)
+        if manifest is None:
+            return None
+        chain.append(manifest)
+    return chain
+
+def public_key_hex():
+    """Hex public key of the key bundles are signed with, as published by the last build"""
+    try:
+        with open(os.path.join(bundle_dir(), PUBLIC_KEY_FILE), encoding='ascii') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def _read_entries(path):
+    with open(path, 'rb') as f:
+        while True:
+            entry = f.read(ENTRY.size)
+            if len(entry) < ENTRY.size:
+                return
+            yield entry
+
+# ==================== Building ====================
+
+def _sorted_entries(transactions):
+    """Bundle entries for transactions in block order: the latest per certificate, sorted by digest"""
+    latest = {}
+    last_block = 0
+    for transaction in transactions:
+        entry = pack_record(transaction)
+        if entry is not None:
+            latest[entry[DIGEST_OFFSET:DIGEST_OFFSET + 32]] = entry
+            last_block = max(last_block, transaction['block_number'])
+    return [latest[digest] for digest in sorted(latest)], last_block
+
+def _write_entries(path, entries):
+    """Write entries to path (atomically); returns (count, sha256 hex, Merkle root)"""
+    count = 0
+    checksum = hashlib.sha256()
+    tree = MerkleBuilder()
+    with open(path + '.tmp', 'wb') as f:
+        for entry in entries:
+            f.write(entry)
+            checksum.update(entry)
+            tree.add(entry)
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+    return count, checksum.hexdigest(), tree.root()
+
+def _write_manifest(kind, manifest):
+    path = bundle_path(kind, manifest['sequence'])
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def build_bundle(db=None, rebuild=False, private_key=None):
+    """
+    Publish the next bundle sequence, covering the ledger up to its settled
+    watermark (see iter_settled_transactions). Returns the new snapshot
+    manifest, or None if nothing was anchored since the last build.
+    """
+    from blockchain_utils import iter_settled_transactions
+
+    private_key = private_key or load_signing_key()
+    os.makedirs(bundle_dir(), exist_ok=True)
+    previous = None if rebuild else latest_manifest()
+    sequence = (sequences('snapshot') or [0])[-1] + 1
+    now = datetime.utcnow().isoformat()
+
+    if previous is None:
+        entries, last_block = _sorted_entries(iter_settled_transactions(db=db, include_archived=True))
+        added = None
+    else:
+        added, last_block = _sorted_entries(iter_settled_transactions(
+            first_block=previous['last_block'] + 1, db=db, include_archived=True
+        ))
+        if not added:
+            return None
+        last_block = max(last_block, previous['last_block'])
+        entries = merge_entries(_read_entries(bundle_path('snapshot', previous['sequence'], '.bin')), added)
+
+    count, checksum, root = _write_entries(bundle_path('snapshot', sequence, '.bin'), entries)
+    snapshot = {
+        'format': BUNDLE_FORMAT, 'kind': 'snapshot', 'sequence': sequence, 'generated_at': now,
+        'last_block': last_block, 'count': count, 'entries_sha256': checksum, 'merkle_root': root
+    }
+
+    if added is not None:
+        delta_count, delta_checksum, _ = _write_entries(bundle_path('delta', sequence, '.bin'), added)
+        delta = {
+            'format': BUNDLE_FORMAT, 'kind': 'delta', 'sequence': sequence, 'generated_at': now,
+            'base_sequence': previous['sequence'], 'base_root': previous['merkle_root'],
+            'last_block': last_block, 'count': delta_count, 'entries_sha256': delta_checksum,
+            'merkle_root': root
+        }
+        _write_manifest('delta', sign_manifest(delta, private_key))
+
+    with open(os.path.join(bundle_dir(), PUBLIC_KEY_FILE), 'w', encoding='ascii') as f:
+        f.write(_public_bytes(private_key).hex())
+    # The snapshot manifest is written last: it is what makes the sequence visible
+    _write_manifest('snapshot', sign_manifest(snapshot, private_key))
+    prune()
+    return snapshot
+
+def prune(keep=BUNDLE_KEEP):
+    """Remove all but the newest `keep` sequences"""
+    for kind in ('snapshot', 'delta'):
+        for sequence in sequences(kind)[:-keep] if keep else []:
+            for suffix in ('.json', '.bin'):
+                try:
+                    os.remove(bundle_path(kind, sequence, suffix))
+                except FileNotFoundError:
+                    pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build signed verification bundles')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('keygen', help='Create the bundle signing key')
+    build_parser = commands.add_parser('build', help='Publish the next bundle')
+    build_parser.add_argument('--rebuild', action='store_true',
+                              help='Build the snapshot from the ledger instead of the previous snapshot')
+    commands.add_parser('status', help='Show the published bundles')
+    args = parser.parse_args(argv)
+
+    if args.command == 'keygen':
+        try:
+            public_key = generate_signing_key()
+        except FileExistsError as e:
+            print(f"[ERROR] {e}")
+            return 1
+        print(f"[OK] Signing key written to {BUNDLE_SIGNING_KEY}")
+        print(f"     Public key (give this to verifiers): {public_key.hex()}")
+        return 0
+
+    if args.command == 'build':
+        from database import init_db, get_db
+
+        if not init_db():
+            print("[ERROR] Failed to connect to database")
+            return 1
+        try:
+            private_key = load_signing_key()
+        except FileNotFoundError:
+            print(f"[ERROR] No signing key at {BUNDLE_SIGNING_KEY}; run `python verification_bundle.py keygen`")
+            return 1
+        manifest = build_bundle(get_db(), rebuild=args.rebuild, private_key=private_key)
+        if manifest is None:
+            print("[OK] No certificates anchored since the last bundle")
+        else:
+            print(f"[OK] Published bundle {manifest['sequence']}: {manifest['count']} certificates "
+                  f"up to block {manifest['last_block']}")
+
+    for sequence in sequences('snapshot'):
+        manifest = read_manifest('snapshot', sequence)
+        delta = read_manifest('delta', sequence)
+        print(f"     {sequence}: {manifest['count']:>10} certificates, last block {manifest['last_block']}, "
+              f"{'delta of ' + str(delta['count']) if delta else 'no delta'} ({manifest['generated_at']})")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())